@@ -0,0 +1,66 @@
+##
+## Copyright (c) 2019 Thomas Kramer.
+## 
+## This file is part of liberty-parser 
+## (see https://codeberg.org/tok/liberty-parser).
+## 
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+## 
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+## 
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Measure the import time of the liberty modules with `python -X importtime`.
+
+Usage: python benchmarks/bench_import.py [module ...] [--top N]
+"""
+import os.path
+import subprocess
+import sys
+
+root = os.path.join(os.path.dirname(__file__), '..')
+default_modules = ['liberty.parser', 'liberty.types', 'liberty.fast_parser']
+
+
+def import_times(module: str):
+    """
+    Import `module` in a fresh interpreter.
+    :return: List of `(module, self time, cumulative time)` in seconds, in import order.
+    """
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                         cwd=root, capture_output=True, text=True, check=True)
+    times = []
+    for line in out.stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        self_us = int(fields[0].split(':')[1])
+        times.append((fields[2].strip(), self_us / 1e6, int(fields[1]) / 1e6))
+    return times
+
+
+def main():
+    args = sys.argv[1:]
+    top = 10
+    if '--top' in args:
+        i = args.index('--top')
+        top = int(args[i + 1])
+        del args[i:i + 2]
+    for module in args or default_modules:
+        times = import_times(module)
+        total = times[-1][2]
+        print("{:24} {:8.3f} s".format(module, total))
+        for name, self_time, _ in sorted(times, key=lambda t: -t[1])[:top]:
+            print("    {:40} {:8.4f} s".format(name.strip(), self_time))
+
+
+if __name__ == '__main__':
+    main()
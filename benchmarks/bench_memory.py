@@ -0,0 +1,109 @@
+##
+## Copyright (c) 2019 Thomas Kramer.
+## 
+## This file is part of liberty-parser 
+## (see https://codeberg.org/tok/liberty-parser).
+## 
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+## 
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+## 
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Measure the memory used by parsed libraries.
+
+Each measurement runs in a fresh process. Reported are the memory held by the `Group`
+tree after parsing (measured with tracemalloc) and the increase of the peak RSS of the
+process while parsing.
+
+Usage: python benchmarks/bench_memory.py [scale factor ...]
+The test library is scaled up by repeating its cells under new names.
+"""
+import os.path
+import re
+import subprocess
+import sys
+import tempfile
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+default_lib_file = os.path.join(root, 'test_data/gscl45nm.lib')
+
+
+def scale_library(data: str, factor: int) -> str:
+    """
+    Repeat the cells of a library `factor` times.
+    """
+    start = data.index('cell (')
+    end = data.rstrip().rindex('}')
+    cells = data[start:end]
+    copies = [re.sub(r'cell \((\w+)\)', r'cell (\1_{})'.format(i), cells) for i in range(factor)]
+    return data[:start] + ''.join(copies) + data[end:]
+
+
+_measure_script = r"""
+import gc, resource, sys, tracemalloc
+sys.path.insert(0, {root!r})
+from liberty.parser import load_liberty
+
+def peak_rss():
+    # ru_maxrss survives exec, hence it can hold the peak of a large parent process.
+    # VmHWM is reset by exec.
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+trace = {trace!r}
+if trace:
+    tracemalloc.start()
+before = peak_rss()
+library = load_liberty({filename!r}, engine={engine!r})
+gc.collect()
+if trace:
+    print(tracemalloc.get_traced_memory()[0])
+else:
+    print(peak_rss() - before)
+"""
+
+
+def measure(filename: str, engine: str):
+    """
+    :return: Tuple of the size of the `Group` tree and the increase of the peak RSS
+        during parsing, in bytes.
+    """
+    result = []
+    for trace in [True, False]:
+        script = _measure_script.format(root=root, filename=filename, engine=engine, trace=trace)
+        result.append(int(subprocess.check_output([sys.executable, '-c', script])))
+    return tuple(result)
+
+
+def main():
+    factors = [int(f) for f in sys.argv[1:]] or [1, 10]
+    data = open(default_lib_file).read()
+    with tempfile.TemporaryDirectory() as d:
+        for factor in factors:
+            filename = os.path.join(d, 'scaled_{}.lib'.format(factor))
+            with open(filename, 'w') as f:
+                f.write(scale_library(data, factor))
+            size_mb = os.path.getsize(filename) / 1e6
+            for engine in ['lark', 'fast']:
+                tree, peak_rss = measure(filename, engine)
+                print("x{:<4} {:8.1f} MB file  {:5}  tree {:8.1f} MB  peak RSS +{:8.1f} MB"
+                      .format(factor, size_mb, engine, tree / 1e6, peak_rss / 1e6))
+
+
+if __name__ == '__main__':
+    main()
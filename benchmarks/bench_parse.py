@@ -0,0 +1,63 @@
+##
+## Copyright (c) 2019 Thomas Kramer.
+## 
+## This file is part of liberty-parser 
+## (see https://codeberg.org/tok/liberty-parser).
+## 
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+## 
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+## 
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Compare the parser engines on a liberty file.
+
+Usage: python benchmarks/bench_parse.py [liberty file] [repetitions]
+"""
+import os.path
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from liberty.parser import load_liberty
+
+default_lib_file = os.path.join(os.path.dirname(__file__), '../test_data/gscl45nm.lib')
+
+
+def bench(filename: str, engine: str, repetitions: int) -> float:
+    """
+    Return the best run time of `repetitions` runs.
+    """
+    best = float('inf')
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        load_liberty(filename, engine=engine)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    filename = sys.argv[1] if len(sys.argv) > 1 else default_lib_file
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    size_mb = os.path.getsize(filename) / 1e6
+
+    # Warm up the parser caches.
+    load_liberty(filename, engine='lark')
+
+    times = {engine: bench(filename, engine, repetitions) for engine in ['lark', 'fast']}
+    for engine, t in times.items():
+        print("{:6} {:8.3f} s {:8.2f} MB/s".format(engine, t, size_mb / t))
+    print("speedup: {:.1f}x".format(times['lark'] / times['fast']))
+
+
+if __name__ == '__main__':
+    main()
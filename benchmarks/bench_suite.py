@@ -0,0 +1,235 @@
+##
+## Copyright (c) 2019 Thomas Kramer.
+## 
+## This file is part of liberty-parser 
+## (see https://codeberg.org/tok/liberty-parser).
+## 
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+## 
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+## 
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Benchmark suite on synthetic libraries with machine-readable baselines.
+
+For every case a library is generated with `synthetic.py` and the following is measured:
+
+* parse throughput per engine (MB/s),
+* size of the parsed tree and peak RSS increase while parsing (MB, fresh process),
+* `str()` and `save_liberty` throughput (MB/s),
+* `get_array` latency on text tables and on tables parsed into arrays (us per call),
+* NLDM lookup latency, through `select_timing_table` + `get_array` + interpolation per
+  point and vectorized with `liberty.nldm.NLDMTables` (us per point).
+
+Usage:
+    python benchmarks/bench_suite.py [--cases small,ccs] [--output results.json]
+    python benchmarks/bench_suite.py --compare benchmarks/baselines/default.json
+
+With `--compare`, results are compared with a stored baseline and the script fails if a
+metric got worse by more than the tolerance. Baselines depend on the machine; regenerate
+them with `--output` when the machine changes.
+"""
+import argparse
+import json
+import os.path
+import platform
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+from synthetic import LibrarySpec, generate_library
+from bench_memory import measure
+from liberty.parser import load_liberty, save_liberty
+from liberty.types import select_cell, select_pin, select_timing_table
+from liberty.nldm import NLDMTables
+
+default_baseline = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'baselines', 'default.json')
+
+# Name -> (library spec, parser engines).
+CASES = {
+    'small': (LibrarySpec(cells=50, inputs=2, table_size=7), ['lark', 'fast']),
+    'medium': (LibrarySpec(cells=500, inputs=3, table_size=7), ['fast']),
+    'large_tables': (LibrarySpec(cells=100, inputs=2, table_size=20), ['fast']),
+    'ccs': (LibrarySpec(cells=50, inputs=2, table_size=7, ccs_vectors=20, ccs_points=60),
+            ['fast']),
+    'nested': (LibrarySpec(cells=200, inputs=4, table_size=5, nesting=4), ['fast']),
+}
+
+# Metrics where smaller values are better. For all others larger values are better.
+LOWER_IS_BETTER = ('_mb', '_us')
+
+
+def best_time(f, repetitions: int) -> float:
+    best = float('inf')
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_case(filename: str, engines, repetitions: int):
+    size_mb = os.path.getsize(filename) / 1e6
+    results = {'file_mb': size_mb}
+
+    for engine in engines:
+        t = best_time(lambda: load_liberty(filename, engine=engine), repetitions)
+        results['parse_{}_mb_s'.format(engine)] = size_mb / t
+        tree, peak_rss = measure(filename, engine)
+        results['tree_{}_mb'.format(engine)] = tree / 1e6
+        results['peak_rss_{}_mb'.format(engine)] = peak_rss / 1e6
+
+    library = load_liberty(filename, engine='fast')
+    t = best_time(lambda: str(library), repetitions)
+    results['str_mb_s'] = size_mb / t
+    with tempfile.TemporaryDirectory() as d:
+        out_file = os.path.join(d, 'out.lib')
+        t = best_time(lambda: save_liberty(library, out_file), repetitions)
+    results['save_mb_s'] = size_mb / t
+
+    # Tables of all arcs.
+    arcs = []
+    for cell in library.get_groups('cell'):
+        for pin in cell.get_groups('pin'):
+            for timing in pin.get_groups('timing'):
+                if timing.get_groups('cell_rise'):
+                    arcs.append((cell.args[0], pin.args[0], timing['related_pin'].value))
+    tables = [select_timing_table(select_pin(select_cell(library, c), p), r, 'cell_rise')
+              for c, p, r in arcs]
+
+    def get_arrays(lib_tables):
+        for table in lib_tables:
+            table.get_array('values')
+
+    t = best_time(lambda: get_arrays(tables), repetitions)
+    results['get_array_text_us'] = t / len(tables) * 1e6
+    array_library = load_liberty(filename, engine='fast', table_dtype=np.float64)
+    array_tables = [select_timing_table(select_pin(select_cell(array_library, c), p), r,
+                                        'cell_rise') for c, p, r in arcs]
+    t = best_time(lambda: get_arrays(array_tables), repetitions)
+    results['get_array_ndarray_us'] = t / len(tables) * 1e6
+
+    # Lookups.
+    rng = np.random.default_rng(1)
+    num_points = 100000
+    slews = rng.uniform(0.01, 1.0, num_points)
+    loads = rng.uniform(0.001, 0.1, num_points)
+    arc_indices = rng.integers(0, len(arcs), num_points)
+
+    def scalar_lookups(n):
+        for i in range(n):
+            c, p, r = arcs[arc_indices[i]]
+            table = select_timing_table(select_pin(select_cell(array_library, c), p), r,
+                                        'cell_rise')
+            index_1 = table.get_array('index_1')[0]
+            index_2 = table.get_array('index_2')[0]
+            values = table.get_array('values')
+            rows = [np.interp(loads[i], index_2, row) for row in values]
+            np.interp(slews[i], index_1, rows)
+
+    num_scalar = 2000
+    t = best_time(lambda: scalar_lookups(num_scalar), 1)
+    results['lookup_scalar_us'] = t / num_scalar * 1e6
+
+    nldm = NLDMTables(array_library)
+    nldm_arcs = np.array([nldm.find(c, p, r) for c, p, r in arcs])[arc_indices]
+    t = best_time(lambda: nldm.lookup('cell_rise', nldm_arcs, slews, loads), repetitions)
+    results['lookup_vectorized_us'] = t / num_points * 1e6
+    return results
+
+
+def machine_info():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def run(case_names, repetitions: int):
+    results = {'machine': machine_info(), 'cases': {}}
+    with tempfile.TemporaryDirectory() as d:
+        for name in case_names:
+            spec, engines = CASES[name]
+            filename = os.path.join(d, name + '.lib')
+            generate_library(filename, spec)
+            case = run_case(filename, engines, repetitions)
+            case['spec'] = spec.to_dict()
+            results['cases'][name] = case
+            print_case(name, case)
+    return results
+
+
+def print_case(name, case):
+    print(name)
+    for metric, value in case.items():
+        if metric != 'spec':
+            print("    {:28} {:12.3f}".format(metric, value))
+
+
+def compare(results, baseline, tolerance: float) -> bool:
+    """
+    Print the change of every metric relative to the baseline.
+    :return: `True` if no metric got worse by more than `tolerance` (relative).
+    """
+    ok = True
+    for name, case in results['cases'].items():
+        base_case = baseline['cases'].get(name)
+        if base_case is None:
+            continue
+        print(name)
+        for metric, value in case.items():
+            base = base_case.get(metric)
+            if metric in ('spec', 'file_mb') or not base:
+                continue
+            change = value / base - 1
+            worse = change > tolerance if metric.endswith(LOWER_IS_BETTER) \
+                else change < -tolerance
+            ok = ok and not worse
+            print("    {:28} {:12.3f} {:12.3f} {:+8.1%}{}".format(
+                metric, base, value, change, '  REGRESSION' if worse else ''))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--cases', default=','.join(CASES),
+                        help="Comma separated case names: {}".format(', '.join(CASES)))
+    parser.add_argument('--repetitions', type=int, default=3)
+    parser.add_argument('--output', help="Write the results as JSON.")
+    parser.add_argument('--compare', nargs='?', const=default_baseline,
+                        help="Compare with a baseline JSON file.")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Allowed relative regression for --compare.")
+    args = parser.parse_args()
+
+    results = run(args.cases.split(','), args.repetitions)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
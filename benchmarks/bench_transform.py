@@ -0,0 +1,201 @@
+##
+## Copyright (c) 2019 Thomas Kramer.
+## 
+## This file is part of liberty-parser 
+## (see https://codeberg.org/tok/liberty-parser).
+## 
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+## 
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+## 
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Benchmark the transform phase of the 'lark' engine: building `Group` objects from the
+parse tree. Compares `LibertyTransformer` with the previous implementation, both on a
+parse tree and embedded into the parser, and checks that both create identical trees.
+The previous implementation uses the previous grammar, in which every name, number and
+string token is reduced by a rule of its own.
+
+Usage: python benchmarks/bench_transform.py [liberty file] [repetitions]
+"""
+import os.path
+import pickle
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from lark import Transformer, v_args
+from liberty.grammar_cache import get_lalr_parser
+from liberty.lark_parser import liberty_grammar, LibertyTransformer
+from liberty.types import EscapedString, WithUnit, Define, Group
+
+default_lib_file = os.path.join(os.path.dirname(__file__), '../test_data/gscl45nm.lib')
+
+
+# Previous grammar, names, numbers and strings had rules of their own.
+reference_grammar = r"""
+    ?start: group
+    
+    group: name argument_list group_body
+    group_body: "{" (statement)* "}"
+    
+    argument_list: "(" [value ("," value)*] ")"
+    
+    ?statement: attribute ";"
+        | group
+        | define ";"
+        
+    ?value: name
+        | number
+        | number unit -> number_with_unit
+        | numbers
+        | string -> escaped_string
+        
+    numbers: "\"" [number ("," number)*] "\""
+        
+    unit: CNAME
+        
+    ?attribute: simple_attribute
+        | complex_attribute
+        
+    simple_attribute: name ":" value
+    
+    complex_attribute: name argument_list
+    
+    define: "define" "(" name "," name "," name ")"
+    
+    name : CNAME
+    string: ESCAPED_STRING
+    
+    number: SIGNED_NUMBER
+    
+    COMMENT: /\/\*(\*(?!\/)|[^*])*\*\//
+    NEWLINE: /\\?\r?\n/
+    
+    %import common.WORD
+    %import common.ESCAPED_STRING
+    %import common.CNAME
+    %import common.SIGNED_NUMBER
+    %import common.WS
+    
+    %ignore WS
+    %ignore COMMENT
+    %ignore NEWLINE
+"""
+
+
+@v_args(inline=True)
+class ReferenceTransformer(Transformer):
+    """
+    Previous implementation of `LibertyTransformer`, for comparison.
+    """
+
+    def escaped_string(self, s):
+        return EscapedString(s[1:-1].replace('\\"', '"'))
+
+    def string(self, s):
+        return s[:]
+
+    def name(self, s):
+        return sys.intern(s[:])
+
+    def number(self, s):
+        if '.0' == s[-2:]:
+            return int(s[:-2])
+        elif not '.' in s:
+            return int(s)
+        return float(s)
+
+    unit = string
+    value = string
+
+    def group_body(self, *args):
+        return list(args)
+
+    def number_with_unit(self, num, unit):
+        return WithUnit(num, unit)
+
+    def simple_attribute(self, name, value):
+        return {name: value}
+
+    def complex_attribute(self, name, arg_list):
+        return {name: arg_list}
+
+    def define(self, attribute_name, group_name, attribute_type):
+        return Define(attribute_name, group_name, attribute_type)
+
+    def argument_list(self, *args):
+        return list(args)
+
+    def group(self, group_name, group_args, body):
+        attrs = dict()
+        sub_groups = []
+        defines = []
+        for a in body:
+            if isinstance(a, dict):
+                k = list(a.keys())[0]
+                if k in attrs.keys():
+                    attrs[k].append(a[k])
+                else:
+                    attrs[k] = [a[k]]
+            elif isinstance(a, Group):
+                sub_groups.append(a)
+            elif isinstance(a, Define):
+                defines.append(a)
+            else:
+                assert False
+
+        return Group(group_name, group_args, attrs, sub_groups, defines)
+
+
+def best_time(f, repetitions: int):
+    best = float('inf')
+    result = None
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        result = f()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    filename = sys.argv[1] if len(sys.argv) > 1 else default_lib_file
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    data = open(filename).read()
+
+    implementations = [(ReferenceTransformer, reference_grammar, 'liberty_reference'),
+                       (LibertyTransformer, liberty_grammar, 'liberty')]
+    libraries = []
+    for mode in ['transform', 'parse']:
+        times = dict()
+        for transformer_class, grammar, grammar_name in implementations:
+            if mode == 'transform':
+                tree = get_lalr_parser(grammar, grammar_name + '_tree', None).parse(data)
+                transformer = transformer_class()
+                f = lambda: transformer.transform(tree)
+            else:
+                parser = get_lalr_parser(grammar, grammar_name, transformer_class)
+                f = lambda: parser.parse(data)
+            t, library = best_time(f, repetitions)
+            times[transformer_class.__name__] = t
+            libraries.append(library)
+            print("{:9} {:22} {:8.3f} s".format(mode, transformer_class.__name__, t))
+        print("{:9} speedup: {:.2f}x".format(
+            mode, times['ReferenceTransformer'] / times['LibertyTransformer']))
+
+    expected = pickle.dumps(libraries[0])
+    assert all(pickle.dumps(library) == expected for library in libraries), \
+        "Transformers create different trees."
+
+
+if __name__ == '__main__':
+    main()
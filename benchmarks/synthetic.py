@@ -0,0 +1,181 @@
+##
+## Copyright (c) 2019 Thomas Kramer.
+## 
+## This file is part of liberty-parser 
+## (see https://codeberg.org/tok/liberty-parser).
+## 
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+## 
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+## 
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Generator of synthetic liberty libraries for benchmarks.
+
+The size of the library scales with the number of cells, the number of input pins and
+hence timing arcs per cell, the size of the NLDM tables, optional CCS current waveforms
+(large `vector` tables) and the nesting depth of the pins in `bus` groups.
+
+Usage: python benchmarks/synthetic.py output.lib [--cells N] [--inputs N] [--table N]
+                                                 [--ccs N] [--ccs-points N] [--nesting N]
+"""
+import argparse
+import random
+from typing import IO
+
+
+class LibrarySpec:
+    """
+    Parameters of a synthetic library.
+    """
+
+    def __init__(self, cells: int = 100, inputs: int = 2, table_size: int = 7,
+                 ccs_vectors: int = 0, ccs_points: int = 40, nesting: int = 0, seed: int = 1):
+        # Number of cells.
+        self.cells = cells
+        # Input pins per cell. Each input has one timing arc to the output pin.
+        self.inputs = inputs
+        # NLDM tables have `table_size` x `table_size` entries.
+        self.table_size = table_size
+        # Number of CCS `vector` groups per table of output current. 0 disables CCS data.
+        self.ccs_vectors = ccs_vectors
+        # Number of time points of a CCS vector.
+        self.ccs_points = ccs_points
+        # Number of `bus` groups nested around the input pins.
+        self.nesting = nesting
+        self.seed = seed
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+def _row(values) -> str:
+    return ', '.join('{:.6g}'.format(v) for v in values)
+
+
+def _table(out: IO[str], indent: str, name: str, template: str, index_1, index_2, rng):
+    out.write('{}{}({}) {{\n'.format(indent, name, template))
+    out.write('{}  index_1 ("{}");\n'.format(indent, _row(index_1)))
+    out.write('{}  index_2 ("{}");\n'.format(indent, _row(index_2)))
+    out.write('{}  values ( \\\n'.format(indent))
+    base = rng.uniform(0.01, 0.1)
+    rows = []
+    for s in index_1:
+        rows.append('{}    "{}"'.format(indent, _row(base + 0.5 * s + 2.0 * c + rng.uniform(0, 1e-3)
+                                                      for c in index_2)))
+    out.write(', \\\n'.join(rows))
+    out.write(');\n{}}}\n'.format(indent))
+
+
+def _ccs(out: IO[str], indent: str, name: str, spec: LibrarySpec, rng):
+    out.write('{}{}() {{\n'.format(indent, name))
+    for i in range(spec.ccs_vectors):
+        out.write('{}  vector(ccs_template) {{\n'.format(indent))
+        out.write('{}    reference_time : {:.6g};\n'.format(indent, rng.uniform(0, 0.1)))
+        out.write('{}    index_1 ("{:.6g}");\n'.format(indent, 0.01 * (i + 1)))
+        out.write('{}    index_2 ("{:.6g}");\n'.format(indent, 0.001 * (i + 1)))
+        times = [0.001 * k for k in range(spec.ccs_points)]
+        out.write('{}    index_3 ("{}");\n'.format(indent, _row(times)))
+        out.write('{}    values ("{}");\n'.format(
+            indent, _row(rng.uniform(-0.1, 0.1) for _ in times)))
+        out.write('{}  }}\n'.format(indent))
+    out.write('{}}}\n'.format(indent))
+
+
+def write_library(out: IO[str], spec: LibrarySpec):
+    """
+    Write a synthetic library into a text file object.
+    """
+    rng = random.Random(spec.seed)
+    n = spec.table_size
+    slews = [0.005 * 2 ** (i * 8 / max(1, n - 1)) for i in range(n)]
+    loads = [0.0005 * 2 ** (i * 8 / max(1, n - 1)) for i in range(n)]
+    template = 'delay_template_{0}x{0}'.format(n)
+
+    out.write('/* Synthetic library: {} */\n'.format(spec.to_dict()))
+    out.write('library(synthetic) {\n')
+    out.write('  delay_model : table_lookup;\n')
+    out.write('  time_unit : "1ns";\n')
+    out.write('  capacitive_load_unit (1,pf);\n')
+    out.write('  lu_table_template({}) {{\n'.format(template))
+    out.write('    variable_1 : input_net_transition;\n')
+    out.write('    variable_2 : total_output_net_capacitance;\n')
+    out.write('    index_1 ("{}");\n'.format(_row(range(1000, 1000 + n))))
+    out.write('    index_2 ("{}");\n'.format(_row(range(1000, 1000 + n))))
+    out.write('  }\n')
+    if spec.ccs_vectors:
+        out.write('  output_current_template(ccs_template) {\n')
+        out.write('    variable_1 : input_net_transition;\n')
+        out.write('    variable_2 : total_output_net_capacitance;\n')
+        out.write('    variable_3 : time;\n')
+        out.write('  }\n')
+
+    inputs = ['A{}'.format(i) for i in range(spec.inputs)]
+    function = ' & '.join(inputs) if inputs else '1'
+    for c in range(spec.cells):
+        out.write('  cell (CELL{}) {{\n'.format(c))
+        out.write('    area : {:.6g};\n'.format(rng.uniform(0.5, 20)))
+        out.write('    cell_leakage_power : {:.6g};\n'.format(rng.uniform(1, 100)))
+        indent = '    '
+        for level in range(spec.nesting):
+            out.write('{}bus (B{}) {{\n'.format(indent, level))
+            indent += '  '
+        for name in inputs:
+            out.write('{}pin({}) {{\n'.format(indent, name))
+            out.write('{}  direction : input;\n'.format(indent))
+            out.write('{}  capacitance : {:.6g};\n'.format(indent, rng.uniform(0.001, 0.005)))
+            out.write('{}}}\n'.format(indent))
+        for level in range(spec.nesting):
+            indent = indent[:-2]
+            out.write('{}}}\n'.format(indent))
+
+        out.write('    pin(Y) {\n')
+        out.write('      direction : output;\n')
+        out.write('      function : "{}";\n'.format(function))
+        for name in inputs:
+            out.write('      timing() {\n')
+            out.write('        related_pin : "{}";\n'.format(name))
+            out.write('        timing_sense : positive_unate;\n')
+            for table in ['cell_rise', 'rise_transition', 'cell_fall', 'fall_transition']:
+                _table(out, '        ', table, template, slews, loads, rng)
+            if spec.ccs_vectors:
+                for table in ['output_current_rise', 'output_current_fall']:
+                    _ccs(out, '        ', table, spec, rng)
+            out.write('      }\n')
+        out.write('    }\n')
+        out.write('  }\n')
+    out.write('}\n')
+
+
+def generate_library(filename: str, spec: LibrarySpec):
+    """
+    Write a synthetic library into a file.
+    """
+    with open(filename, 'w') as f:
+        write_library(f, spec)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic liberty library.")
+    parser.add_argument('output')
+    parser.add_argument('--cells', type=int, default=100)
+    parser.add_argument('--inputs', type=int, default=2)
+    parser.add_argument('--table', type=int, default=7)
+    parser.add_argument('--ccs', type=int, default=0)
+    parser.add_argument('--ccs-points', type=int, default=40)
+    parser.add_argument('--nesting', type=int, default=0)
+    args = parser.parse_args()
+    generate_library(args.output, LibrarySpec(args.cells, args.inputs, args.table, args.ccs,
+                                              args.ccs_points, args.nesting))
+
+
+if __name__ == '__main__':
+    main()
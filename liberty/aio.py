@@ -0,0 +1,209 @@
+##
+## Copyright (c) 2019 Thomas Kramer.
+##
+## This file is part of liberty-parser
+## (see https://codeberg.org/tok/liberty-parser).
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Loading libraries from asyncio applications.
+
+`load_liberty_async` reads and parses in an executor such that the event loop is not
+blocked. Loaded libraries are kept in a `LibraryCache`: concurrent requests for the same
+file share a single load, and the least recently used libraries are evicted when the
+estimated memory of all cached libraries exceeds a budget.
+
+Example::
+
+    cache = LibraryCache(max_bytes=8 << 30)
+    library = await cache.load('corner_ss.lib', engine='fast')
+"""
+import asyncio
+import functools
+import os
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import Callable, Dict, Optional, Tuple
+from .parser import load_liberty
+from .types import Group
+
+# Memory of a parsed library relative to the size of its file, used for the default
+# memory estimate. Measured with the 'fast' engine, tables as strings.
+MEMORY_PER_FILE_BYTE = 6
+
+DEFAULT_MAX_BYTES = 4 << 30
+
+
+def estimate_memory(library: Group, filename: str) -> int:
+    """
+    Default memory estimate of a loaded library: proportional to its file size.
+    """
+    return os.path.getsize(filename) * MEMORY_PER_FILE_BYTE
+
+
+class LibraryCache:
+    """
+    LRU cache of loaded libraries with a memory budget. Not thread-safe, it must be used
+    from one event loop.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, executor: Optional[Executor] = None,
+                 sizeof: Callable[[Group, str], int] = estimate_memory):
+        """
+        :param max_bytes: Budget for the estimated memory of all cached libraries.
+            Libraries which alone exceed it are returned but not kept.
+        :param executor: Executor running `load_liberty`. Default executor of the loop if
+            `None`. A process pool avoids contention on the GIL but has to send the parsed
+            library back to this process.
+        :param sizeof: Function estimating the memory of a library loaded from a file.
+        """
+        self.max_bytes = max_bytes
+        self.executor = executor
+        self.sizeof = sizeof
+        # Key -> (library, estimated bytes, file signature). Most recently used last.
+        self._libraries: OrderedDict = OrderedDict()
+        self._pending: Dict[Tuple, asyncio.Future] = dict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._libraries)
+
+    def __contains__(self, filename: str):
+        filename = os.path.abspath(filename)
+        return any(key[0] == filename for key in self._libraries)
+
+    @staticmethod
+    def _key(filename: str, kwargs: Dict) -> Tuple:
+        return (os.path.abspath(filename),) + tuple(sorted(kwargs.items()))
+
+    async def load(self, filename: str, **kwargs) -> Group:
+        """
+        Get a library from the cache or load it with `load_liberty(filename, **kwargs)`.
+        Libraries are reloaded if the file was modified since.
+        Cached libraries are shared, they must not be modified by the caller.
+        """
+        key = self._key(filename, kwargs)
+        entry = self._libraries.get(key)
+        if entry is not None:
+            library, _, signature = entry
+            if signature == _signature(filename):
+                self._libraries.move_to_end(key)
+                self.hits += 1
+                return library
+            self._remove(key)
+        pending = self._pending.get(key)
+        if pending is None:
+            self.misses += 1
+            pending = asyncio.ensure_future(self._load(key, filename, kwargs))
+            self._pending[key] = pending
+        # A cancelled caller does not cancel the load for the other callers.
+        return await asyncio.shield(pending)
+
+    async def _load(self, key: Tuple, filename: str, kwargs: Dict) -> Group:
+        loop = asyncio.get_running_loop()
+        try:
+            signature = _signature(filename)
+            library = await loop.run_in_executor(
+                self.executor, functools.partial(load_liberty, filename, **kwargs))
+            size = self.sizeof(library, filename)
+        finally:
+            del self._pending[key]
+        self._libraries[key] = (library, size, signature)
+        self.total_bytes += size
+        self._evict()
+        return library
+
+    def _remove(self, key: Tuple):
+        _, size, _ = self._libraries.pop(key)
+        self.total_bytes -= size
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self._libraries:
+            self._remove(next(iter(self._libraries)))
+            self.evictions += 1
+
+    def clear(self):
+        self._libraries.clear()
+        self.total_bytes = 0
+
+
+def _signature(filename: str) -> Tuple[int, int]:
+    st = os.stat(filename)
+    return st.st_size, st.st_mtime_ns
+
+
+_default_cache: Optional[LibraryCache] = None
+
+
+def default_cache() -> LibraryCache:
+    """
+    Cache used by `load_liberty_async` if none is given.
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = LibraryCache()
+    return _default_cache
+
+
+async def load_liberty_async(filename: str, *, library_cache: Optional[LibraryCache] = None,
+                             **kwargs) -> Group:
+    """
+    Load a liberty file without blocking the event loop.
+    :param filename: liberty file name string.
+    :param library_cache: `LibraryCache` to use, `default_cache()` if `None`.
+    :param kwargs: Arguments of `load_liberty`, e.g. `engine='fast'` or `cache=True`.
+    :return: `Group` object of library, shared with other callers.
+    """
+    if library_cache is None:
+        library_cache = default_cache()
+    return await library_cache.load(filename, **kwargs)
+
+
+def test_load_liberty_async():
+    lib_file = os.path.join(os.path.dirname(__file__), '../test_data/gscl45nm.lib')
+    size = os.path.getsize(lib_file) * MEMORY_PER_FILE_BYTE
+
+    async def main():
+        cache = LibraryCache(max_bytes=int(size * 1.5))
+        libraries = await asyncio.gather(*[cache.load(lib_file, engine='fast')
+                                           for _ in range(3)])
+        assert libraries[0] is libraries[1] is libraries[2]
+        assert cache.misses == 1 and len(cache) == 1
+
+        assert await load_liberty_async(lib_file, library_cache=cache, engine='fast') \
+            is libraries[0]
+        assert cache.hits == 1
+        # `cache` is passed on to `load_liberty`.
+        library = await load_liberty_async(lib_file, library_cache=LibraryCache(),
+                                           engine='fast', cache=False)
+        assert str(library) == str(libraries[0])
+
+        # Exceeds the budget, the least recently used library is evicted.
+        other = await cache.load(lib_file, engine='lark')
+        assert str(other) == str(libraries[0])
+        assert cache.evictions == 1 and len(cache) == 1
+        assert await cache.load(lib_file, engine='lark') is other
+
+        try:
+            await cache.load(lib_file + '.missing')
+            assert False
+        except FileNotFoundError:
+            pass
+        assert not cache._pending
+
+    asyncio.run(main())
@@ -18,7 +18,10 @@
 ## along with this program. If not, see <http://www.gnu.org/licenses/>.
 ##
 import numpy as np
-from typing import List
+from typing import List, Optional
+
+# Complex attributes holding numeric tables.
+TABLE_ATTRIBUTES = frozenset(['values', 'index_1', 'index_2', 'index_3', 'index_4'])
 
 
 def array_to_strings(array: np.ndarray) -> List[str]:
@@ -27,13 +30,14 @@ def array_to_strings(array: np.ndarray) -> List[str]:
     :param array:
     :return:
     """
-    array = array.astype(np.float)
+    array = np.asarray(array, dtype=np.float64)
     if array.ndim == 1:
         array = [array]
-    return [
-        ", ".join(("{0:f}".format(x) for x in row))
-        for row in array
-    ]
+    if len(array) == 0:
+        return []
+    # One format string per row, such that each row is formatted with a single operation.
+    row_format = ", ".join(["%f"] * len(array[0]))
+    return [row_format % tuple(row) for row in np.asarray(array).tolist()]
 
 
 def strings_to_array(strings: List[str]) -> np.array:
@@ -49,9 +53,64 @@ def strings_to_array(strings: List[str]) -> np.array:
     return np.array(array)
 
 
+def strings_to_table(strings: List[str], dtype=np.float64) -> Optional[np.ndarray]:
+    """
+    Convert the rows of a numeric table into a 2D array.
+    :param strings: Rows of comma separated numbers.
+    :param dtype: Data type of the array.
+    :return: Array with one row per string, or `None` if the strings are not numbers or
+        the rows differ in length.
+    """
+    if not strings:
+        return None
+    num_cols = strings[0].count(',') + 1
+    if any(s.count(',') + 1 != num_cols for s in strings):
+        return None
+    text = ",".join(strings)
+    if '\\' in text:
+        text = text.replace("\\\r\n", "").replace("\\\n", "")
+    try:
+        array = np.array(text.split(','), dtype=dtype)
+    except ValueError:
+        return None
+    return array.reshape(len(strings), num_cols)
+
+
+def table_to_strings(array: np.ndarray) -> List[str]:
+    """
+    Convert a numeric table into liberty strings.
+    Numbers are written with as many digits as needed to read back the same value.
+    Integral numbers are written without decimal point.
+    :param array: 1D or 2D array.
+    :return: One string per row.
+    """
+    array = np.asarray(array)
+    if array.ndim == 1:
+        array = array[np.newaxis, :]
+    if array.dtype == np.float64:
+        rows = (map(repr, row) for row in array.tolist())
+    else:
+        # Shortest representation in the precision of the array.
+        rows = (map(str, row) for row in array)
+    return [(", ".join(row) + ",").replace(".0,", ",")[:-1] for row in rows]
+
+
 def test_array_to_strings():
     a = np.array([[1, 2, 3], [4, 5, 6]])
     s = array_to_strings(a)
     a2 = strings_to_array(s)
 
     assert (a == a2).all()
+
+
+def test_strings_to_table():
+    s = ["1, 2.5, 3", "4, 5, 6e-3"]
+    a = strings_to_table(s)
+    assert a.shape == (2, 3)
+    assert (a == strings_to_array(s)).all()
+    assert table_to_strings(a) == ["1, 2.5, 3", "4, 5, 0.006"]
+    assert (strings_to_table(table_to_strings(a)) == a).all()
+    assert table_to_strings(a.astype(np.float32)) == ["1, 2.5, 3", "4, 5, 0.006"]
+
+    assert strings_to_table(["1, 2", "3"]) is None
+    assert strings_to_table(["a, b"]) is None
@@ -18,10 +18,10 @@
 ## along with this program. If not, see <http://www.gnu.org/licenses/>.
 ##
 import numpy as np
-from typing import List
-from lark import Lark, Transformer, v_args
-import sympy
-from functools import reduce
+import re
+from itertools import permutations
+from typing import Dict, List, Optional, Tuple
+from functools import lru_cache
 
 """
 Parsing boolean functions of liberty format
@@ -41,67 +41,315 @@ space Logical AND
 0 Signal tied to logic 0
 """
 
-boolean_function_grammar = r"""
+# Moved to `liberty.boolean_grammar`, which imports Lark and sympy.
+# Still available here on access.
+_boolean_grammar_names = ('boolean_function_grammar', 'BooleanFunctionTransformer')
 
-    ?start: or_expr
 
-    ?or_expr: and_expr ([ "+" | "|" ] and_expr)*
+def __getattr__(name):
+    if name in _boolean_grammar_names:
+        from . import boolean_grammar
+        return getattr(boolean_grammar, name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
-    ?and_expr: xor_expr ([ "&" | "*" ]? xor_expr)*
 
-    ?xor_expr: atom
-        | xor_expr "^" xor_expr
+def parse_boolean_function(data: str):
+    """
+    Parse a boolean function into a sympy formula.
+    :param data: String representation of boolean expression as defined in liberty format.
+    :return: sympy formula
+    """
+    # Lark and sympy are imported on first use only.
+    from .grammar_cache import get_lalr_parser
+    from .boolean_grammar import boolean_function_grammar, BooleanFunctionTransformer
+    liberty_parser = get_lalr_parser(boolean_function_grammar, 'boolean_function',
+                                     BooleanFunctionTransformer)
+    function = liberty_parser.parse(data)
+    return function
 
-    ?atom: CNAME -> name
-        | "!" atom -> not_expr
-        | atom "'" -> not_expr
-        | "(" or_expr ")"
 
-    %import common.CNAME
-    %import common.WS_INLINE
+# Tokens of boolean functions: names, constants and operators.
+_function_token_regex = re.compile(r"\s*(?:([A-Za-z_][A-Za-z_0-9]*|[01])|([!'^*&+|()]))")
 
-    %ignore WS_INLINE
-"""
+# Opcodes of compiled functions. Arguments are taken from a stack.
+_op_input = 0
+_op_const = 1
+_op_not = 2
+_op_and = 3
+_op_or = 4
+_op_xor = 5
+
+# Largest number of inputs for which a truth table is created.
+MAX_TRUTH_TABLE_INPUTS = 20
 
+# Largest number of inputs for which `CompiledFunction.permutation_key` is computed.
+MAX_PERMUTATION_INPUTS = 8
 
-@v_args(inline=True)
-class BooleanFunctionTransformer(Transformer):
-    from operator import __inv__
 
-    def or_expr(self, *exprs):
-        from operator import __or__
-        return reduce(__or__, exprs)
+class _FunctionCompiler:
+    """
+    Recursive-descent parser turning a boolean function into a postfix program.
+    Accepts the same syntax and operator precedence as `boolean_function_grammar` and
+    additionally the constants 0 and 1.
+    """
 
-    def and_expr(self, *exprs):
-        from operator import __and__
-        return reduce(__and__, exprs)
+    def __init__(self, data: str):
+        self.data = data
+        self.tokens = []
+        pos = 0
+        data = data.rstrip()
+        while pos < len(data):
+            m = _function_token_regex.match(data, pos)
+            if m is None:
+                raise ValueError("Invalid boolean function: {!r}".format(self.data))
+            self.tokens.append(m.group(1) or m.group(2))
+            pos = m.end()
+        self.pos = 0
+        self.program = []
+        self.inputs = sorted({t for t in self.tokens if t[0].isalpha() or t[0] == '_'})
+        self._input_index = {name: i for i, name in enumerate(self.inputs)}
 
-    def xor_expr(self, *exprs):
-        from operator import __xor__
-        return reduce(__xor__, exprs)
+    def _peek(self) -> Optional[str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
 
-    not_expr = __inv__
+    def _next(self) -> Optional[str]:
+        tok = self._peek()
+        self.pos += 1
+        return tok
 
-    def name(self, n):
-        return sympy.Symbol(n)
+    def compile(self) -> List[Tuple[int, int]]:
+        self._or_expr()
+        if self._peek() is not None:
+            raise ValueError("Unexpected {!r} in boolean function {!r}."
+                             .format(self._peek(), self.data))
+        return self.program
 
+    def _or_expr(self):
+        self._and_expr()
+        while self._peek() in ('+', '|'):
+            self._next()
+            self._and_expr()
+            self.program.append((_op_or, 0))
 
-def parse_boolean_function(data: str):
+    def _and_expr(self):
+        self._xor_expr()
+        while True:
+            tok = self._peek()
+            if tok in ('&', '*'):
+                self._next()
+            elif tok is None or tok in ('+', '|', ')', '^', "'"):
+                return
+            # Otherwise two juxtaposed expressions.
+            self._xor_expr()
+            self.program.append((_op_and, 0))
+
+    def _xor_expr(self):
+        self._unary()
+        while self._peek() == '^':
+            self._next()
+            self._unary()
+            self.program.append((_op_xor, 0))
+
+    def _unary(self):
+        if self._peek() == '!':
+            self._next()
+            self._unary()
+            self.program.append((_op_not, 0))
+            return
+        tok = self._next()
+        if tok == '(':
+            self._or_expr()
+            if self._next() != ')':
+                raise ValueError("Missing ')' in boolean function {!r}.".format(self.data))
+        elif tok in ('0', '1'):
+            self.program.append((_op_const, int(tok)))
+        elif tok is not None and (tok[0].isalpha() or tok[0] == '_'):
+            self.program.append((_op_input, self._input_index[tok]))
+        else:
+            raise ValueError("Unexpected {!r} in boolean function {!r}.".format(tok, self.data))
+        while self._peek() == "'":
+            self._next()
+            self.program.append((_op_not, 0))
+
+
+def _run(program: List[Tuple[int, int]], inputs: List, zero, one):
     """
-    Parse a boolean function into a sympy formula.
+    Execute a compiled function on bit vectors.
+    :param inputs: One value per input supporting `~`, `&`, `|` and `^`.
+    :param zero: Value of the constant 0.
+    :param one: Value of the constant 1.
+    """
+    stack = []
+    push = stack.append
+    pop = stack.pop
+    for op, arg in program:
+        if op == _op_input:
+            push(inputs[arg])
+        elif op == _op_const:
+            push(one if arg else zero)
+        elif op == _op_not:
+            push(~pop())
+        else:
+            b = pop()
+            a = pop()
+            if op == _op_and:
+                push(a & b)
+            elif op == _op_or:
+                push(a | b)
+            else:
+                push(a ^ b)
+    return stack[0]
+
+
+class CompiledFunction:
+    """
+    Boolean function compiled into a truth table and a bit-parallel evaluator.
+
+    Row `r` of the truth table holds the output for the inputs `(r >> i) & 1`, where
+    input `i` is `inputs[i]`. Two compiled functions are equal if they compute the same
+    function of the same named inputs, inputs they do not depend on are ignored.
+    """
+    __slots__ = ('function', 'inputs', 'truth_table', '_program', '_bits', '_key')
+
+    def __init__(self, function: str):
+        compiler = _FunctionCompiler(function)
+        self.function = function
+        self._program = compiler.compile()
+        # Input names in ascending order.
+        self.inputs: Tuple[str, ...] = tuple(compiler.inputs)
+        self.truth_table: Optional[int] = None
+        self._bits = None
+        self._key = None
+        if len(self.inputs) <= MAX_TRUTH_TABLE_INPUTS:
+            self.truth_table = _pack_bits(self.bits())
+
+    def bits(self) -> np.ndarray:
+        """
+        Get the truth table as read-only boolean array of length `2**len(inputs)`.
+        """
+        if self._bits is None:
+            rows = np.arange(1 << len(self.inputs))
+            inputs = [((rows >> i) & 1).astype(bool) for i in range(len(self.inputs))]
+            result = _run(self._program, inputs, np.zeros(len(rows), dtype=bool),
+                          np.ones(len(rows), dtype=bool))
+            bits = np.broadcast_to(result, rows.shape).copy()
+            bits.flags.writeable = False
+            self._bits = bits
+        return self._bits
+
+    def evaluate(self, inputs: Dict[str, np.ndarray]) -> np.ndarray:
+        """
+        Evaluate the function for many input vectors at once.
+        :param inputs: Input name -> array of boolean values. All arrays are broadcast to a
+            common shape.
+        :return: Boolean array.
+        """
+        values = [np.asarray(inputs[name], dtype=bool) for name in self.inputs]
+        if self.truth_table is None or not values:
+            shape = np.broadcast_shapes(*(v.shape for v in values))
+            return np.broadcast_to(_run(self._program, values, np.zeros(shape, dtype=bool),
+                                        np.ones(shape, dtype=bool)), shape)
+        # Look up the rows of the truth table.
+        row = np.zeros(np.broadcast_shapes(*(v.shape for v in values)), dtype=np.intp)
+        for i, v in enumerate(values):
+            row |= v.astype(np.intp) << i
+        return self.bits()[row]
+
+    def evaluate_packed(self, inputs: Dict[str, np.ndarray]) -> np.ndarray:
+        """
+        Bit-parallel evaluation: each bit of the input words is an independent input
+        vector, hence 64 vectors are evaluated per `uint64` word.
+        :param inputs: Input name -> array of `uint64` words.
+        :return: Array of `uint64` words holding the results.
+        """
+        values = [np.asarray(inputs[name], dtype=np.uint64) for name in self.inputs]
+        shape = np.broadcast_shapes(*(v.shape for v in values)) if values else ()
+        zero = np.zeros(shape, dtype=np.uint64)
+        return np.broadcast_to(_run(self._program, values, zero, ~zero), shape)
+
+    def support(self) -> Tuple[str, ...]:
+        """
+        Get the inputs the function actually depends on.
+        """
+        return self.key()[0]
+
+    def key(self) -> Tuple[Tuple[str, ...], int]:
+        """
+        Canonical form `(support, truth table over the support)`.
+        Equal for functionally equivalent functions.
+        """
+        if self._key is None:
+            if self.truth_table is None:
+                raise ValueError("Too many inputs for a truth table: {}".format(len(self.inputs)))
+            n = len(self.inputs)
+            # Axis `n - 1 - i` of the table corresponds to input `i`.
+            table = self.bits().reshape((2,) * n) if n else self.bits()
+            support = []
+            for i in range(n):
+                axis = n - 1 - i
+                cofactors = np.split(table, 2, axis=axis)
+                if np.array_equal(cofactors[0], cofactors[1]):
+                    table = np.take(table, [0], axis=axis)
+                else:
+                    support.append(self.inputs[i])
+            self._key = (tuple(support), _pack_bits(table.ravel()))
+        return self._key
+
+    def permutation_key(self) -> Tuple[int, int]:
+        """
+        Canonical form which does not depend on the names and order of the inputs.
+        Equal for functions that are the same up to a renaming of the inputs,
+        e.g. `A&!B` and `!X&Y`.
+        :return: Tuple of the number of inputs and the smallest truth table over all input
+            permutations.
+        """
+        support, _ = self.key()
+        n = len(support)
+        if n > MAX_PERMUTATION_INPUTS:
+            raise ValueError("Too many inputs for permutation canonicalization: {}".format(n))
+        m = len(self.inputs)
+        bits = self.bits().reshape((2,) * m) if m else self.bits()
+        # Drop the inputs the function does not depend on. Starting with the highest axis
+        # keeps the axis numbers of the remaining inputs valid.
+        for i in range(m):
+            if self.inputs[i] not in support:
+                bits = np.take(bits, 0, axis=m - 1 - i)
+        best = min(_pack_bits(np.transpose(bits, p).ravel()) for p in permutations(range(n)))
+        return n, best
+
+    def __eq__(self, other):
+        if not isinstance(other, CompiledFunction):
+            return NotImplemented
+        return self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return "CompiledFunction({!r})".format(self.function)
+
+
+def _pack_bits(bits: np.ndarray) -> int:
+    """
+    Pack a boolean array into an integer. Element `i` becomes bit `i`.
+    """
+    return int.from_bytes(np.packbits(bits, bitorder='little').tobytes(), 'little')
+
+
+@lru_cache(maxsize=4096)
+def compile_boolean_function(data: str) -> CompiledFunction:
+    """
+    Compile a boolean function into a truth table and bit-parallel evaluator.
+    Results are memoized per function string. Much faster than `parse_boolean_function`
+    and sympy for evaluation and equivalence checks.
     :param data: String representation of boolean expression as defined in liberty format.
-    :return: sympy formula
+    :return: `CompiledFunction`
     """
-    liberty_parser = Lark(boolean_function_grammar,
-                          parser='lalr',
-                          lexer='standard',
-                          transformer=BooleanFunctionTransformer()
-                          )
-    function = liberty_parser.parse(data)
-    return function
+    return CompiledFunction(data)
 
 
 def test_parse_boolean_function():
+    import sympy
     f_str = "A' + B + C & D + E ^ F * G | (H + I)"
     f_actual = parse_boolean_function(f_str)
     a, b, c, d, e, f, g, h, i = sympy.symbols('A B C D E F G H I')
@@ -109,3 +357,39 @@ def test_parse_boolean_function():
     f_exp = ~a | b | c & d | (e ^ f) & g | (h | i)
 
     assert f_actual == f_exp
+
+
+def test_compile_boolean_function():
+    import sympy
+    f_str = "A' + B + C & D + E ^ F * G | (H + I)"
+    f = compile_boolean_function(f_str)
+    assert f is compile_boolean_function(f_str)
+    assert f.inputs == tuple('ABCDEFGHI')
+
+    # Same truth table as the sympy expression.
+    sympy_f = parse_boolean_function(f_str)
+    symbols = sympy.symbols(f.inputs)
+    for row in range(0, 1 << 9, 7):
+        values = {s: bool((row >> i) & 1) for i, s in enumerate(symbols)}
+        assert bool(sympy_f.subs(values)) == bool((f.truth_table >> row) & 1)
+
+    rng = np.random.default_rng(1)
+    words = {name: rng.integers(0, 1 << 63, 16, dtype=np.uint64) for name in f.inputs}
+    packed = f.evaluate_packed(words)
+    bits = {name: (w[:, np.newaxis] >> np.arange(64, dtype=np.uint64)) & np.uint64(1)
+            for name, w in words.items()}
+    expected = (packed[:, np.newaxis] >> np.arange(64, dtype=np.uint64)) & np.uint64(1)
+    assert (f.evaluate(bits) == expected.astype(bool)).all()
+
+    # Equivalence.
+    assert compile_boolean_function("!(A & B)") == compile_boolean_function("A' + B'")
+    assert compile_boolean_function("A | (A & B)") == compile_boolean_function("A")
+    assert compile_boolean_function("A (B + 0)").support() == ('A', 'B')
+    assert compile_boolean_function("A & !B") != compile_boolean_function("!X & Y")
+    assert compile_boolean_function("A & !B").permutation_key() == \
+        compile_boolean_function("!X & Y").permutation_key()
+    # Inputs which the function does not depend on.
+    for f, g in [('A + B 0 + C 0', 'X'), ('!A + B 0 + C 0', '!X'),
+                 ('A & !D + B 0 + C 0', 'X & !Y')]:
+        assert compile_boolean_function(f).permutation_key() == \
+            compile_boolean_function(g).permutation_key()
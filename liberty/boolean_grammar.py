@@ -0,0 +1,72 @@
+##
+## Copyright (c) 2019 Thomas Kramer.
+## 
+## This file is part of liberty-parser 
+## (see https://codeberg.org/tok/liberty-parser).
+## 
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+## 
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+## 
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Lark grammar of boolean functions and the transformer into sympy expressions.
+
+Kept in its own module such that Lark and sympy are only imported when boolean
+functions are parsed into sympy expressions.
+"""
+from functools import reduce
+from lark import Transformer, v_args
+import sympy
+
+boolean_function_grammar = r"""
+
+    ?start: or_expr
+
+    ?or_expr: and_expr ([ "+" | "|" ] and_expr)*
+
+    ?and_expr: xor_expr ([ "&" | "*" ]? xor_expr)*
+
+    ?xor_expr: atom
+        | xor_expr "^" xor_expr
+
+    ?atom: CNAME -> name
+        | "!" atom -> not_expr
+        | atom "'" -> not_expr
+        | "(" or_expr ")"
+
+    %import common.CNAME
+    %import common.WS_INLINE
+
+    %ignore WS_INLINE
+"""
+
+
+@v_args(inline=True)
+class BooleanFunctionTransformer(Transformer):
+    from operator import __inv__
+
+    def or_expr(self, *exprs):
+        from operator import __or__
+        return reduce(__or__, exprs)
+
+    def and_expr(self, *exprs):
+        from operator import __and__
+        return reduce(__and__, exprs)
+
+    def xor_expr(self, *exprs):
+        from operator import __xor__
+        return reduce(__xor__, exprs)
+
+    not_expr = __inv__
+
+    def name(self, n):
+        return sympy.Symbol(n)
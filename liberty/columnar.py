@@ -0,0 +1,371 @@
+##
+## Copyright (c) 2019 Thomas Kramer.
+##
+## This file is part of liberty-parser
+## (see https://codeberg.org/tok/liberty-parser).
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Columnar export of timing and power tables.
+
+All tables of `timing` and `internal_power` groups are flattened into columns with one row
+per (cell, pin, related pin, timing type, table). Strings are dictionary encoded, indices
+and values of all tables are concatenated into contiguous float64 arrays which are
+addressed by offsets, similar to the Arrow list layout.
+
+The columns can be written into a single binary file. Reopening the file memory-maps it
+and creates the columns as read-only NumPy views without copying or parsing::
+
+    save_columnar(export_columnar(library), 'tables.lcol')
+    tables = load_columnar('tables.lcol')
+    rows = tables.select(cell='INVX1', table='cell_rise')
+    values = tables.values(rows[0])
+"""
+import json
+import mmap
+import struct
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from .types import Group, _text
+
+# Groups below a pin whose tables are exported.
+TABLE_GROUPS = ('timing', 'internal_power')
+
+# String columns. Missing values are encoded as -1.
+STRING_COLUMNS = ('cell', 'pin', 'related_pin', 'timing_type', 'when', 'group', 'table',
+                  'template')
+
+# Maximal number of table dimensions (`index_1` to `index_3`).
+MAX_DIMENSIONS = 3
+
+COLUMNAR_VERSION = 1
+
+MAGIC = b'LIBCOL\x00\x01'
+
+# Alignment of the arrays in the file in bytes.
+_alignment = 64
+
+
+def _pins(group: Group) -> Iterator[Group]:
+    """
+    Pins of a cell, including the pins of buses and bundles.
+    """
+    for g in group.groups:
+        if g.group_name == 'pin':
+            yield g
+        elif g.group_name in ('bus', 'bundle'):
+            yield from _pins(g)
+
+
+def _tables(group: Group, prefix: str) -> Iterator[Tuple[str, Group]]:
+    """
+    Sub-groups with a `values` attribute, with their names relative to `group` joined by
+    dots, e.g. 'output_current_rise.vector' for CCS vectors.
+    """
+    for g in group.groups:
+        name = prefix + g.group_name
+        if 'values' in g:
+            yield name, g
+        yield from _tables(g, name + '.')
+
+
+class _StringColumn:
+    """
+    Builder of a dictionary encoded string column.
+    """
+
+    def __init__(self):
+        self.codes: List[int] = []
+        self.index: Dict[str, int] = dict()
+
+    def append(self, value: Optional[str]):
+        if value is None:
+            self.codes.append(-1)
+            return
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.index)
+        self.codes.append(code)
+
+
+def _encode_strings(strings) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Concatenate UTF-8 strings into a byte array and an offset array of length `n + 1`.
+    """
+    data = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(data) + 1, dtype=np.int64)
+    np.cumsum([len(d) for d in data], out=offsets[1:])
+    return np.frombuffer(b''.join(data), dtype=np.uint8), offsets
+
+
+class ColumnarTables:
+    """
+    Flattened timing and power tables of a library.
+
+    Row `i` is described by the string columns (`cell`, `pin`, `related_pin`,
+    `timing_type`, `when`, `group`, `table`, `template`) and `table_id`, the number of its
+    table. Table `t` consists of `values[values.offsets[t]:values.offsets[t+1]]` with the
+    shape `shape[t, :ndim[t]]` and likewise the indices `index_1` ... `index_3`. Rows of
+    groups with several related pins share their table.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray], buffer=None):
+        """
+        :param columns: Arrays by column name, see `export_columnar`.
+        :param buffer: Memory map backing the arrays, kept open as long as this object.
+        """
+        self.columns = columns
+        self._buffer = buffer
+        self._dictionaries: Dict[str, List[str]] = dict()
+
+    def __len__(self):
+        return len(self.columns['table_id'])
+
+    def dictionary(self, name: str) -> List[str]:
+        """
+        Get the distinct values of a string column. The column holds indices into this list.
+        """
+        d = self._dictionaries.get(name)
+        if d is None:
+            data = self.columns[name + '.dictionary'].tobytes()
+            offsets = self.columns[name + '.offsets'].tolist()
+            d = [data[a:b].decode('utf-8') for a, b in zip(offsets[:-1], offsets[1:])]
+            self._dictionaries[name] = d
+        return d
+
+    def strings(self, name: str) -> List[Optional[str]]:
+        """
+        Decode a string column.
+        """
+        d = self.dictionary(name)
+        return [d[c] if c >= 0 else None for c in self.columns[name].tolist()]
+
+    def select(self, **conditions) -> np.ndarray:
+        """
+        Find rows by the values of string columns, e.g. `select(cell='INVX1', pin='Y')`.
+        :return: Row numbers.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for name, value in conditions.items():
+            try:
+                code = self.dictionary(name).index(value)
+            except ValueError:
+                return np.zeros(0, dtype=np.intp)
+            mask &= self.columns[name] == code
+        return np.flatnonzero(mask)
+
+    def index(self, row: int, dimension: int) -> np.ndarray:
+        """
+        Get the index vector `index_<dimension>` of the table of a row. Empty if the table
+        does not have this dimension.
+        """
+        t = self.columns['table_id'][row]
+        offsets = self.columns['index_{}.offsets'.format(dimension)]
+        return self.columns['index_{}'.format(dimension)][offsets[t]:offsets[t + 1]]
+
+    def values(self, row: int) -> np.ndarray:
+        """
+        Get the values of the table of a row, shaped by its indices.
+        """
+        t = self.columns['table_id'][row]
+        offsets = self.columns['values.offsets']
+        values = self.columns['values'][offsets[t]:offsets[t + 1]]
+        return values.reshape(tuple(self.columns['shape'][t, :self.columns['ndim'][t]]))
+
+
+def export_columnar(library: Group) -> ColumnarTables:
+    """
+    Flatten the tables of `timing` and `internal_power` groups into columns.
+    Indices missing in a table are taken from its template.
+    :param library: Library group.
+    :return: In-memory `ColumnarTables`.
+    """
+    templates = {_text(g.args[0]): g for g in library.groups
+                 if g.group_name.endswith('_template') and g.args}
+    strings = {name: _StringColumn() for name in STRING_COLUMNS}
+    # Per table: values, indices. Per row: position of the table data.
+    values: List[np.ndarray] = []
+    indices: List[List[np.ndarray]] = [[] for _ in range(MAX_DIMENSIONS)]
+    shapes: List[Tuple[int, ...]] = []
+    data_index: List[int] = []
+
+    for cell in library.get_groups('cell'):
+        cell_name = _text(cell.args[0]) if cell.args else None
+        for pin in _pins(cell):
+            pin_name = _text(pin.args[0]) if pin.args else None
+            for group in pin.groups:
+                if group.group_name not in TABLE_GROUPS:
+                    continue
+                related_pins = _text(group.get('related_pin'))
+                related_pins = related_pins.split() if related_pins else [None]
+                timing_type = _text(group.get('timing_type'))
+                when = _text(group.get('when'))
+                for table_name, table in _tables(group, ''):
+                    template_name = _text(table.args[0]) if table.args else None
+                    template = templates.get(template_name)
+                    shape = []
+                    for d in range(MAX_DIMENSIONS):
+                        index_name = 'index_{}'.format(d + 1)
+                        if index_name in table:
+                            index = table.get_array(index_name)
+                        elif template is not None and index_name in template:
+                            index = template.get_array(index_name)
+                        else:
+                            index = np.zeros(0)
+                        index = np.asarray(index, dtype=np.float64).ravel()
+                        indices[d].append(index)
+                        if len(index) > 0:
+                            shape.append(len(index))
+                    table_values = np.asarray(table.get_array('values'), dtype=np.float64)
+                    if table_values.size != np.prod(shape, dtype=np.int64):
+                        # Scalars and tables without matching indices keep their own shape.
+                        shape = [n for n in table_values.shape if n > 1] or [table_values.size]
+                    values.append(table_values.ravel())
+                    shapes.append(tuple(shape))
+                    for related_pin in related_pins:
+                        data_index.append(len(values) - 1)
+                        strings['cell'].append(cell_name)
+                        strings['pin'].append(pin_name)
+                        strings['related_pin'].append(related_pin)
+                        strings['timing_type'].append(timing_type)
+                        strings['when'].append(when)
+                        strings['group'].append(group.group_name)
+                        strings['table'].append(table_name)
+                        strings['template'].append(template_name)
+
+    columns = dict()
+    for name, column in strings.items():
+        columns[name] = np.array(column.codes, dtype=np.int32)
+        columns[name + '.dictionary'], columns[name + '.offsets'] = \
+            _encode_strings(column.index.keys())
+
+    columns['table_id'] = np.array(data_index, dtype=np.int64)
+
+    def concatenate(name: str, arrays: List[np.ndarray]):
+        offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+        np.cumsum([len(a) for a in arrays], out=offsets[1:])
+        columns[name] = np.concatenate(arrays) if arrays else np.zeros(0)
+        columns[name + '.offsets'] = offsets
+
+    concatenate('values', values)
+    for d in range(MAX_DIMENSIONS):
+        concatenate('index_{}'.format(d + 1), indices[d])
+
+    columns['shape'] = np.ones((len(shapes), MAX_DIMENSIONS), dtype=np.int64)
+    for i, shape in enumerate(shapes):
+        columns['shape'][i, :len(shape)] = shape
+    columns['ndim'] = np.array([len(shape) for shape in shapes], dtype=np.int8)
+    return ColumnarTables(columns)
+
+
+def save_columnar(tables: ColumnarTables, filename: str):
+    """
+    Write columns into a binary file which can be memory-mapped by `load_columnar`.
+    The file starts with `MAGIC`, the length of a JSON header and the header with the
+    dtype, shape and offset of each column. The arrays follow, aligned to 64 bytes.
+    """
+    header = {'version': COLUMNAR_VERSION, 'columns': dict()}
+    offset = 0
+    for name, array in tables.columns.items():
+        # Little-endian, independent of the platform.
+        dtype = array.dtype.newbyteorder('<')
+        header['columns'][name] = {'dtype': dtype.str, 'shape': list(array.shape),
+                                   'offset': offset}
+        offset += _padded(array.nbytes)
+    header_bytes = json.dumps(header).encode('utf-8')
+    start = _padded(len(MAGIC) + 8 + len(header_bytes))
+    with open(filename, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        f.write(bytes(start - f.tell()))
+        for name, array in tables.columns.items():
+            info = header['columns'][name]
+            f.write(np.ascontiguousarray(array, dtype=info['dtype']).data)
+            f.write(bytes(start + info['offset'] + _padded(array.nbytes) - f.tell()))
+
+
+def _padded(n: int) -> int:
+    return -(-n // _alignment) * _alignment
+
+
+def load_columnar(filename: str) -> ColumnarTables:
+    """
+    Open a file written by `save_columnar`. The file is memory-mapped, the columns are
+    read-only views into the mapping.
+    """
+    with open(filename, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a columnar table file: {}".format(filename))
+        header_length, = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(header_length).decode('utf-8'))
+        if header['version'] != COLUMNAR_VERSION:
+            raise ValueError("Unsupported columnar file version: {}".format(header['version']))
+        start = _padded(len(MAGIC) + 8 + header_length)
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    columns = dict()
+    for name, info in header['columns'].items():
+        dtype = np.dtype(info['dtype'])
+        shape = tuple(info['shape'])
+        count = int(np.prod(shape, dtype=np.int64))
+        columns[name] = np.frombuffer(buffer, dtype=dtype, count=count,
+                                      offset=start + info['offset']).reshape(shape)
+    return ColumnarTables(columns, buffer)
+
+
+def test_columnar():
+    import os.path
+    import tempfile
+    from .fast_parser import parse_liberty_fast
+    from .parser import load_liberty
+    from .types import select_cell
+    lib_file = os.path.join(os.path.dirname(__file__), '../test_data/gscl45nm.lib')
+    library = load_liberty(lib_file, engine='fast')
+    tables = export_columnar(library)
+    with tempfile.TemporaryDirectory() as d:
+        filename = os.path.join(d, 'tables.lcol')
+        save_columnar(tables, filename)
+        loaded = load_columnar(filename)
+        assert len(loaded) == len(tables)
+        for name, column in tables.columns.items():
+            assert np.array_equal(loaded.columns[name], column)
+        assert not loaded.columns['values'].flags.writeable
+
+        timing = select_cell(library, 'XOR2X1').get_group('pin', 'Y') \
+            .get_groups_by_attribute('timing', 'related_pin', 'A')[0]
+        row, = loaded.select(cell='XOR2X1', pin='Y', related_pin='A', table='cell_rise')
+        assert np.array_equal(loaded.values(row),
+                              timing.get_group('cell_rise').get_array('values'))
+        assert loaded.strings('timing_type')[row] == timing.get('timing_type')
+        assert len(loaded.index(row, 1)) == 6 and len(loaded.index(row, 3)) == 0
+        assert len(loaded.select(group='internal_power', table='rise_power')) > 0
+        assert len(loaded.select(cell='NO_SUCH_CELL')) == 0
+        del loaded
+
+    # Quoted names are `EscapedString` arguments.
+    library = parse_liberty_fast("""library(quoted) {
+  lu_table_template("delay_2") { variable_1 : input_net_transition; index_1("0, 1"); }
+  cell("INV") {
+    pin("Y") {
+      timing() {
+        related_pin : "A";
+        cell_rise("delay_2") { values("1, 3"); }
+      }
+    }
+  }
+}""")
+    tables = export_columnar(library)
+    row, = tables.select(cell='INV', pin='Y', related_pin='A', template='delay_2')
+    assert np.array_equal(tables.index(row, 1), [0, 1])
@@ -0,0 +1,198 @@
+##
+## Copyright (c) 2019 Thomas Kramer.
+##
+## This file is part of liberty-parser
+## (see https://codeberg.org/tok/liberty-parser).
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Compressed liberty files.
+
+Compressed input (gzip, bz2, xz, zstd) is detected by its magic bytes, independent of the
+file name. Decompression can run on a background thread which feeds decoded chunks to the
+parser, such that decompressing and parsing overlap. The compression libraries release the
+GIL while decompressing.
+
+zstd needs the `compression.zstd` module (Python 3.14) or the `zstandard` package.
+"""
+import bz2
+import gzip
+import io
+import lzma
+import os
+import queue
+import threading
+from typing import IO, Iterator, Optional
+
+# Magic bytes at the start of compressed files.
+MAGIC_BYTES = {
+    'gzip': b'\x1f\x8b',
+    'bz2': b'BZh',
+    'xz': b'\xfd7zXZ\x00',
+    'zstd': b'\x28\xb5\x2f\xfd',
+}
+
+# File name suffixes, used to choose the compression of written files.
+SUFFIXES = {
+    '.gz': 'gzip',
+    '.bz2': 'bz2',
+    '.xz': 'xz',
+    '.zst': 'zstd',
+}
+
+
+def detect_compression(filename: str) -> Optional[str]:
+    """
+    Detect the compression of a file by its first bytes.
+    :return: One of the keys of `MAGIC_BYTES` or `None` for uncompressed files.
+    """
+    with open(filename, 'rb') as f:
+        head = f.read(max(len(m) for m in MAGIC_BYTES.values()))
+    for compression, magic in MAGIC_BYTES.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def compression_from_suffix(filename: str) -> Optional[str]:
+    """
+    Get the compression for a file name by its suffix, `None` if it has no known suffix.
+    """
+    return SUFFIXES.get(os.path.splitext(filename)[1].lower())
+
+
+def _open_zstd(filename: str, mode: str) -> IO[bytes]:
+    try:
+        from compression import zstd
+        return zstd.open(filename, mode)
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstd compressed files require the 'zstandard' package.")
+    return zstandard.open(filename, mode)
+
+
+_openers = {
+    'gzip': gzip.open,
+    'bz2': bz2.open,
+    'xz': lzma.open,
+    'zstd': _open_zstd,
+}
+
+
+def _open_compressed(filename: str, mode: str, compression: str) -> IO[bytes]:
+    opener = _openers.get(compression)
+    if opener is None:
+        raise ValueError("Unknown compression: {}".format(compression))
+    return opener(filename, mode)
+
+
+def open_binary(filename: str, mode: str = 'rb', compression: Optional[str] = None) -> IO[bytes]:
+    """
+    Open a file in binary mode, decompressing or compressing it.
+    :param mode: 'rb' or 'wb'.
+    :param compression: Key of `MAGIC_BYTES` or `None` for no compression. Ignored when
+        reading, the compression is detected from the file content then.
+    """
+    if 'r' in mode:
+        compression = detect_compression(filename)
+    if compression is None:
+        return open(filename, mode)
+    return _open_compressed(filename, mode, compression)
+
+
+def open_text(filename: str, mode: str = 'r', compression: Optional[str] = None,
+              encoding: Optional[str] = None) -> IO[str]:
+    """
+    Open a file in text mode, decompressing or compressing it. See `open_binary`.
+    :param mode: 'r' or 'w'.
+    """
+    if 'r' in mode:
+        compression = detect_compression(filename)
+    if compression is None:
+        return open(filename, mode, encoding=encoding)
+    return io.TextIOWrapper(_open_compressed(filename, mode.replace('t', '') + 'b',
+                                             compression), encoding=encoding)
+
+
+def read_chunks_background(f: IO[str], chunk_size: int = 1 << 20,
+                           queue_size: int = 4) -> Iterator[str]:
+    """
+    Read a file in chunks on a background thread.
+    At most `queue_size` chunks are read ahead. Errors of the reader are raised by the
+    iterator. Closing the iterator early stops the thread.
+    :param f: File object opened in text mode.
+    :param chunk_size: Number of characters per chunk.
+    :return: Iterator over chunks.
+    """
+    chunks = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def reader():
+        try:
+            while True:
+                chunk = f.read(chunk_size)
+                if not put(chunk) or not chunk:
+                    return
+        except BaseException as e:
+            put(e)
+
+    thread = threading.Thread(target=reader, name='liberty-reader', daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if isinstance(chunk, BaseException):
+                raise chunk
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        stop.set()
+        thread.join()
+
+
+def test_compressed_files():
+    import tempfile
+    lib_file = os.path.join(os.path.dirname(__file__), '../test_data/gscl45nm.lib')
+    text = open(lib_file).read()
+    with tempfile.TemporaryDirectory() as d:
+        for compression in ['gzip', 'bz2', 'xz']:
+            # The suffix is not used for reading.
+            filename = os.path.join(d, 'lib_{}.lib'.format(compression))
+            with open_text(filename, 'w', compression) as f:
+                f.write(text)
+            assert detect_compression(filename) == compression
+            with open_text(filename) as f:
+                assert ''.join(read_chunks_background(f, chunk_size=1000)) == text
+        assert detect_compression(lib_file) is None
+        assert compression_from_suffix('a.lib.gz') == 'gzip'
+
+        # Early exit stops the reader thread.
+        with open_text(filename) as f:
+            chunks = read_chunks_background(f, chunk_size=100, queue_size=1)
+            next(chunks)
+            chunks.close()
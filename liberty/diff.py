@@ -0,0 +1,436 @@
+##
+## Copyright (c) 2019 Thomas Kramer.
+##
+## This file is part of liberty-parser
+## (see https://codeberg.org/tok/liberty-parser).
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Structural diff and merge of libraries.
+
+Content hashes (BLAKE2b digests of a canonical serialization) are computed for all groups
+bottom-up. Sub-groups of both libraries are matched by a key made of the group name, the
+arguments and, for groups which are usually not named such as `timing` and
+`internal_power`, the attributes identifying them. Matched groups with equal hashes are
+skipped without looking at their content. Numeric tables are compared element-wise with a
+tolerance.
+
+Example::
+
+    diff = diff_libraries(load_liberty('ss.lib'), load_liberty('ss_new.lib'), rtol=1e-6)
+    print(diff.changed_cells())
+    for change in diff.changes:
+        print(change)
+"""
+import hashlib
+import pickle
+import struct
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+import numpy as np
+from .arrays import TABLE_ATTRIBUTES
+from .types import Group, EscapedString, WithUnit, Define, to_table
+
+# Attributes which identify groups without arguments, by group name.
+IDENTIFYING_ATTRIBUTES = {
+    'timing': ('related_pin', 'timing_type', 'timing_sense', 'when'),
+    'internal_power': ('related_pin', 'when', 'related_pg_pin'),
+    'leakage_power': ('when', 'related_pg_pin'),
+}
+
+ADDED = 'added'
+REMOVED = 'removed'
+CHANGED = 'changed'
+
+
+class GroupKey(NamedTuple):
+    """
+    Key of a group among its siblings.
+    """
+    group_name: str
+    args: tuple
+    # Values of the `IDENTIFYING_ATTRIBUTES`.
+    identity: tuple
+    # Number of preceding siblings with the same key.
+    occurrence: int
+
+    def __str__(self):
+        s = '{}({})'.format(self.group_name, ', '.join(map(str, self.args)))
+        names = IDENTIFYING_ATTRIBUTES.get(self.group_name, ())
+        attributes = ['{}={}'.format(n, v) for n, v in zip(names, self.identity) if v is not None]
+        if attributes:
+            s += '[{}]'.format(', '.join(attributes))
+        if self.occurrence:
+            s += '#{}'.format(self.occurrence)
+        return s
+
+
+class Change(NamedTuple):
+    """
+    Difference between two libraries.
+    `attribute` is `None` for added and removed groups, `old` and `new` are the groups then.
+    Otherwise they are the lists of attribute values, `None` if the attribute is missing.
+    Changed `define` statements are reported with the attribute name 'define'.
+    """
+    kind: str
+    path: Tuple[GroupKey, ...]
+    attribute: Optional[str]
+    old: object
+    new: object
+
+    def __str__(self):
+        path = '/'.join(map(str, self.path))
+        if self.attribute is None:
+            return '{} {}'.format(self.kind, path)
+        return '{} {}: {}'.format(self.kind, path, self.attribute)
+
+
+def _value_key(value):
+    """
+    Convert an attribute value into a hashable and comparable key.
+    """
+    t = type(value)
+    if t is str or t is int or t is float:
+        return value
+    if t is EscapedString:
+        return '"', value.value
+    if t is list or t is tuple:
+        return tuple(_value_key(v) for v in value)
+    if t is np.ndarray:
+        return 'array', value.dtype.str, value.shape, value.tobytes()
+    if t is WithUnit:
+        return 'unit', _value_key(value.value), value.unit
+    if t is Define:
+        return 'define', value.attribute_name, value.group_name, value.attribute_type
+    return value
+
+
+def _identity_value(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, EscapedString):
+        return value.value
+    if isinstance(value, list):
+        return repr(value)
+    return str(value)
+
+
+def _sub_groups(group: Group) -> List[Group]:
+    """
+    Sub-groups without creating empty lists. Uses `groups` such that the cells of a
+    `LazyLibrary` are loaded.
+    """
+    return group.groups if group._groups else []
+
+
+def _child_keys(group: Group) -> Dict[GroupKey, Group]:
+    keys = dict()
+    counts = dict()
+    for g in _sub_groups(group):
+        names = IDENTIFYING_ATTRIBUTES.get(g.group_name, ())
+        base = (g.group_name, tuple(_identity_value(a) for a in g.args),
+                tuple(_identity_value(g.get(n)) for n in names))
+        n = counts.get(base, 0)
+        counts[base] = n + 1
+        keys[GroupKey(*base, n)] = g
+    return keys
+
+
+def _update_digest(h, key):
+    """
+    Feed a value key (see `_value_key`) into a hash in an unambiguous serialization.
+    """
+    t = type(key)
+    if t is tuple:
+        h.update(b'(%d:' % len(key))
+        for k in key:
+            _update_digest(h, k)
+    elif t is str:
+        data = key.encode('utf-8', 'surrogatepass')
+        h.update(b's%d:' % len(data))
+        h.update(data)
+    elif t is bytes:
+        h.update(b'b%d:' % len(key))
+        h.update(key)
+    elif t is int:
+        h.update(b'i%d;' % key)
+    elif t is float:
+        h.update(b'f' + struct.pack('<d', key))
+    else:
+        data = '{}:{!r}'.format(t.__qualname__, key).encode('utf-8', 'surrogatepass')
+        h.update(b'r%d:' % len(data))
+        h.update(data)
+
+
+class _Hasher:
+    """
+    Content digests (BLAKE2b) of groups, memoized by object identity.
+    Groups with equal digests are treated as equal.
+    """
+
+    def __init__(self):
+        self._digests: Dict[int, bytes] = dict()
+        # Keeps the groups alive such that their ids are not reused.
+        self._groups: List[Group] = []
+
+    def __call__(self, group: Group) -> bytes:
+        digest = self._digests.get(id(group))
+        if digest is None:
+            h = hashlib.blake2b(digest_size=20)
+            _update_digest(h, (group.group_name,
+                               _value_key(group.args),
+                               tuple((name, _value_key(values)) for name, values in
+                                     group.attributes.items()),
+                               _value_key(group._defines or [])))
+            for g in _sub_groups(group):
+                h.update(self(g))
+            digest = h.digest()
+            self._digests[id(group)] = digest
+            self._groups.append(group)
+        return digest
+
+
+class LibraryDiff:
+    """
+    Result of `diff_libraries`.
+    """
+
+    def __init__(self, changes: List[Change]):
+        self.changes = changes
+
+    def __len__(self):
+        return len(self.changes)
+
+    def __bool__(self):
+        return bool(self.changes)
+
+    def __iter__(self):
+        return iter(self.changes)
+
+    def __str__(self):
+        return '\n'.join(map(str, self.changes))
+
+    def _paths(self, depth: int, group_names: Tuple[str, ...]):
+        result = set()
+        for c in self.changes:
+            path = c.path
+            if len(path) >= depth and \
+                    all(k.group_name == n for k, n in zip(path[:depth], group_names)):
+                result.add(path[:depth])
+        return result
+
+    def changed_cells(self) -> List[str]:
+        """
+        Names of added, removed or changed cells.
+        """
+        return sorted({p[1].args[0] for p in self._paths(2, ('library', 'cell'))})
+
+    def changed_pins(self) -> List[Tuple[str, str]]:
+        """
+        `(cell, pin)` of added, removed or changed pins.
+        """
+        return sorted({(p[1].args[0], p[2].args[0])
+                       for p in self._paths(3, ('library', 'cell', 'pin'))})
+
+    def changed_arcs(self) -> List[Tuple[str, str, Optional[str], Optional[str]]]:
+        """
+        `(cell, pin, related_pin, timing_type)` of added, removed or changed timing arcs.
+        """
+        return sorted({(p[1].args[0], p[2].args[0]) + p[3].identity[:2]
+                       for p in self._paths(4, ('library', 'cell', 'pin', 'timing'))},
+                      key=lambda arc: tuple('' if v is None else v for v in arc))
+
+
+class _Differ:
+
+    def __init__(self, rtol: float, atol: float):
+        self.rtol = rtol
+        self.atol = atol
+        self.hash = _Hasher()
+        self.changes: List[Change] = []
+
+    def _equal_values(self, name: str, a: list, b: list) -> bool:
+        if _value_key(a) == _value_key(b):
+            return True
+        if len(a) != len(b):
+            return False
+        for x, y in zip(a, b):
+            if name in TABLE_ATTRIBUTES:
+                x = to_table(x)
+                y = to_table(y)
+            if isinstance(x, np.ndarray) and isinstance(y, np.ndarray):
+                if x.shape != y.shape or \
+                        not np.allclose(x, y, rtol=self.rtol, atol=self.atol, equal_nan=True):
+                    return False
+            elif isinstance(x, (int, float)) and isinstance(y, (int, float)):
+                if abs(x - y) > self.atol + self.rtol * abs(y):
+                    return False
+            elif _value_key(x) != _value_key(y):
+                return False
+        return True
+
+    def diff(self, a: Group, b: Group, path: Tuple[GroupKey, ...]):
+        for name, values in a.attributes.items():
+            other = b.attributes.get(name)
+            if other is None or not self._equal_values(name, values, other):
+                self.changes.append(Change(CHANGED, path, name, values, other))
+        for name, values in b.attributes.items():
+            if name not in a.attributes:
+                self.changes.append(Change(CHANGED, path, name, None, values))
+        if _value_key(a._defines or []) != _value_key(b._defines or []):
+            self.changes.append(Change(CHANGED, path, 'define', a._defines, b._defines))
+
+        children_b = _child_keys(b)
+        for key, child_a in _child_keys(a).items():
+            child_b = children_b.pop(key, None)
+            if child_b is None:
+                self.changes.append(Change(REMOVED, path + (key,), None, child_a, None))
+            elif self.hash(child_a) != self.hash(child_b):
+                self.diff(child_a, child_b, path + (key,))
+        for key, child_b in children_b.items():
+            self.changes.append(Change(ADDED, path + (key,), None, None, child_b))
+
+
+def _root_key(group: Group) -> GroupKey:
+    return GroupKey(group.group_name, tuple(_identity_value(a) for a in group.args), (), 0)
+
+
+def diff_libraries(old: Group, new: Group, rtol: float = 0.0, atol: float = 0.0) -> LibraryDiff:
+    """
+    Compare two libraries structurally.
+    Numbers and numeric tables are equal if `|old - new| <= atol + rtol * |new|`
+    element-wise. Identical sub-trees are skipped by their content hash.
+    :param old: Library group.
+    :param new: Library group.
+    :param rtol: Relative tolerance.
+    :param atol: Absolute tolerance.
+    :return: `LibraryDiff` with the changes from `old` to `new`.
+    """
+    differ = _Differ(rtol, atol)
+    if differ.hash(old) != differ.hash(new):
+        differ.diff(old, new, (_root_key(old),))
+    return LibraryDiff(differ.changes)
+
+
+# Signature of conflict resolution: resolve(path, attribute, value in base, value in other)
+# returns the list of values to keep.
+Resolve = Callable[[Tuple[GroupKey, ...], str, list, list], list]
+
+
+def _copy_value(value):
+    """
+    Copy the mutable parts of an attribute value, such that `other` is not shared with
+    the merged library.
+    """
+    if isinstance(value, list):
+        return [_copy_value(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return value.copy()
+    return value
+
+
+def _merge_into(target: Group, other: Group, path: Tuple[GroupKey, ...], hasher: _Hasher,
+                resolve: Optional[Resolve]):
+    for name, values in other.attributes.items():
+        current = target.attributes.get(name)
+        if current is None:
+            target.attributes[name] = _copy_value(values)
+        elif _value_key(current) != _value_key(values):
+            target.attributes[name] = _copy_value(values) if resolve is None \
+                else _copy_value(resolve(path, name, current, values))
+    if other._defines:
+        defines = target.defines
+        existing = {_value_key(d) for d in defines}
+        defines.extend(d for d in other._defines if _value_key(d) not in existing)
+
+    children = _child_keys(target)
+    added = []
+    for key, child_other in _child_keys(other).items():
+        child = children.get(key)
+        if child is None:
+            added.append(child_other)
+        elif hasher(child) != hasher(child_other):
+            _merge_into(child, child_other, path + (key,), hasher, resolve)
+    if added:
+        target.groups.extend(pickle.loads(pickle.dumps(added, pickle.HIGHEST_PROTOCOL)))
+
+
+def merge_libraries(base: Group, other: Group, resolve: Optional[Resolve] = None) -> Group:
+    """
+    Merge two libraries, e.g. cells of several releases or corners.
+    Groups of `other` which are not in `base` are added. Matched groups are merged
+    recursively, attributes only in `other` are added.
+    :param base: Library group, not modified.
+    :param other: Library group, not modified.
+    :param resolve: Called for attributes with different values. By default the value of
+        `other` is taken.
+    :return: The merged library.
+    """
+    # Copying with pickle is much faster than `copy.deepcopy` for large trees.
+    merged = pickle.loads(pickle.dumps(base, pickle.HIGHEST_PROTOCOL))
+    _merge_into(merged, other, (_root_key(merged),), _Hasher(), resolve)
+    return merged
+
+
+def test_diff_libraries():
+    import os.path
+    from .parser import load_liberty
+    from .types import select_cell
+    lib_file = os.path.join(os.path.dirname(__file__), '../test_data/gscl45nm.lib')
+    a = load_liberty(lib_file, engine='fast')
+    b = load_liberty(lib_file, engine='fast', table_dtype=np.float64)
+    assert not diff_libraries(a, b)
+
+    select_cell(b, 'INVX1')['area'] = 100
+    timing = select_cell(b, 'XOR2X1').get_group('pin', 'Y') \
+        .get_groups_by_attribute('timing', 'related_pin', 'A')[0]
+    values = timing.get_group('cell_rise').get_array('values')
+    values[0, 0] += 1e-9
+    b.groups.remove(select_cell(b, 'AND2X1'))
+
+    diff = diff_libraries(a, b, rtol=1e-6)
+    assert diff.changed_cells() == ['AND2X1', 'INVX1']
+    assert sorted(c.kind for c in diff) == [CHANGED, REMOVED]
+    values[0, 0] += 1
+    diff = diff_libraries(a, b, rtol=1e-6)
+    assert diff.changed_cells() == ['AND2X1', 'INVX1', 'XOR2X1']
+    assert diff.changed_arcs() == [('XOR2X1', 'Y', 'A', timing.get('timing_type'))]
+    assert diff.changed_pins() == [('XOR2X1', 'Y')]
+
+    merged = merge_libraries(b, a)
+    assert select_cell(merged, 'AND2X1') is not None
+    assert select_cell(merged, 'INVX1')['area'] == select_cell(a, 'INVX1')['area']
+    assert b.get_groups('cell', 'AND2X1') == []
+    assert not diff_libraries(a, merged, atol=1e-12)
+
+    # Values with equal Python hashes (hash(-1) == hash(-2)).
+    from .fast_parser import parse_liberty_fast
+    x = parse_liberty_fast('library(l) { cell(X) { area : -1; leakage : 1; } }')
+    y = parse_liberty_fast('library(l) { cell(X) { area : -2; leakage : 2; } }')
+    assert len(diff_libraries(x, y)) == 2
+    conflicts = []
+    merged = merge_libraries(x, y, resolve=lambda p, n, a, b: conflicts.append(n) or b)
+    assert sorted(conflicts) == ['area', 'leakage']
+    # The merged library does not share values with the inputs.
+    merged.get_group('cell', 'X').attributes['leakage'].append(3)
+    assert y.get_group('cell', 'X')['leakage'] == 2
+
+    # Cells of lazy libraries are loaded.
+    from .lazy import load_liberty_lazy
+    lazy_a = load_liberty_lazy(lib_file)
+    lazy_b = load_liberty_lazy(lib_file)
+    select_cell(lazy_b, 'INVX1')['area'] = 100
+    assert diff_libraries(lazy_a, lazy_b).changed_cells() == ['INVX1']
+    merged = merge_libraries(load_liberty_lazy(lib_file), lazy_b)
+    assert select_cell(merged, 'INVX1')['area'] == 100
@@ -0,0 +1,400 @@
+##
+## Copyright (c) 2019 Thomas Kramer.
+##
+## This file is part of liberty-parser
+## (see https://codeberg.org/tok/liberty-parser).
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Hand-written tokenizer and recursive-descent parser for liberty files.
+
+This is an alternative to the Lark based parser in `liberty.parser`. It accepts the same
+grammar and builds the same `Group` structure but creates the groups directly while
+scanning the tokens. No intermediate parse tree is built. The tokenizer works on a stream
+of text chunks, hence files can be parsed without reading them into memory at once.
+"""
+import re
+import sys
+from typing import IO, Any, Iterable, Iterator, List, Tuple
+from .types import Group, Define, WithUnit, EscapedString, to_table
+from .arrays import TABLE_ATTRIBUTES
+
+# Whitespace, comments and escaped line breaks are skipped in front of every token.
+_skip = r'(?:\s+|/\*[^*]*\*+(?:[^/*][^*]*\*+)*/|\\(?=\r?\n))*'
+_name = r'[A-Za-z_][A-Za-z_0-9]*'
+_number = r'[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?'
+_string = r'"[^"\\\n]*(?:\\[\s\S][^"\\\n]*)*"'
+_punctuation = r'[(){},;:]'
+
+_string_regex = re.compile(_string)
+
+# Group 1: a valid token. Group 2: any other character. Neither: end of input.
+_token_regex = re.compile(r'{}(?:({}|{}|{}|{})|([\s\S])|\Z)'
+                          .format(_skip, _name, _number, _string, _punctuation))
+
+# Tokens ending closer than this to the end of a chunk are deferred to the next chunk
+# because they might continue there.
+_lookahead = 64
+
+_name_start = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz_')
+
+_eof = ''
+
+# Names of groups, attributes and values repeat a lot. Share one string object per name.
+intern = sys.intern
+
+
+# Event types generated by `parse_events`.
+START_GROUP = 'start_group'
+END_GROUP = 'end_group'
+ATTRIBUTE = 'attribute'
+DEFINE = 'define'
+
+
+class LibertySyntaxError(Exception):
+    pass
+
+
+def tokenize(chunks: Iterable[str]) -> Iterator[str]:
+    """
+    Split liberty text into tokens.
+    Comments and whitespace are dropped. The type of a token can be derived from its
+    first character.
+    :param chunks: Liberty text. Either a string or an iterable of string chunks.
+    :return: Iterator over token strings.
+    """
+    if isinstance(chunks, str):
+        chunks = [chunks]
+    chunks = iter(chunks)
+
+    buf = ''
+    line = 1
+    eof = False
+    while not eof:
+        chunk = next(chunks, None)
+        if chunk is None:
+            eof = True
+        else:
+            buf += chunk
+            if len(buf) < _lookahead:
+                continue
+
+        limit = len(buf) if eof else len(buf) - _lookahead
+        pos = 0
+        for m in _token_regex.finditer(buf):
+            if m.end() > limit and not eof:
+                # Token might be incomplete.
+                break
+            kind = m.lastindex
+            if kind == 1:
+                yield m.group(1)
+            elif kind == 2:
+                start = m.start(2)
+                if not eof and _may_continue(buf, start):
+                    # A string or a comment that ends in a later chunk.
+                    break
+                line += buf.count('\n', 0, start)
+                raise LibertySyntaxError("Unexpected character {!r} on line {}."
+                                         .format(m.group(2), line))
+            pos = m.end()
+        if eof:
+            # Only whitespace and comments are left.
+            pos = len(buf)
+        line += buf.count('\n', 0, pos)
+        buf = buf[pos:]
+
+
+def _may_continue(buf: str, start: int) -> bool:
+    """
+    Check if the unmatched character at `start` starts a string or comment which is not
+    terminated within the buffer.
+    """
+    if buf.startswith('"', start):
+        # Escaped quotes do not terminate the string.
+        return _string_regex.match(buf, start) is None
+    if buf.startswith('/*', start):
+        return buf.find('*/', start + 2) < 0
+    return buf.endswith('/')
+
+
+def _convert_number(s: str):
+    if '.0' == s[-2:]:
+        return int(s[:-2])
+    elif '.' not in s:
+        try:
+            return int(s)
+        except ValueError:
+            # Exponential notation without a decimal point.
+            return float(s)
+    return float(s)
+
+
+class _Parser:
+    """
+    Recursive-descent parser that consumes tokens from `tokenize`.
+    """
+
+    def __init__(self, tokens: Iterator[str], table_dtype=None, interner=None):
+        self._next = iter(tokens).__next__
+        # Convert numeric tables into arrays of this type if not `None`.
+        self._table_dtype = table_dtype
+        # `liberty.interning.TableInterner` sharing repeated tables, or `None`.
+        self._interner = interner
+
+    def _read(self) -> str:
+        try:
+            return self._next()
+        except StopIteration:
+            return _eof
+
+    def _expect(self, expected: str, actual: str):
+        if actual != expected:
+            self._unexpected(actual, repr(expected))
+
+    @staticmethod
+    def _unexpected(token: str, expected: str):
+        if token == _eof:
+            raise LibertySyntaxError("Unexpected end of input, expected {}.".format(expected))
+        raise LibertySyntaxError("Unexpected token {!r}, expected {}.".format(token, expected))
+
+    def _value(self, tok: str):
+        """
+        Parse a value starting with `tok`.
+        :return: Tuple of the value and the first token after the value.
+        """
+        c = tok[:1]
+        if c in _name_start:
+            return intern(tok), self._read()
+        if c == '"':
+            return EscapedString(tok[1:-1].replace('\\"', '"')), self._read()
+        if c == '' or c in '(){},;:':
+            self._unexpected(tok, 'a value')
+        num = _convert_number(tok)
+        tok = self._read()
+        if tok[:1] in _name_start:
+            # Number with unit.
+            return WithUnit(num, tok), self._read()
+        return num, tok
+
+    def _argument_list(self) -> List:
+        """
+        Parse argument list after the opening parenthesis.
+        """
+        args = []
+        tok = self._read()
+        if tok == ')':
+            return args
+        while True:
+            value, tok = self._value(tok)
+            args.append(value)
+            if tok == ')':
+                return args
+            self._expect(',', tok)
+            tok = self._read()
+
+    def _define(self) -> Define:
+        """
+        Parse a `define` statement after the opening parenthesis.
+        """
+        args = self._argument_list()
+        if len(args) != 3 or not all(isinstance(a, str) for a in args):
+            raise LibertySyntaxError("'define' takes exactly three names, got {}.".format(args))
+        self._expect(';', self._read())
+        return Define(*args)
+
+    def _group_body(self, group_name: str, args: List) -> Group:
+        """
+        Parse the statements of a group after the opening brace.
+        """
+        attrs = dict()
+        sub_groups = []
+        defines = []
+        read = self._read
+        while True:
+            name = read()
+            if name == '}':
+                return Group(group_name, args, attrs, sub_groups, defines)
+            if name[:1] not in _name_start:
+                self._unexpected(name, 'a statement or \'}\'')
+            name = intern(name)
+            tok = read()
+            if tok == ':':
+                # Simple attribute.
+                value, tok = self._value(read())
+                self._expect(';', tok)
+            elif tok == '(':
+                if name == 'define':
+                    defines.append(self._define())
+                    continue
+                value = self._argument_list()
+                tok = read()
+                if tok == '{':
+                    sub_groups.append(self._group_body(name, value))
+                    continue
+                # Complex attribute.
+                self._expect(';', tok)
+                if name in TABLE_ATTRIBUTES:
+                    if self._table_dtype is not None:
+                        value = to_table(value, self._table_dtype)
+                    if self._interner is not None:
+                        value = self._interner.intern(value)
+            else:
+                self._unexpected(tok, "':' or '('")
+
+            values = attrs.get(name)
+            if values is None:
+                attrs[name] = [value]
+            else:
+                values.append(value)
+
+    def _start(self):
+        """
+        Parse the head of the top-level group.
+        :return: Tuple of group name and arguments.
+        """
+        name = self._read()
+        if name[:1] not in _name_start:
+            self._unexpected(name, 'a group name')
+        name = intern(name)
+        self._expect('(', self._read())
+        args = self._argument_list()
+        self._expect('{', self._read())
+        return name, args
+
+    def _end(self):
+        tok = self._read()
+        if tok != _eof:
+            self._unexpected(tok, 'end of input')
+
+    def parse(self) -> Group:
+        name, args = self._start()
+        group = self._group_body(name, args)
+        self._end()
+        return group
+
+    def events(self) -> Iterator[Tuple[str, Any, Any]]:
+        """
+        Parse the tokens and generate events instead of building groups.
+        See `parse_events`.
+        """
+        read = self._read
+        name, args = self._start()
+        stack = [name]
+        yield START_GROUP, name, args
+        while stack:
+            name = read()
+            if name == '}':
+                yield END_GROUP, stack.pop(), None
+                continue
+            if name[:1] not in _name_start:
+                self._unexpected(name, 'a statement or \'}\'')
+            name = intern(name)
+            tok = read()
+            if tok == ':':
+                value, tok = self._value(read())
+                self._expect(';', tok)
+            elif tok == '(':
+                if name == 'define':
+                    yield DEFINE, name, self._define()
+                    continue
+                value = self._argument_list()
+                tok = read()
+                if tok == '{':
+                    stack.append(name)
+                    yield START_GROUP, name, value
+                    continue
+                self._expect(';', tok)
+            else:
+                self._unexpected(tok, "':' or '('")
+            yield ATTRIBUTE, name, value
+        self._end()
+
+
+def read_chunks(f: IO[str], chunk_size: int = 1 << 20) -> Iterator[str]:
+    """
+    Read a text file in chunks.
+    :param f: File object opened in text mode.
+    :param chunk_size: Number of characters per chunk.
+    :return: Iterator over chunks.
+    """
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def parse_liberty_fast(data: Iterable[str], table_dtype=None, interner=None) -> Group:
+    """
+    Parse liberty data with the hand-written parser.
+    :param data: Raw liberty string or an iterable of string chunks.
+    :param table_dtype: If not `None`, numeric tables are stored as 2D NumPy arrays of
+        this type instead of lists of strings. See `Group.convert_tables`.
+    :param interner: `liberty.interning.TableInterner` sharing repeated tables.
+    :return: `Group` object of library.
+    """
+    return _Parser(tokenize(data), table_dtype, interner).parse()
+
+
+def parse_events(data: Iterable[str]) -> Iterator[Tuple[str, Any, Any]]:
+    """
+    Parse liberty data into a stream of events instead of a `Group` tree.
+    Each event is a tuple `(event_type, name, value)`:
+
+    * `(START_GROUP, group_name, args)` when a group is opened,
+    * `(ATTRIBUTE, attribute_name, value)` for simple and complex attributes,
+    * `(DEFINE, 'define', Define)` for `define` statements,
+    * `(END_GROUP, group_name, None)` when a group is closed.
+
+    Values are the same as in the `Group` tree created by `parse_liberty_fast`.
+    :param data: Raw liberty string or an iterable of string chunks.
+    :return: Iterator over events.
+    """
+    return _Parser(tokenize(data)).events()
+
+
+def test_tokenize():
+    data = 'a(b) { /* comment */ x : 1.5ns; y : "s\\"t"; \\\n z(1, -2e-3); }'
+    expected = ['a', '(', 'b', ')', '{', 'x', ':', '1.5', 'ns', ';', 'y', ':', '"s\\"t"', ';',
+                'z', '(', '1', ',', '-2e-3', ')', ';', '}']
+    assert list(tokenize(data)) == expected
+    # Token boundaries must not depend on the chunking.
+    for size in [1, 2, 3, 7]:
+        chunks = [data[i:i + size] for i in range(0, len(data), size)]
+        assert list(tokenize(chunks)) == expected
+
+
+def test_parse_liberty_fast():
+    import os.path
+    from .parser import parse_liberty
+    lib_file = os.path.join(os.path.dirname(__file__), '../test_data/gscl45nm.lib')
+    data = open(lib_file).read()
+
+    expected = parse_liberty(data)
+    library = parse_liberty_fast(data)
+
+    assert repr(library) == repr(expected)
+    assert str(library) == str(expected)
+
+    chunks = [data[i:i + 4096] for i in range(0, len(data), 4096)]
+    assert str(parse_liberty_fast(chunks)) == str(expected)
+
+    # A string with an escaped quote crossing chunk boundaries.
+    data = 'library(l) {{ {} s : "a\\"b\\"{}"; }}'.format(' ' * 100, 'c' * 200)
+    expected = parse_liberty(data)
+    assert expected['s'].value == 'a"b"' + 'c' * 200
+    for size in [64, 100, 110, 111, 128]:
+        chunks = [data[i:i + size] for i in range(0, len(data), size)]
+        assert str(parse_liberty_fast(chunks)) == str(expected)
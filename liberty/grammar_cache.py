@@ -0,0 +1,95 @@
+##
+## Copyright (c) 2019 Thomas Kramer.
+## 
+## This file is part of liberty-parser 
+## (see https://codeberg.org/tok/liberty-parser).
+## 
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+## 
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+## 
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Process wide cache of compiled Lark parsers.
+
+Compiling a grammar into LALR tables is much more expensive than parsing a typical
+function string or a small library. Parsers are therefore built once per grammar and
+shared between all callers. Additionally the compiled tables are stored on disk with
+Lark's own grammar cache such that later processes can skip the grammar analysis.
+"""
+import os
+import threading
+from typing import Dict, Tuple
+from lark import Lark, Transformer
+
+# Directory of the on-disk grammar cache. `None` means the system temp directory.
+# Set the environment variable to an empty string to disable the on-disk cache.
+CACHE_DIR_ENV = 'LIBERTY_PARSER_CACHE_DIR'
+
+_parsers: Dict[Tuple[str, type], Lark] = dict()
+_lock = threading.Lock()
+
+
+def _cache_option(grammar_name: str):
+    cache_dir = os.environ.get(CACHE_DIR_ENV)
+    if cache_dir is None:
+        return True
+    if cache_dir == '':
+        return False
+    return os.path.join(cache_dir, '.lark_cache_{}.tmp'.format(grammar_name))
+
+
+def _build_parser(grammar: str, grammar_name: str, transformer: Transformer) -> Lark:
+    options = dict(parser='lalr',
+                   lexer='standard',
+                   transformer=transformer)
+    cache = _cache_option(grammar_name)
+    if cache:
+        try:
+            return Lark(grammar, cache=cache, **options)
+        except OSError:
+            # Cache location is not writable. Fall through and compile without cache.
+            pass
+    return Lark(grammar, **options)
+
+
+def get_lalr_parser(grammar: str, grammar_name: str, transformer_class: type) -> Lark:
+    """
+    Get a LALR parser for `grammar` with an embedded transformer.
+    The parser is compiled only once per process and is then shared between threads.
+    The transformer must therefore be stateless.
+    :param grammar: Lark grammar string.
+    :param grammar_name: Short name of the grammar, used for naming the on-disk cache file.
+    :param transformer_class: Class of the `Transformer` applied while parsing. `None` for a
+        parser which returns the parse tree.
+    :return: Lark parser.
+    """
+    key = (grammar, transformer_class)
+    parser = _parsers.get(key)
+    if parser is None:
+        with _lock:
+            parser = _parsers.get(key)
+            if parser is None:
+                transformer = transformer_class() if transformer_class is not None else None
+                parser = _build_parser(grammar, grammar_name, transformer)
+                _parsers[key] = parser
+    return parser
+
+
+def test_get_lalr_parser():
+    grammar = r"""
+        start: WORD
+        %import common.WORD
+    """
+    p1 = get_lalr_parser(grammar, 'test', Transformer)
+    p2 = get_lalr_parser(grammar, 'test', Transformer)
+    assert p1 is p2
+    assert p1.parse('abc').children == ['abc']
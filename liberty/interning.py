@@ -0,0 +1,156 @@
+##
+## Copyright (c) 2019 Thomas Kramer.
+##
+## This file is part of liberty-parser
+## (see https://codeberg.org/tok/liberty-parser).
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Sharing of repeated tables.
+
+Index vectors and often whole value tables repeat across thousands of timing and power
+groups and templates. Interning keeps one instance per distinct table:
+
+* Array tables (see `Group.convert_tables`) are shared as one read-only array. Writing into
+  a shared array raises an error; modify a copy and store it with `set_array`, which
+  replaces the attribute value of this group only (copy-on-write).
+* Text tables keep a list per occurrence but share the row strings.
+
+Interning can run while parsing (`load_liberty(..., intern_tables=True)`) or afterwards
+with `intern_tables`.
+"""
+import sys
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from .arrays import TABLE_ATTRIBUTES
+from .types import Group, EscapedString
+
+
+class TableInterner:
+    """
+    Table cache and statistics of an interning pass.
+    """
+
+    def __init__(self):
+        # (dtype, shape, hash of the data) -> distinct arrays.
+        self._arrays: Dict[Tuple, List[np.ndarray]] = dict()
+        # Row texts -> shared rows.
+        self._rows: Dict[Tuple[str, ...], Tuple[EscapedString, ...]] = dict()
+        # Number of tables seen.
+        self.tables = 0
+        # Number of distinct tables.
+        self.distinct = 0
+        # Estimated bytes of the dropped duplicates.
+        self.saved_bytes = 0
+
+    def intern(self, value):
+        """
+        Get the shared instance of a table.
+        :param value: Value of a table attribute. Values which are not tables are returned
+            unchanged.
+        """
+        if type(value) is np.ndarray:
+            return self._intern_array(value)
+        if type(value) is list and value and all(type(r) is EscapedString for r in value):
+            return self._intern_rows(value)
+        return value
+
+    def _intern_array(self, array: np.ndarray) -> np.ndarray:
+        self.tables += 1
+        key = (array.dtype.str, array.shape, hash(array.tobytes()))
+        candidates = self._arrays.get(key)
+        if candidates is None:
+            candidates = self._arrays[key] = []
+        for shared in candidates:
+            if np.array_equal(shared, array):
+                self.saved_bytes += array.nbytes
+                return shared
+        array.flags.writeable = False
+        candidates.append(array)
+        self.distinct += 1
+        return array
+
+    def _intern_rows(self, rows: List[EscapedString]) -> List[EscapedString]:
+        self.tables += 1
+        key = tuple(r.value for r in rows)
+        shared = self._rows.get(key)
+        if shared is None:
+            self._rows[key] = tuple(rows)
+            self.distinct += 1
+            return rows
+        self.saved_bytes += sum(sys.getsizeof(r) + sys.getsizeof(r.value) for r in rows)
+        return list(shared)
+
+    def as_dict(self) -> Dict:
+        return {'tables': self.tables, 'distinct': self.distinct,
+                'saved_bytes': self.saved_bytes}
+
+    def __str__(self):
+        return "{} tables, {} distinct, {:.1f} MB saved".format(
+            self.tables, self.distinct, self.saved_bytes / 1e6)
+
+
+def intern_tables(group: Group, interner: Optional[TableInterner] = None) -> TableInterner:
+    """
+    Share repeated tables of a group and all its sub-groups.
+    :param interner: Interner to use, e.g. to share tables between libraries.
+        A new one if `None`.
+    :return: The interner, holding the statistics.
+    """
+    if interner is None:
+        interner = TableInterner()
+    intern = interner.intern
+    stack = [group]
+    while stack:
+        g = stack.pop()
+        attributes = g.attributes
+        for name in TABLE_ATTRIBUTES.intersection(attributes):
+            attributes[name] = [intern(v) for v in attributes[name]]
+        if g._groups:
+            stack.extend(g._groups)
+    return interner
+
+
+def test_intern_tables():
+    import os.path
+    from .fast_parser import parse_liberty_fast
+    lib_file = os.path.join(os.path.dirname(__file__), '../test_data/gscl45nm.lib')
+    data = open(lib_file).read()
+    expected = str(parse_liberty_fast(data))
+
+    for dtype in [None, np.float64]:
+        library = parse_liberty_fast(data, dtype)
+        interner = intern_tables(library)
+        assert interner.distinct < interner.tables and interner.saved_bytes > 0
+        assert str(library) == expected or dtype is not None
+
+    # Copy-on-write of shared arrays.
+    from .query import select
+    tables = select(library, 'cell/pin/timing/cell_rise')
+    index = tables[0].get_array('index_1')
+    shared = [t for t in tables[1:] if t.get_array('index_1') is index]
+    assert shared and not index.flags.writeable
+    try:
+        index[0, 0] = 1
+        assert False
+    except ValueError:
+        pass
+    tables[0].set_array('index_1', index + 1)
+    assert shared[0].get_array('index_1') is index
+    assert np.array_equal(tables[0].get_array('index_1'), index + 1)
+
+    # While parsing.
+    library = parse_liberty_fast(data, np.float64, interner=TableInterner())
+    assert str(library) == str(parse_liberty_fast(data, np.float64))
@@ -0,0 +1,222 @@
+##
+## Copyright (c) 2019 Thomas Kramer.
+## 
+## This file is part of liberty-parser 
+## (see https://codeberg.org/tok/liberty-parser).
+## 
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+## 
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+## 
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Lark based liberty parser.
+
+Kept in its own module such that Lark is only imported when the 'lark' engine is used.
+"""
+import sys
+import time
+from functools import lru_cache
+from lark import Token, Transformer
+from .types import EscapedString, WithUnit, Define, Group
+from .fast_parser import _convert_number
+
+# Names, numbers and strings are terminals without a rule of their own. They are converted
+# by the callbacks of the enclosing rules, which saves a reduction per token.
+liberty_grammar = r"""
+    ?start: group
+    
+    group: CNAME argument_list group_body
+    group_body: "{" (statement)* "}"
+    
+    argument_list: "(" [value ("," value)*] ")"
+    
+    ?statement: attribute ";"
+        | group
+        | define ";"
+        
+    ?value: CNAME
+        | SIGNED_NUMBER
+        | SIGNED_NUMBER CNAME -> number_with_unit
+        | numbers
+        | ESCAPED_STRING
+        
+    numbers: "\"" [SIGNED_NUMBER ("," SIGNED_NUMBER)*] "\""
+        
+    ?attribute: simple_attribute
+        | complex_attribute
+        
+    simple_attribute: CNAME ":" value
+    
+    complex_attribute: CNAME argument_list
+    
+    define: "define" "(" CNAME "," CNAME "," CNAME ")"
+    
+    COMMENT: /\/\*(\*(?!\/)|[^*])*\*\//
+    NEWLINE: /\\?\r?\n/
+    
+    %import common.WORD
+    %import common.ESCAPED_STRING
+    %import common.CNAME
+    %import common.SIGNED_NUMBER
+    %import common.WS
+    
+    %ignore WS
+    %ignore COMMENT
+    %ignore NEWLINE
+"""
+
+# Numeric tokens repeat a lot (indices, capacitances, zeros), hence conversions are memoized.
+_convert_number = lru_cache(maxsize=1 << 14)(_convert_number)
+
+
+def _name(token: Token) -> str:
+    return sys.intern(token[:])
+
+
+def _escaped_string(token: Token) -> EscapedString:
+    return EscapedString(token[1:-1].replace('\\"', '"'))
+
+
+# Conversion of value tokens by terminal name.
+_converters = {
+    'CNAME': _name,
+    'SIGNED_NUMBER': _convert_number,
+    'ESCAPED_STRING': _escaped_string,
+}
+
+
+def _value(value):
+    if type(value) is Token:
+        return _converters[value.type](value)
+    return value
+
+
+class LibertyTransformer(Transformer):
+    """
+    Builds `Group` objects while parsing.
+    Callbacks take the list of children instead of unpacking them (`v_args(inline=True)`),
+    which saves a wrapper call per node. Attributes are passed to `group` as
+    `(name, value)` tuples, which are told apart from groups and defines by their exact type.
+    """
+
+    def __init__(self):
+        # There are no callbacks for terminals. Skips looking up one for every token when
+        # transforming a parse tree.
+        super().__init__(visit_tokens=False)
+
+    def group_body(self, children):
+        return children
+
+    def number_with_unit(self, children):
+        number, unit = children
+        return WithUnit(_convert_number(number), unit[:])
+
+    def simple_attribute(self, children):
+        name, value = children
+        return sys.intern(name[:]), _value(value)
+
+    def complex_attribute(self, children):
+        name, arg_list = children
+        return sys.intern(name[:]), arg_list
+
+    def define(self, children):
+        """
+        :param children: Attribute name, group name and attribute type
+            (boolean, string, integer or float).
+        :return:
+        """
+        return Define(*map(_name, children))
+
+    def argument_list(self, children):
+        return [_value(c) for c in children]
+
+    def group(self, children):
+        group_name, group_args, body = children
+        attrs = dict()
+        sub_groups = []
+        defines = None
+        for a in body:
+            t = type(a)
+            if t is tuple:
+                name, value = a
+                values = attrs.get(name)
+                if values is None:
+                    attrs[name] = [value]
+                else:
+                    values.append(value)
+            elif t is Group:
+                sub_groups.append(a)
+            elif t is Define:
+                if defines is None:
+                    defines = []
+                defines.append(a)
+            else:
+                raise TypeError("Unexpected statement in group body: {!r}".format(a))
+
+        return Group(_name(group_name), group_args, attrs, sub_groups, defines)
+
+
+def _timed_callback(name: str):
+    callback = getattr(LibertyTransformer, name)
+
+    def f(self, children):
+        start = time.perf_counter()
+        try:
+            return callback(self, children)
+        finally:
+            self.stats.add_time('lark.transform.' + name, time.perf_counter() - start)
+
+    f.__name__ = name
+    return f
+
+
+_callback_names = ['group_body', 'number_with_unit', 'simple_attribute', 'complex_attribute',
+                   'define', 'argument_list', 'group']
+
+
+class ProfilingLibertyTransformer(LibertyTransformer):
+    """
+    `LibertyTransformer` which records the time spent in each callback.
+    Applied to a parse tree after parsing, see `liberty.stats`.
+    """
+
+    def __init__(self, stats):
+        super().__init__()
+        self.stats = stats
+
+
+for _callback in _callback_names:
+    setattr(ProfilingLibertyTransformer, _callback, _timed_callback(_callback))
+
+
+def test_liberty_transformer():
+    from .grammar_cache import get_lalr_parser
+    data = r"""
+library(lib1, 2.0) {
+  time_unit: 1ns;
+  area: 1.5;
+  exp: 1e3;
+  str: "a\"b";
+  cap_load(1, pf);
+  cap_load(2, pf);
+  define(myattr, cell, float);
+  cell(INV) { area: 2; }
+}
+"""
+    library = get_lalr_parser(liberty_grammar, 'liberty', LibertyTransformer).parse(data)
+    assert library.args == ['lib1', 2]
+    assert str(library['time_unit']) == '1ns'
+    assert library['area'] == 1.5 and library['exp'] == 1000.0
+    assert library['str'].value == 'a"b'
+    assert library['cap_load'] == [[1, 'pf'], [2, 'pf']]
+    assert library.defines[0].attribute_name == 'myattr'
+    assert library.get_group('cell', 'INV')['area'] == 2
@@ -0,0 +1,269 @@
+##
+## Copyright (c) 2019 Thomas Kramer.
+##
+## This file is part of liberty-parser
+## (see https://codeberg.org/tok/liberty-parser).
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Lazily materialized libraries.
+
+The liberty file is memory-mapped and scanned once for the byte ranges of the top-level
+`cell` groups. Everything outside of the cells (units, templates, operating conditions...)
+is parsed right away. A cell is parsed only when it is requested.
+"""
+import mmap
+import re
+from typing import Dict, List, Optional, Tuple
+from .compression import detect_compression, open_binary
+from .fast_parser import parse_liberty_fast
+from .types import Group, _ChildIndex, _key
+
+# Everything up to the next brace that is not inside a string or comment.
+# Group 1 is the brace.
+_brace_regex = re.compile(rb'[^{}"/]*'
+                          rb'(?:(?:"[^"\\\n]*(?:\\[\s\S][^"\\\n]*)*"'
+                          rb'|/\*[^*]*\*+(?:[^/*][^*]*\*+)*/'
+                          rb'|/(?!\*))'
+                          rb'[^{}"/]*)*'
+                          rb'([{}])')
+
+# Header of a group right in front of its opening brace.
+_header_regex = re.compile(rb'([A-Za-z_][A-Za-z_0-9]*)\s*\([^()]*\)\s*$')
+
+# Bytes searched backwards from an opening brace for the group header.
+_header_window = 1024
+
+# Attribute that marks placeholders of not yet loaded cells in the skeleton library.
+_placeholder_attribute = '_lazy_cell_index'
+
+encoding = 'utf-8'
+
+
+def split_cells(data) -> Tuple[bytes, List[Tuple[int, int]]]:
+    """
+    Find the byte ranges of all top-level `cell` groups.
+    :param data: Liberty file content as bytes, bytearray or mmap.
+    :return: Tuple of the library skeleton and the list of `(start, end)` offsets of the
+        cells. In the skeleton, the body of the i-th cell is replaced by a placeholder
+        attribute holding `i`.
+    """
+    skeleton = []
+    ranges = []
+    depth = 0
+    copied = 0
+    cell_start = None
+    for m in _brace_regex.finditer(data):
+        pos = m.start(1)
+        if data[pos] == 0x7b:  # '{'
+            depth += 1
+            if depth == 2:
+                window_start = max(0, pos - _header_window)
+                header = _header_regex.search(data, window_start, pos)
+                if header is not None and header.group(1) == b'cell':
+                    cell_start = header.start()
+                    skeleton.append(data[copied:pos])
+                    skeleton.append('{{ {} : {}; }}'
+                                    .format(_placeholder_attribute, len(ranges)).encode())
+        else:
+            depth -= 1
+            if depth == 1 and cell_start is not None:
+                ranges.append((cell_start, pos + 1))
+                copied = pos + 1
+                cell_start = None
+    skeleton.append(data[copied:])
+    return b''.join(skeleton), ranges
+
+
+def assemble_library(skeleton: Group, cells: List[Group]) -> Group:
+    """
+    Put parsed cells into the library skeleton created by `split_cells`.
+    :param skeleton: Parsed skeleton.
+    :param cells: Parsed cells, in the order of the ranges returned by `split_cells`.
+    :return: The skeleton with placeholders replaced by the cells.
+    """
+    groups = skeleton.groups
+    for i, g in enumerate(groups):
+        if g.group_name == 'cell':
+            placeholder = g.attributes.get(_placeholder_attribute)
+            if placeholder is not None:
+                groups[i] = cells[placeholder[0]]
+    return skeleton
+
+
+class LazyLibrary(Group):
+    """
+    Library `Group` whose cells are parsed on first access.
+    Cells requested with `get_groups('cell', name)`, `get_group('cell', name)` or
+    `select_cell` are parsed individually. Accessing `groups` directly loads all cells.
+    """
+
+    def __init__(self, skeleton: Group, data, ranges: List[Tuple[int, int]],
+                 table_dtype=None):
+        super().__init__(skeleton.group_name, skeleton.args, skeleton.attributes,
+                         skeleton.groups, skeleton.defines)
+        self._data = data
+        self._table_dtype = table_dtype
+        # Index into `groups` -> byte range of not yet loaded cells.
+        self._pending: Dict[int, Tuple[int, int]] = dict()
+        # Cell name -> indices into `groups`. Names are keyed like in `Group.get_groups`.
+        self._cell_index: Dict[str, List[int]] = dict()
+
+        for i, g in enumerate(self._groups):
+            if g.group_name != 'cell':
+                continue
+            if len(g.args) > 0:
+                self._cell_index.setdefault(_key(g.args[0]), []).append(i)
+            placeholder = g.attributes.pop(_placeholder_attribute, None)
+            if placeholder is not None:
+                self._pending[i] = ranges[placeholder[0]]
+        if not self._pending:
+            self._data = None
+
+    @property
+    def groups(self) -> List[Group]:
+        self._load_all()
+        return self._groups
+
+    @groups.setter
+    def groups(self, groups: List[Group]):
+        Group.groups.fset(self, groups)
+        self._pending = dict()
+        self._data = None
+
+    def __reduce__(self):
+        # The memory-mapped file can not be pickled. Pickle a plain `Group` with all cells
+        # loaded instead (snapshots, shared memory, `merge_libraries`, ...).
+        self._load_all()
+        return Group, (self.group_name, self.args, self.attributes, self._groups, self._defines)
+
+    def _load(self, i: int) -> Group:
+        cell_range = self._pending.pop(i, None)
+        if cell_range is not None:
+            start, end = cell_range
+            self._groups[i] = parse_liberty_fast(self._data[start:end].decode(encoding),
+                                                 self._table_dtype)
+            if not self._pending:
+                self._data = None
+        return self._groups[i]
+
+    def _load_all(self):
+        for i in list(self._pending.keys()):
+            self._load(i)
+
+    def _emit(self, emit, indent: str, prefix: str):
+        self._load_all()
+        super()._emit(emit, indent, prefix)
+
+    def is_loaded(self, cell_name: Optional[str] = None) -> bool:
+        """
+        Check if a cell or all cells are parsed already.
+        """
+        if cell_name is None:
+            return not self._pending
+        return all(i not in self._pending for i in self._cell_index.get(_key(cell_name), []))
+
+    def _child_index(self, rebuild: bool = False) -> _ChildIndex:
+        # Index the sub-groups without loading the cells. Placeholders of pending cells are
+        # only found by lookups of cells, which are answered by `_cell_index` instead.
+        if self._groups is None:
+            return super()._child_index(rebuild)
+        index = self._index
+        if rebuild or index is None or not index.is_valid(self._groups):
+            index = _ChildIndex(self._groups)
+            self._index = index
+        return index
+
+    def get_groups(self, type_name: str, argument: Optional[str] = None) -> List:
+        if not self._pending or type_name != 'cell':
+            # Groups other than cells are never pending.
+            return super().get_groups(type_name, argument)
+        if argument is None:
+            self._load_all()
+            return super().get_groups(type_name, argument)
+        try:
+            indices = self._cell_index.get(_key(argument), [])
+        except TypeError:
+            self._load_all()
+            return super().get_groups(type_name, argument)
+        return [self._load(i) for i in indices]
+
+    def get_groups_by_attribute(self, type_name: str, attribute: str, value) -> List:
+        if type_name == 'cell':
+            self._load_all()
+        return super().get_groups_by_attribute(type_name, attribute, value)
+
+
+def load_liberty_lazy(filename: str, table_dtype=None) -> LazyLibrary:
+    """
+    Load a liberty file such that cells are parsed only on demand.
+    The file is memory-mapped and must not be modified while the library is in use.
+    Compressed files are decompressed into memory instead.
+    :param filename: liberty file name string.
+    :param table_dtype: Store numeric tables as NumPy arrays, see `parse_liberty_fast`.
+    :return: `LazyLibrary` object.
+    """
+    if detect_compression(filename) is not None:
+        with open_binary(filename) as f:
+            data = f.read()
+    else:
+        with open(filename, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    skeleton, ranges = split_cells(data)
+    return LazyLibrary(parse_liberty_fast(skeleton.decode(encoding), table_dtype), data, ranges,
+                       table_dtype)
+
+
+def test_load_liberty_lazy():
+    import os.path
+    from .types import select_cell
+    lib_file = os.path.join(os.path.dirname(__file__), '../test_data/gscl45nm.lib')
+    expected = parse_liberty_fast(open(lib_file).read())
+
+    library = load_liberty_lazy(lib_file)
+    assert not library.is_loaded()
+    assert len(library._pending) == len(expected.get_groups('cell'))
+    assert library.get_group('lu_table_template', 'delay_template_6x6') is not None
+
+    xor = select_cell(library, 'XOR2X1')
+    assert library.is_loaded('XOR2X1')
+    assert not library.is_loaded('AND2X1')
+    assert str(xor) == str(expected.get_group('cell', 'XOR2X1'))
+
+    assert str(library) == str(expected)
+    assert library.is_loaded()
+
+    # Pickled as a plain `Group` with all cells.
+    import pickle
+    from . import snapshot
+    library = load_liberty_lazy(lib_file)
+    copy = pickle.loads(pickle.dumps(library))
+    assert type(copy) is Group and str(copy) == str(expected)
+    assert str(snapshot.loads(snapshot.dumps(load_liberty_lazy(lib_file)))) == str(expected)
+
+    # Quoted names are `EscapedString` arguments.
+    data = b"""library(quoted) {
+  lu_table_template("delay_2x2") { variable_1 : input_net_transition; }
+  cell("INV") { area : 1; }
+  cell("BUF") { area : 2; }
+}
+"""
+    skeleton, ranges = split_cells(data)
+    library = LazyLibrary(parse_liberty_fast(skeleton.decode(encoding)), data, ranges)
+    assert library.get_group('lu_table_template', 'delay_2x2') is not None
+    assert not library.is_loaded('INV')
+    assert select_cell(library, 'BUF')['area'] == 2
+    assert library.is_loaded('BUF') and not library.is_loaded('INV')
+    assert library.get_groups_by_attribute('cell', 'area', 1)[0].args[0] == 'INV'
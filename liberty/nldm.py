@@ -0,0 +1,307 @@
+##
+## Copyright (c) 2019 Thomas Kramer.
+##
+## This file is part of liberty-parser
+## (see https://codeberg.org/tok/liberty-parser).
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Vectorized evaluation of NLDM (non-linear delay model) timing tables.
+
+All delay and transition tables of a library are compiled into stacked NumPy arrays,
+one stack per table name. Lookups take arrays of timing arcs, input transitions and
+output loads and interpolate all of them at once.
+
+Example::
+
+    tables = NLDMTables(library)
+    arc = tables.find('INVX1', 'Y', 'A')
+    delay = tables.lookup('cell_rise', [arc, arc], slew=[0.1, 0.2], load=[0.5, 1.0])
+"""
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import numpy as np
+from .types import Group, _text
+from .stats import instrumented_query
+
+# Tables compiled by default.
+TIMING_TABLES = ('cell_rise', 'cell_fall', 'rise_transition', 'fall_transition')
+
+# Template variables of the two table axes.
+SLEW_VARIABLE = 'input_net_transition'
+LOAD_VARIABLE = 'total_output_net_capacitance'
+
+
+class TimingArc(NamedTuple):
+    cell: str
+    pin: str
+    related_pin: str
+    timing_type: Optional[str]
+
+
+def table_arrays(table: Group, templates: Dict[str, Group]) -> Tuple[np.ndarray, np.ndarray,
+                                                                     np.ndarray]:
+    """
+    Get the axes and values of a timing table in (slew, load) order.
+    Indices of the table take precedence over the indices of its `lu_table_template`.
+    Axes which the table does not depend on have a single entry 0.
+    :param table: Table group such as returned by `select_timing_table`.
+    :param templates: `lu_table_template` groups by name (see `_text`).
+    :return: Tuple `(slew index, load index, values)` where `values` has the shape
+        `(len(slew index), len(load index))`.
+    """
+    template = templates.get(_text(table.args[0])) if table.args else None
+    axes = {SLEW_VARIABLE: np.zeros(1), LOAD_VARIABLE: np.zeros(1)}
+    order = []
+    for i in (1, 2):
+        variable = template.get('variable_{}'.format(i)) if template is not None else None
+        if variable is None:
+            continue
+        variable = _text(variable)
+        if variable not in axes:
+            raise ValueError("Unsupported table variable '{}' in template '{}'."
+                             .format(variable, table.args[0]))
+        index_name = 'index_{}'.format(i)
+        if index_name in table:
+            index = table.get_array(index_name)
+        else:
+            index = template.get_array(index_name)
+        axes[variable] = np.asarray(index, dtype=np.float64).ravel()
+        order.append(variable)
+
+    values = np.asarray(table.get_array('values'), dtype=np.float64)
+    shape = tuple(len(axes[v]) for v in order)
+    if values.size != np.prod(shape):
+        raise ValueError("Table '{}' does not match its template '{}'."
+                         .format(table.group_name, table.args[0] if table.args else None))
+    values = values.reshape(shape)
+    # Bring the axes into (slew, load) order.
+    for v in (SLEW_VARIABLE, LOAD_VARIABLE):
+        if v not in order:
+            values = values[..., np.newaxis]
+            order.append(v)
+    if order[0] != SLEW_VARIABLE:
+        values = values.T
+    return axes[SLEW_VARIABLE], axes[LOAD_VARIABLE], values
+
+
+class _TableStack:
+    """
+    Tables of the same name of all arcs, padded to a common size.
+    Padding of the indices is `inf` such that it is never selected as lower bound.
+    Arcs without this table have a single `nan` value.
+    """
+
+    def __init__(self, tables: List[Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]]):
+        num_arcs = len(tables)
+        max_slew = max([len(t[0]) for t in tables if t is not None], default=1)
+        max_load = max([len(t[1]) for t in tables if t is not None], default=1)
+        self.slew = np.full((num_arcs, max_slew), np.inf)
+        self.load = np.full((num_arcs, max_load), np.inf)
+        self.num_slew = np.ones(num_arcs, dtype=np.intp)
+        self.num_load = np.ones(num_arcs, dtype=np.intp)
+        self.values = np.full((num_arcs, max_slew, max_load), np.nan)
+        self.slew[:, 0] = 0
+        self.load[:, 0] = 0
+        for i, t in enumerate(tables):
+            if t is None:
+                continue
+            slew, load, values = t
+            self.slew[i, :len(slew)] = slew
+            self.load[i, :len(load)] = load
+            self.num_slew[i] = len(slew)
+            self.num_load[i] = len(load)
+            self.values[i, :len(slew), :len(load)] = values
+
+
+def _segments(index: np.ndarray, num: np.ndarray, x: np.ndarray, extrapolate: bool):
+    """
+    Find the interpolation interval of each point.
+    :param index: Padded axis of each point, shape (n, m).
+    :param num: Valid length of the axes, shape (n,).
+    :param x: Coordinates, shape (n,).
+    :return: Lower and upper interval bounds and the relative position in the interval.
+    """
+    lower = np.count_nonzero(index <= x[:, np.newaxis], axis=1) - 1
+    lower = np.clip(lower, 0, np.maximum(num - 2, 0))
+    upper = np.minimum(lower + 1, num - 1)
+    rows = np.arange(len(x))
+    x0 = index[rows, lower]
+    width = index[rows, upper] - x0
+    nonzero = width != 0
+    t = np.where(nonzero, (x - x0) / np.where(nonzero, width, 1), 0)
+    if not extrapolate:
+        t = np.clip(t, 0, 1)
+    return lower, upper, t
+
+
+class NLDMTables:
+    """
+    Timing tables of a library compiled for vectorized lookup.
+    """
+
+    def __init__(self, library: Group, table_names: Tuple[str, ...] = TIMING_TABLES):
+        """
+        :param library: Library group.
+        :param table_names: Names of the table groups to compile.
+        """
+        templates = {_text(g.args[0]): g for g in library.get_groups('lu_table_template')
+                     if g.args}
+        self.arcs: List[TimingArc] = []
+        # Tables which could not be compiled: (cell, pin, table name, reason).
+        # Their arcs have no value for this table.
+        self.skipped: List[Tuple[str, str, str, str]] = []
+        # (cell, pin, related pin) -> indices into `arcs`.
+        self._arc_index: Dict[Tuple[str, str, str], List[int]] = dict()
+        tables = {name: [] for name in table_names}
+
+        for cell in library.get_groups('cell'):
+            cell_name = _text(cell.args[0]) if cell.args else None
+            for pin in cell.get_groups('pin'):
+                pin_name = _text(pin.args[0]) if pin.args else None
+                for timing in pin.get_groups('timing'):
+                    related_pins = _text(timing.get('related_pin'))
+                    if related_pins is None:
+                        continue
+                    compiled = dict()
+                    for name in table_names:
+                        t = timing.get_groups(name)
+                        compiled[name] = None
+                        if t:
+                            try:
+                                compiled[name] = table_arrays(t[0], templates)
+                            except ValueError as e:
+                                self.skipped.append((cell_name, pin_name, name, str(e)))
+                    timing_type = _text(timing.get('timing_type'))
+                    for related_pin in related_pins.split():
+                        arc = TimingArc(cell_name, pin_name, related_pin, timing_type)
+                        key = arc[:3]
+                        self._arc_index.setdefault(key, []).append(len(self.arcs))
+                        self.arcs.append(arc)
+                        for name in table_names:
+                            tables[name].append(compiled[name])
+
+        self._stacks = {name: _TableStack(t) for name, t in tables.items()}
+
+    def find(self, cell: str, pin: str, related_pin: str,
+             timing_type: Optional[str] = None) -> int:
+        """
+        Get the index of a timing arc. Selection works like `select_timing_table`.
+        :param timing_type: Required if there are several arcs between the pins.
+        :return: Index into `arcs`.
+        """
+        indices = self._arc_index.get((cell, pin, related_pin), [])
+        if timing_type is None and len(indices) == 1:
+            return indices[0]
+        for i in indices:
+            if self.arcs[i].timing_type == timing_type:
+                return i
+        if not indices:
+            raise KeyError("No timing arc from '{}' to '{}' in cell '{}'."
+                           .format(related_pin, pin, cell))
+        raise KeyError("'timing_type' must be one of: {}"
+                       .format(sorted(str(self.arcs[i].timing_type) for i in indices)))
+
+    @instrumented_query
+    def lookup(self, table_name: str, arcs, slew, load, extrapolate: bool = True) -> np.ndarray:
+        """
+        Interpolate a table of many arcs at many points at once.
+        Values between the table indices are interpolated bilinearly. Outside of the table
+        they are extrapolated linearly from the outermost interval or, if `extrapolate` is
+        `False`, clamped to the border of the table.
+        :param table_name: Name of the table, e.g. 'cell_rise'.
+        :param arcs: Arc indices as returned by `find`.
+        :param slew: Input transition times.
+        :param load: Output load capacitances.
+        :return: Array of the broadcast shape of `arcs`, `slew` and `load`. `nan` for arcs
+            without this table.
+        """
+        stack = self._stacks[table_name]
+        arcs, slew, load = np.broadcast_arrays(np.asarray(arcs, dtype=np.intp),
+                                               np.asarray(slew, dtype=np.float64),
+                                               np.asarray(load, dtype=np.float64))
+        shape = arcs.shape
+        arcs, slew, load = arcs.ravel(), slew.ravel(), load.ravel()
+
+        s0, s1, ts = _segments(stack.slew[arcs], stack.num_slew[arcs], slew, extrapolate)
+        l0, l1, tl = _segments(stack.load[arcs], stack.num_load[arcs], load, extrapolate)
+        v = stack.values
+        result = (1 - ts) * ((1 - tl) * v[arcs, s0, l0] + tl * v[arcs, s0, l1]) \
+            + ts * ((1 - tl) * v[arcs, s1, l0] + tl * v[arcs, s1, l1])
+        return result.reshape(shape)
+
+
+def test_nldm_tables():
+    import os.path
+    from .fast_parser import parse_liberty_fast
+    from .types import select_cell, select_pin, select_timing_table
+    lib_file = os.path.join(os.path.dirname(__file__), '../test_data/gscl45nm.lib')
+    library = parse_liberty_fast(open(lib_file).read())
+    tables = NLDMTables(library)
+    templates = {g.args[0]: g for g in library.get_groups('lu_table_template')}
+
+    arc = tables.find('INVX1', 'Y', 'A')
+    table = select_timing_table(select_pin(select_cell(library, 'INVX1'), 'Y'), 'A', 'cell_rise')
+    # Template 'delay_template_6x6' has the load on the first axis.
+    load, slew = table.get_array('index_1')[0], table.get_array('index_2')[0]
+    values = table.get_array('values')
+
+    # Exact at the grid points.
+    s, l = np.meshgrid(slew, load)
+    assert np.allclose(tables.lookup('cell_rise', arc, s, l), values)
+
+    # Bilinear between grid points, linear extrapolation outside.
+    def reference(x, y):
+        rows = [np.interp(x, slew, values[i]) for i in range(len(load))]
+        return np.interp(y, load, rows)
+    s_mid, l_mid = (slew[1] + slew[2]) / 2, (load[3] + load[4]) / 2
+    assert np.isclose(tables.lookup('cell_rise', arc, s_mid, l_mid), reference(s_mid, l_mid))
+    outside = tables.lookup('cell_rise', arc, slew[-1] * 2, load[0], extrapolate=False)
+    assert np.isclose(outside, values[0, -1])
+    extrapolated = tables.lookup('cell_rise', arc, slew[-1] + 1, load[0])
+    slope = (values[0, -1] - values[0, -2]) / (slew[-1] - slew[-2])
+    assert np.isclose(extrapolated, values[0, -1] + slope)
+
+    # Many arcs at once, including tables of other sizes. `np.interp` clamps at the borders.
+    arcs = np.arange(len(tables.arcs))
+    result = tables.lookup('cell_rise', arcs, 0.3, 1.0, extrapolate=False)
+    assert np.isnan(result).any() and not np.isnan(result).all()
+    for i in arcs[~np.isnan(result)]:
+        a = tables.arcs[i]
+        pin = select_pin(select_cell(library, a.cell), a.pin)
+        t = select_timing_table(pin, a.related_pin, 'cell_rise', a.timing_type)
+        s_index, l_index, v = table_arrays(t, templates)
+        if len(s_index) > 1 and len(l_index) > 1:
+            rows = [np.interp(0.3, s_index, v[:, j]) for j in range(len(l_index))]
+            assert np.isclose(result[i], np.interp(1.0, l_index, rows))
+
+    # Quoted names and a table with an unsupported variable.
+    library = parse_liberty_fast("""library(quoted) {
+  lu_table_template("delay_2") { variable_1 : input_net_transition; index_1("0, 1"); }
+  lu_table_template("other_2") { variable_1 : input_voltage; index_1("0, 1"); }
+  cell("INV") {
+    pin("Y") {
+      timing() {
+        related_pin : "A";
+        cell_rise("delay_2") { values("1, 3"); }
+        cell_fall("other_2") { values("1, 3"); }
+      }
+    }
+  }
+}""")
+    tables = NLDMTables(library)
+    arc = tables.find('INV', 'Y', 'A')
+    assert np.isclose(tables.lookup('cell_rise', arc, 0.5, 0), 2)
+    assert np.isnan(tables.lookup('cell_fall', arc, 0.5, 0))
+    assert [t[:3] for t in tables.skipped] == [('INV', 'Y', 'cell_fall')]
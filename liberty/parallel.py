@@ -0,0 +1,235 @@
+##
+## Copyright (c) 2019 Thomas Kramer.
+##
+## This file is part of liberty-parser
+## (see https://codeberg.org/tok/liberty-parser).
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Load many liberty files concurrently in a process pool.
+
+Workers send the parsed libraries back as snapshots (see `liberty.snapshot`) which are
+much smaller and faster to load than pickled `Group` trees. If a cache is used, only the
+path of the snapshot written by the worker is sent back.
+
+Large files are split at the boundaries of the top-level cells. The cells are parsed by
+several workers and then put back into one library `Group`.
+"""
+import mmap
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, Executor, Future
+from typing import List, Optional, Tuple, Union
+import numpy as np
+from .compression import detect_compression
+from .fast_parser import parse_liberty_fast
+from .lazy import split_cells, assemble_library, encoding
+from .parser import load_liberty
+from . import snapshot
+from .types import Group
+
+# Files larger than this are split into cells which are parsed in parallel.
+DEFAULT_SPLIT_BYTES = 256 << 20
+
+# Number of parts per worker a split file is cut into. More parts balance the load better.
+_parts_per_worker = 4
+
+
+class LoadResult:
+    """
+    Library loaded by `load_liberties` together with timing information.
+    """
+
+    def __init__(self, filename: str, library: Group, parse_time: float,
+                 transfer_time: float, wall_time: float, num_parts: int):
+        self.filename = filename
+        self.library = library
+        # Time spent by the workers for parsing, summed over all parts of the file.
+        self.parse_time = parse_time
+        # Time spent in the calling process for loading the results of the workers.
+        self.transfer_time = transfer_time
+        # Time from the start of `load_liberties` until the library was ready.
+        self.wall_time = wall_time
+        # Number of parts the file was split into.
+        self.num_parts = num_parts
+
+    def __repr__(self):
+        return "LoadResult({}, parse_time={:.3f}s, transfer_time={:.3f}s, wall_time={:.3f}s, " \
+               "num_parts={})".format(self.filename, self.parse_time, self.transfer_time,
+                                     self.wall_time, self.num_parts)
+
+
+def _load_file(filename: str, engine: str, cache: Union[bool, str], table_dtype=None,
+               inline: bool = False) -> Tuple[str, object, float]:
+    """
+    Worker: parse a complete file.
+    :param inline: The worker runs in the calling process. Return the library as it is.
+    :return: Tuple `(kind, data, parse time)` where kind is 'path' if `data` is the path of
+        a snapshot file, 'bytes' if `data` holds the snapshot or 'library' if `data` is the
+        library itself.
+    """
+    start = time.perf_counter()
+    library = load_liberty(filename, engine=engine, cache=cache, table_dtype=table_dtype)
+    parse_time = time.perf_counter() - start
+    if inline:
+        return 'library', library, parse_time
+    if cache:
+        cache_dir = cache if isinstance(cache, str) else None
+        variant = None if table_dtype is None else np.dtype(table_dtype).name
+        snap_file = snapshot.snapshot_path(filename, cache_dir, variant)
+        if os.path.exists(snap_file):
+            return 'path', snap_file, parse_time
+    return 'bytes', snapshot.dumps(library), parse_time
+
+
+def _parse_cells(filename: str, ranges: List[Tuple[int, int]],
+                 table_dtype=None) -> Tuple[bytes, float]:
+    """
+    Worker: parse the cells at the given byte ranges of a file.
+    :return: Tuple of the snapshot of a group holding the cells and the parse time.
+    """
+    start = time.perf_counter()
+    with open(filename, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            cells = [parse_liberty_fast(data[a:b].decode(encoding), table_dtype)
+                     for a, b in ranges]
+    parse_time = time.perf_counter() - start
+    return snapshot.dumps(Group('cells', groups=cells)), parse_time
+
+
+def _batches(ranges: List[Tuple[int, int]], num_batches: int) -> List[List[Tuple[int, int]]]:
+    """
+    Cut the list of ranges into contiguous batches of roughly equal byte size.
+    """
+    total = sum(b - a for a, b in ranges)
+    target = total / max(1, num_batches)
+    batches = [[]]
+    size = 0
+    for r in ranges:
+        if size >= target and batches[-1]:
+            batches.append([])
+            size = 0
+        batches[-1].append(r)
+        size += r[1] - r[0]
+    return batches
+
+
+class _InlineExecutor(Executor):
+    """
+    Executor running the tasks in the calling process.
+    """
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+class _Job:
+
+    def __init__(self, filename: str, table_dtype=None):
+        self.filename = filename
+        self.table_dtype = table_dtype
+        self.skeleton: Optional[bytes] = None
+        self.futures: List[Future] = []
+
+
+def _submit(pool: Executor, filename: str, engine: str, cache: Union[bool, str],
+            table_dtype, split_bytes: int, num_workers: int) -> _Job:
+    job = _Job(filename, table_dtype)
+    # Compressed files can not be split without decompressing them first.
+    if not cache and num_workers > 1 and os.path.getsize(filename) > split_bytes \
+            and detect_compression(filename) is None:
+        with open(filename, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                job.skeleton, ranges = split_cells(data)
+        for batch in _batches(ranges, num_workers * _parts_per_worker):
+            job.futures.append(pool.submit(_parse_cells, filename, batch, table_dtype))
+    else:
+        inline = isinstance(pool, _InlineExecutor)
+        job.futures.append(pool.submit(_load_file, filename, engine, cache, table_dtype,
+                                       inline))
+    return job
+
+
+def _collect(job: _Job, start_time: float) -> LoadResult:
+    results = [f.result() for f in job.futures]
+    start = time.perf_counter()
+    if job.skeleton is None:
+        kind, data, parse_time = results[0]
+        if kind == 'path':
+            library = snapshot.read_snapshot(data)
+        elif kind == 'bytes':
+            library = snapshot.loads(data)
+        else:
+            library = data
+    else:
+        cells = []
+        parse_time = 0
+        for data, t in results:
+            cells.extend(snapshot.loads(data).groups)
+            parse_time += t
+        skeleton = parse_liberty_fast(job.skeleton.decode(encoding), job.table_dtype)
+        library = assemble_library(skeleton, cells)
+    end = time.perf_counter()
+    return LoadResult(job.filename, library, parse_time, end - start, end - start_time,
+                      len(results))
+
+
+def load_liberties(filenames: List[str],
+                   workers: Optional[int] = None,
+                   engine: str = 'fast',
+                   cache: Union[bool, str] = False,
+                   split_bytes: int = DEFAULT_SPLIT_BYTES,
+                   table_dtype=None) -> List[LoadResult]:
+    """
+    Load several liberty files concurrently.
+    :param filenames: Paths of the liberty files.
+    :param workers: Number of worker processes. Defaults to the number of CPUs.
+        With a single worker the files are loaded in the calling process.
+    :param engine: Parser implementation, see `liberty.parser.parse_liberty`.
+    :param cache: Snapshot cache, see `liberty.parser.load_liberty`.
+    :param split_bytes: Files larger than this are split into cells which are parsed by
+        several workers. Not used together with `cache`.
+    :param table_dtype: Store numeric tables as NumPy arrays, see `liberty.parser.parse_liberty`.
+    :return: One `LoadResult` per file, in the order of `filenames`.
+    """
+    num_workers = workers if workers is not None else (os.cpu_count() or 1)
+    start_time = time.perf_counter()
+    if num_workers <= 1:
+        pool = _InlineExecutor()
+    else:
+        pool = ProcessPoolExecutor(max_workers=num_workers)
+    with pool:
+        jobs = [_submit(pool, f, engine, cache, table_dtype, split_bytes, num_workers)
+                for f in filenames]
+        return [_collect(job, start_time) for job in jobs]
+
+
+def test_load_liberties():
+    import os.path
+    lib_file = os.path.join(os.path.dirname(__file__), '../test_data/gscl45nm.lib')
+    expected = str(parse_liberty_fast(open(lib_file).read()))
+
+    results = load_liberties([lib_file, lib_file], workers=2)
+    assert [str(r.library) for r in results] == [expected, expected]
+
+    # Split the file into cells.
+    results = load_liberties([lib_file], workers=2, split_bytes=0)
+    assert results[0].num_parts > 1
+    assert str(results[0].library) == expected
@@ -17,161 +17,208 @@
 ## You should have received a copy of the GNU General Public License
 ## along with this program. If not, see <http://www.gnu.org/licenses/>.
 ##
-from lark import Lark, Transformer, v_args
 from .types import *
-
-liberty_grammar = r"""
-    ?start: group
-    
-    group: name argument_list group_body
-    group_body: "{" (statement)* "}"
-    
-    argument_list: "(" [value ("," value)*] ")"
-    
-    ?statement: attribute ";"
-        | group
-        | define ";"
-        
-    ?value: name
-        | number
-        | number unit -> number_with_unit
-        | numbers
-        | string -> escaped_string
-        
-    numbers: "\"" [number ("," number)*] "\""
-        
-    unit: CNAME
-        
-    ?attribute: simple_attribute
-        | complex_attribute
-        
-    simple_attribute: name ":" value
-    
-    complex_attribute: name argument_list
-    
-    define: "define" "(" name "," name "," name ")"
-    
-    name : CNAME
-    string: ESCAPED_STRING
-    
-    number: SIGNED_NUMBER
-    
-    COMMENT: /\/\*(\*(?!\/)|[^*])*\*\//
-    NEWLINE: /\\?\r?\n/
-    
-    %import common.WORD
-    %import common.ESCAPED_STRING
-    %import common.CNAME
-    %import common.SIGNED_NUMBER
-    %import common.WS
-    
-    %ignore WS
-    %ignore COMMENT
-    %ignore NEWLINE
-"""
-
-
-@v_args(inline=True)
-class LibertyTransformer(Transformer):
-
-    def escaped_string(self, s):
-        return EscapedString(s[1:-1].replace('\\"', '"'))
-
-    def string(self, s):
-        return s[:]
-
-    def name(self, s):
-        return s[:]
-
-    def number(self, s):
-        if '.0'==s[-2:]:
-            return int(s[:-2])
-        elif not '.' in s:
-            return int(s)
-        return float(s)
-
-    unit = string
-    value = string
-
-    def group_body(self, *args):
-        return list(args)
-
-    def number_with_unit(self, num, unit):
-        return WithUnit(num, unit)
-
-    def simple_attribute(self, name, value):
-        return {name: value}
-
-    def complex_attribute(self, name, arg_list):
-        return {name: arg_list}
-
-    def define(self, attribute_name, group_name, attribute_type):
-        """
-
-        :param attribute_name:
-        :param group_name:
-        :param attribute_type: boolean, string, integer or float
-        :return:
-        """
-        return Define(attribute_name, group_name, attribute_type)
-
-        # @v_args(inline=True)
-        # def value(self, value):
-        #     return value
-
-    def argument_list(self, *args):
-        return list(args)
-
-    def group(self, group_name, group_args, body):
-        attrs = dict()
-        sub_groups = []
-        defines = []
-        for a in body:
-            if isinstance(a, dict):
-                k = list(a.keys())[0]
-                if k in attrs.keys():
-                    attrs[k].append(a[k])
-                else:
-                    attrs[k] = [a[k]]
-            elif isinstance(a, Group):
-                sub_groups.append(a)
-            elif isinstance(a, Define):
-                defines.append(a)
-            else:
-                print(a)
-                assert False
-
-        return Group(group_name, group_args, attrs, sub_groups, defines)
-
-
-def parse_liberty(data: str) -> Group:
+from .fast_parser import parse_liberty_fast, read_chunks
+from .lazy import load_liberty_lazy
+from .snapshot import load_cached
+from .source import SourceFile, attach_source, has_source, save_spliced
+from .stats import LibertyStats, current_stats, phase
+from . import interning
+from .compression import compression_from_suffix, detect_compression, open_text, \
+    read_chunks_background
+from typing import Optional, Union
+import numpy as np
+import sys
+
+# Moved to `liberty.lark_parser`, which imports Lark. Still available here on access.
+_lark_parser_names = ('liberty_grammar', 'LibertyTransformer')
+
+
+def __getattr__(name):
+    if name in _lark_parser_names:
+        from . import lark_parser
+        return getattr(lark_parser, name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def parse_liberty(data: str, engine: str = 'lark', table_dtype=None,
+                  stats: Optional[LibertyStats] = None) -> Group:
     """
     Parse a string containing data of a liberty file.
     :param data: Raw liberty string.
+    :param engine: Parser implementation. 'lark' for the Lark LALR parser or 'fast' for the
+        hand-written parser in `liberty.fast_parser`. Both create the same `Group` structure.
+    :param table_dtype: If not `None`, numeric tables (`values`, `index_1`, ...) are stored
+        as 2D NumPy arrays of this type instead of lists of strings.
+        See `Group.convert_tables`.
+    :param stats: Record timings and counts of the parsing phases. Defaults to the stats
+        object of an active `liberty.stats.collect_stats` block.
     :return: `Group` object of library.
     """
-    liberty_parser = Lark(liberty_grammar,
-                          parser='lalr',
-                          lexer='standard',
-                          transformer=LibertyTransformer()
-                          )
+    if engine not in ('fast', 'lark'):
+        raise ValueError("Unknown parser engine: {}".format(engine))
+    if stats is None:
+        stats = current_stats()
+    if stats is not None:
+        return _parse_instrumented(data, engine, table_dtype, stats)
+    if engine == 'fast':
+        return parse_liberty_fast(data, table_dtype)
+    from .grammar_cache import get_lalr_parser
+    from .lark_parser import liberty_grammar, LibertyTransformer
+    liberty_parser = get_lalr_parser(liberty_grammar, 'liberty', LibertyTransformer)
     library = liberty_parser.parse(data)
+    if table_dtype is not None:
+        library.convert_tables(table_dtype)
+    return library
+
+def _parse_instrumented(data: str, engine: str, table_dtype, stats: LibertyStats) -> Group:
+    """
+    `parse_liberty` with the phases run one after another and timed separately.
+    """
+    from .fast_parser import tokenize, _Parser
+    stats.characters += len(data)
+    with stats.memory():
+        if engine == 'fast':
+            # Lexing is measured in an extra pass which does not keep the tokens, such that
+            # the peak memory is not inflated. 'fast.parse' includes lexing again.
+            with stats.phase('fast.lex'):
+                num_tokens = 0
+                for _ in tokenize(data):
+                    num_tokens += 1
+            stats.count('tokens', num_tokens)
+            # Tables are converted while building.
+            with stats.phase('fast.parse'):
+                library = _Parser(tokenize(data), table_dtype).parse()
+        else:
+            from .grammar_cache import get_lalr_parser
+            from .lark_parser import liberty_grammar, ProfilingLibertyTransformer
+            with stats.phase('lark.compile'):
+                tree_parser = get_lalr_parser(liberty_grammar, 'liberty_tree', None)
+            # Lexing is measured in an extra pass. 'lark.parse' includes lexing again.
+            with stats.phase('lark.lex'):
+                for _ in tree_parser.lex(data):
+                    pass
+            with stats.phase('lark.parse'):
+                tree = tree_parser.parse(data)
+            with stats.phase('lark.transform'):
+                library = ProfilingLibertyTransformer(stats).transform(tree)
+            del tree
+            if table_dtype is not None:
+                with stats.phase('convert_tables'):
+                    library.convert_tables(table_dtype)
+    stats.count_tree(library)
     return library
 
-def load_liberty(filename: str) -> Group:
+def load_liberty(filename: str, engine: str = 'lark', lazy: bool = False,
+                 cache: Union[bool, str] = False, table_dtype=None,
+                 keep_source: bool = False, stats: Optional[LibertyStats] = None,
+                 intern_tables: bool = False) -> Group:
     """
     Parse a liberty file.
     :param filename: liberty file name string.
+    :param engine: Parser implementation, see `parse_liberty`. The 'fast' engine reads the
+        file in chunks instead of loading it into memory at once.
+    :param lazy: Memory-map the file and parse cells only when they are requested.
+        Returns a `liberty.lazy.LazyLibrary`. Cells are always parsed with the 'fast' engine.
+    :param cache: Use a binary snapshot of the parsed library if it is up to date, otherwise
+        parse the file and write the snapshot. `True` stores the snapshot next to the
+        liberty file, a string is used as cache directory. See `liberty.snapshot`.
+    :param table_dtype: Store numeric tables as NumPy arrays, see `parse_liberty`.
+    :param keep_source: Memory-map the file and record the location of every group, such
+        that `save_liberty` copies unmodified groups verbatim. See `liberty.source`.
+    :param stats: Record timings and counts, see `parse_liberty`.
+    :param intern_tables: Share one instance of repeated tables, see `liberty.interning`.
+        Done while parsing with the 'fast' engine.
     :return: `Group` object of library.
-    """
-    return parse_liberty(open(filename,'r').read())
 
-def save_liberty(library: Group, filename: str):
+    Compressed files (gzip, bz2, xz, zstd) are detected by their content and decompressed
+    on the fly. With the 'fast' engine, decompression runs on a background thread.
+    """
+    if stats is None:
+        stats = current_stats()
+    if intern_tables:
+        if lazy:
+            raise ValueError("'intern_tables' can not be combined with 'lazy'.")
+        if not keep_source and (engine != 'fast' or cache or stats is not None):
+            library = load_liberty(filename, engine=engine, cache=cache, table_dtype=table_dtype,
+                                   stats=stats)
+            _intern_tables(library, stats)
+            return library
+    if keep_source:
+        if lazy or cache:
+            raise ValueError("'keep_source' can not be combined with 'lazy' or 'cache'.")
+        if detect_compression(filename) is not None:
+            raise ValueError("'keep_source' requires an uncompressed file.")
+        with phase(stats, 'read'):
+            source = SourceFile(filename)
+            data = source.text()
+        library = parse_liberty(data, engine=engine, table_dtype=table_dtype, stats=stats)
+        if intern_tables:
+            # Before attaching the source, replacing the tables is not a modification.
+            _intern_tables(library, stats)
+        # Groups which can not be located are written formatted.
+        with phase(stats, 'attach_source'):
+            attach_source(library, source)
+        return library
+    if lazy:
+        if cache:
+            raise ValueError("'lazy' and 'cache' can not be combined.")
+        with phase(stats, 'lazy'):
+            return load_liberty_lazy(filename, table_dtype)
+    if cache:
+        cache_dir = cache if isinstance(cache, str) else None
+        variant = None if table_dtype is None else np.dtype(table_dtype).name
+        with phase(stats, 'cache'):
+            return load_cached(filename,
+                               lambda f: load_liberty(f, engine=engine, table_dtype=table_dtype,
+                                                      stats=stats),
+                               cache_dir, variant=variant)
+    if stats is not None:
+        with stats.phase('read'):
+            with open_text(filename) as f:
+                data = f.read()
+        return parse_liberty(data, engine=engine, table_dtype=table_dtype, stats=stats)
+    if engine == 'fast':
+        compressed = detect_compression(filename) is not None
+        interner = interning.TableInterner() if intern_tables else None
+        with open_text(filename) as f:
+            chunks = read_chunks_background(f) if compressed else read_chunks(f)
+            return parse_liberty_fast(chunks, table_dtype, interner)
+    with open_text(filename) as f:
+        data = f.read()
+    return parse_liberty(data, engine=engine, table_dtype=table_dtype)
+
+def _intern_tables(library: Group, stats: Optional[LibertyStats]):
+    with phase(stats, 'intern_tables'):
+        interner = interning.intern_tables(library)
+    if stats is not None:
+        stats.count('tables.distinct', interner.distinct)
+        stats.count('tables.saved_bytes', interner.saved_bytes)
+
+# Size of the file buffer used by `save_liberty`.
+_write_buffer_size = 1 << 20
+
+
+def save_liberty(library: Group, filename: str, compression: Optional[str] = None):
     """
     save to new liberty file
+    The library is written incrementally, see `Group.write`. The content is the same as
+    `str(library)`, except for libraries loaded with `keep_source=True`: their unmodified
+    groups are copied from the source file.
+    :param compression: 'gzip', 'bz2', 'xz' or 'zstd' to write a compressed file.
+        By default chosen by the suffix of `filename` ('.gz', '.bz2', '.xz', '.zst').
     """
-    with open(filename,'w') as f:
-        f.write(str(library))
+    if compression is None:
+        compression = compression_from_suffix(filename)
+    if compression is not None:
+        with open_text(filename, 'w', compression) as f:
+            library.write(f)
+        return
+    if has_source(library):
+        save_spliced(library, filename)
+        return
+    with open(filename, 'w', buffering=_write_buffer_size) as f:
+        library.write(f)
 
 
 def test_parse_liberty1():
@@ -218,3 +265,66 @@ def test_parse_liberty2():
 
     array = timing_y_a.get_group('cell_rise').get_array('values')
     assert array.shape == (6, 6)
+
+
+# Upper bound of the time for `import liberty.parser` in seconds, including NumPy.
+# Generous such that it holds on slow machines. Importing sympy alone exceeds it.
+IMPORT_TIME_BUDGET = 0.5
+
+
+def test_save_liberty():
+    import os.path
+    import tempfile
+    lib_file = os.path.join(os.path.dirname(__file__), '../test_data/gscl45nm.lib')
+    library = load_liberty(lib_file, engine='fast')
+    lazy = load_liberty(lib_file, lazy=True)
+    with tempfile.TemporaryDirectory() as d:
+        out_file = os.path.join(d, 'out.lib')
+        for lib in [library, lazy]:
+            save_liberty(lib, out_file)
+            assert open(out_file).read() == str(library)
+
+    # Output blocks are joined correctly.
+    import io
+    from .types import _LineWriter
+    f = io.StringIO()
+    writer = _LineWriter(f, block_lines=3)
+    library._emit(writer.emit, '  ', '')
+    writer.flush()
+    assert f.getvalue() == str(library)
+
+
+def test_compressed_liberty():
+    import os.path
+    import tempfile
+    lib_file = os.path.join(os.path.dirname(__file__), '../test_data/gscl45nm.lib')
+    library = load_liberty(lib_file, engine='fast')
+    with tempfile.TemporaryDirectory() as d:
+        out_file = os.path.join(d, 'out.lib.gz')
+        save_liberty(library, out_file)
+        assert detect_compression(out_file) == 'gzip'
+        for kwargs in [dict(engine='fast'), dict(engine='lark'), dict(lazy=True),
+                       dict(cache=d)]:
+            assert str(load_liberty(out_file, **kwargs)) == str(library)
+
+
+def test_import_time():
+    import os.path
+    import subprocess
+    root = os.path.join(os.path.dirname(__file__), '..')
+    code = "import sys, liberty.parser; print(sorted({'lark', 'sympy'} & set(sys.modules)))"
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=root,
+                         capture_output=True, text=True, check=True)
+    # Lark and sympy are loaded on demand only.
+    assert out.stdout.strip() == '[]'
+    # Lines of the form 'import time: self [us] | cumulative | module'.
+    cumulative = {line.split('|')[2].strip(): int(line.split('|')[1])
+                  for line in out.stderr.splitlines() if line.count('|') == 2
+                  and line.split('|')[1].strip().isdigit()}
+    assert cumulative['liberty.parser'] < IMPORT_TIME_BUDGET * 1e6
+
+    code = "import sys, liberty.types; liberty.types.parse_boolean_function('A'); " \
+           "print('sympy' in sys.modules)"
+    out = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True,
+                         text=True, check=True)
+    assert out.stdout.strip() == 'True'
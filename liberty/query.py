@@ -0,0 +1,315 @@
+##
+## Copyright (c) 2019 Thomas Kramer.
+##
+## This file is part of liberty-parser
+## (see https://codeberg.org/tok/liberty-parser).
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Path queries over `Group` trees.
+
+A query is a path of steps separated by `/`, evaluated from the children of a group::
+
+    cell[*]/pin[direction=output]/timing[related_pin=A]/cell_rise
+
+Each step matches sub-groups by name (`*` for any name) and optional predicates:
+
+* `[*]`: any group,
+* `[INVX1]`: the first argument, `*` and `?` are wildcards (`[INV*]`),
+* `[attribute=value]`, `[attribute!=value]`: value of a simple attribute, with wildcards,
+* values can be quoted: `[when="A & B"]`.
+
+A step `**` matches any number of levels, e.g. `cell[*]/**/pin[*]` also finds the pins
+of buses. Queries are compiled once into a plan (`compile_query`, memoized) and evaluated
+in one traversal. Steps with an exact name and argument or attribute value use the child
+index of the groups (see `Group.get_groups`).
+"""
+import re
+from fnmatch import fnmatchcase
+from functools import lru_cache
+from typing import Callable, List, NamedTuple, Optional, Tuple
+import numpy as np
+from .types import Group, _text
+from .stats import instrumented_query
+
+_step_regex = re.compile(r'(\*\*|\*|[A-Za-z_][A-Za-z0-9_]*)((?:\[(?:"[^"]*"|[^\]"])*\])*)$')
+_predicate_regex = re.compile(r'\[((?:"[^"]*"|[^\]"])*)\]')
+_comparison_regex = re.compile(r'\s*([A-Za-z_][A-Za-z0-9_]*)\s*(!?=)\s*(.*?)\s*$')
+# Text of numbers and numbers with unit (`WithUnit`).
+_number_regex = re.compile(r'[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?(?:[A-Za-z_]\w*)?$')
+
+
+def _unquote(s: str) -> str:
+    s = s.strip()
+    if len(s) >= 2 and s[0] == '"' and s[-1] == '"':
+        return s[1:-1]
+    return s
+
+
+def _is_pattern(s: str) -> bool:
+    return '*' in s or '?' in s
+
+
+def _matcher(pattern: str) -> Callable[[Optional[str]], bool]:
+    if _is_pattern(pattern):
+        return lambda s: s is not None and fnmatchcase(s, pattern)
+    return lambda s: s == pattern
+
+
+class _Step(NamedTuple):
+    # Group name, `None` for any name.
+    name: Optional[str]
+    # Exact first argument, looked up in the child index.
+    argument: Optional[str]
+    # Exact (attribute, value), looked up in the child index if there is no `argument`.
+    attribute: Optional[Tuple[str, str]]
+    # Further predicates which all must hold.
+    predicates: Tuple[Callable[[Group], bool], ...]
+    # `**` step.
+    recursive: bool = False
+
+
+def _argument_predicate(pattern: str) -> Callable[[Group], bool]:
+    match = _matcher(pattern)
+    return lambda g: len(g.args) > 0 and match(_text(g.args[0]))
+
+
+def _attribute_predicate(attribute: str, negate: bool, pattern: str) -> Callable[[Group], bool]:
+    match = _matcher(pattern)
+    if negate:
+        return lambda g: not match(_text(_simple_value(g, attribute)))
+    return lambda g: match(_text(_simple_value(g, attribute)))
+
+
+def _simple_value(group: Group, attribute: str):
+    values = group.attributes.get(attribute)
+    if values is None or len(values) != 1:
+        return None
+    return values[0]
+
+
+def _compile_step(step: str, query: str) -> _Step:
+    m = _step_regex.match(step.strip())
+    if m is None:
+        raise ValueError("Invalid step '{}' in query '{}'.".format(step, query))
+    name, predicate_text = m.groups()
+    if name == '**':
+        if predicate_text:
+            raise ValueError("'**' takes no predicates in query '{}'.".format(query))
+        return _Step(None, None, None, (), True)
+    name = None if name == '*' else name
+    argument = None
+    attribute = None
+    # The predicate answered by an index lookup is not checked again.
+    predicates = []
+    for p in _predicate_regex.findall(predicate_text):
+        if p.strip() == '*':
+            continue
+        comparison = _comparison_regex.match(p)
+        if comparison is None:
+            pattern = _unquote(p)
+            if name is not None and argument is None and not _is_pattern(pattern):
+                argument = pattern
+            else:
+                predicates.append(_argument_predicate(pattern))
+        else:
+            attribute_name, operator, value = comparison.groups()
+            pattern = _unquote(value)
+            # The index is keyed by the values, which only equal their text for strings.
+            # Numbers (with unit) are compared by their text instead.
+            if name is not None and attribute is None and operator == '=' \
+                    and not _is_pattern(pattern) and not _number_regex.match(pattern):
+                attribute = (attribute_name, pattern)
+            else:
+                predicates.append(_attribute_predicate(attribute_name, operator == '!=',
+                                                       pattern))
+    if argument is not None and attribute is not None:
+        # Only one lookup is used, the argument is more selective.
+        predicates.append(_attribute_predicate(attribute[0], False, attribute[1]))
+        attribute = None
+    return _Step(name, argument, attribute, tuple(predicates))
+
+
+class Query:
+    """
+    Compiled path query, see the module documentation.
+    """
+
+    def __init__(self, query: str):
+        self.query = query
+        steps = [s for s in query.strip().strip('/').split('/')]
+        if not steps or any(not s.strip() for s in steps):
+            raise ValueError("Invalid query '{}'.".format(query))
+        self._steps = tuple(_compile_step(s, query) for s in steps)
+
+    def __repr__(self):
+        return 'Query({!r})'.format(self.query)
+
+    def _candidates(self, group: Group, step: _Step) -> List[Group]:
+        if not group._groups:
+            return []
+        if step.name is None:
+            # `groups` loads the cells of a `LazyLibrary`.
+            return group.groups
+        if step.argument is not None:
+            return group.get_groups(step.name, step.argument)
+        if step.attribute is not None:
+            return group.get_groups_by_attribute(step.name, *step.attribute)
+        return group.get_groups(step.name)
+
+    def _evaluate(self, group: Group, i: int, path: Tuple[Group, ...], result: list,
+                  with_paths: bool):
+        steps = self._steps
+        if i == len(steps):
+            result.append(path if with_paths else group)
+            return
+        step = steps[i]
+        if step.recursive:
+            # Zero levels, then one more level.
+            self._evaluate(group, i + 1, path, result, with_paths)
+            for child in group.groups if group._groups else ():
+                self._evaluate(child, i, path + (child,) if with_paths else path, result,
+                               with_paths)
+            return
+        predicates = step.predicates
+        for child in self._candidates(group, step):
+            for p in predicates:
+                if not p(child):
+                    break
+            else:
+                self._evaluate(child, i + 1, path + (child,) if with_paths else path, result,
+                               with_paths)
+
+    def groups(self, root: Group) -> List[Group]:
+        """
+        Evaluate the query.
+        :param root: Group whose sub-groups are matched by the first step, usually the library.
+        :return: Matching groups in tree order.
+        """
+        result = []
+        self._evaluate(root, 0, (), result, False)
+        return result
+
+    def paths(self, root: Group) -> List[Tuple[Group, ...]]:
+        """
+        Evaluate the query and return the matched group of every step, e.g. the cell, pin,
+        timing and table group for each table.
+        """
+        result = []
+        self._evaluate(root, 0, (), result, True)
+        return result
+
+    def values(self, root: Group, attribute: str) -> List:
+        """
+        Get the value of an attribute of all matching groups, `None` where it is missing.
+        """
+        return [g.get(attribute) for g in self.groups(root)]
+
+    def arrays(self, root: Group, attribute: str = 'values', dtype=np.float64,
+               fill=None) -> np.ndarray:
+        """
+        Stack a table attribute of all matching groups into one array.
+        :param fill: Pad tables of different shapes to the largest shape with this value,
+            e.g. `np.nan`. If `None`, all tables must have the same shape.
+        :return: Array of shape `(number of groups,) + table shape`.
+        """
+        arrays = [np.asarray(g.get_array(attribute), dtype=dtype) for g in self.groups(root)]
+        if not arrays:
+            return np.zeros((0,), dtype=dtype)
+        shapes = {a.shape for a in arrays}
+        if len(shapes) == 1:
+            return np.stack(arrays)
+        if fill is None or len({len(s) for s in shapes}) > 1:
+            raise ValueError("Tables of different shapes can not be stacked: {}"
+                             .format(sorted(shapes)))
+        shape = tuple(np.max(list(shapes), axis=0))
+        result = np.full((len(arrays),) + shape, fill, dtype=dtype)
+        for i, a in enumerate(arrays):
+            result[(i,) + tuple(slice(0, n) for n in a.shape)] = a
+        return result
+
+
+@lru_cache(maxsize=1024)
+def compile_query(query: str) -> Query:
+    """
+    Compile a path query. Compiled queries are memoized.
+    """
+    return Query(query)
+
+
+@instrumented_query
+def select(root: Group, query: str) -> List[Group]:
+    """
+    Select all groups matching a path query, e.g.
+    `select(library, 'cell[*]/pin[direction=output]/timing[related_pin=A]/cell_rise')`.
+    """
+    return compile_query(query).groups(root)
+
+
+def test_query():
+    import os.path
+    from .parser import load_liberty
+    from .types import select_cell, select_pin, select_timing_table
+    lib_file = os.path.join(os.path.dirname(__file__), '../test_data/gscl45nm.lib')
+    library = load_liberty(lib_file, engine='fast')
+
+    tables = select(library, 'cell[*]/pin[direction=output]/timing[related_pin=A]/cell_rise')
+    expected = []
+    for cell in library.get_groups('cell'):
+        for pin in cell.get_groups('pin'):
+            if pin.get('direction') == 'output':
+                for timing in pin.get_groups_by_attribute('timing', 'related_pin', 'A'):
+                    expected.extend(timing.get_groups('cell_rise'))
+    assert tables == expected and len(tables) > 5
+
+    xor = select_timing_table(select_pin(select_cell(library, 'XOR2X1'), 'Y'), 'A', 'cell_rise')
+    assert select(library, 'cell[XOR2X1]/pin[Y]/timing[related_pin="A"]/cell_rise') == [xor]
+    timing = select_pin(select_cell(library, 'XOR2X1'), 'Y') \
+        .get_groups_by_attribute('timing', 'related_pin', 'A')[0]
+    assert select(library, 'cell[XOR*]/pin[Y]/timing[related_pin=A]/*') == list(timing.groups)
+
+    q = compile_query('cell[INV*]/pin[direction!=input]/timing[*]/cell_rise')
+    assert compile_query('cell[INV*]/pin[direction!=input]/timing[*]/cell_rise') is q
+    paths = q.paths(library)
+    assert all(p[0].args[0].startswith('INV') and p[1]['direction'] == 'output' for p in paths)
+    arrays = q.arrays(library, fill=np.nan)
+    assert arrays.shape == (len(paths), 6, 6)
+    first = paths[0][-1].get_array('values')
+    assert np.array_equal(arrays[0][:first.shape[0], :first.shape[1]], first)
+
+    assert len(select(library, '**/cell_rise')) == len(select(library, 'cell/pin/timing/cell_rise'))
+    assert select(library, 'cell[NO_SUCH_CELL]/pin') == []
+
+    # Wildcard and recursive steps load the cells of lazy libraries.
+    from .lazy import load_liberty_lazy
+    expected = len(select(library, 'cell/pin/timing/cell_rise'))
+    assert len(select(load_liberty_lazy(lib_file), '*/pin/timing/cell_rise')) == expected
+    assert len(select(load_liberty_lazy(lib_file), '**/cell_rise')) == expected
+
+    # Values with unit match by their text, with and without the index.
+    from .types import WithUnit
+    pins = [Group('pin', ['A'], {'max_transition': [WithUnit(1, 'ns')]}),
+            Group('pin', ['B'], {'max_transition': [2]})]
+    cell = Group('cell', ['X'], groups=pins)
+    root = Group('library', ['l'], groups=[cell])
+    assert select(root, 'cell/pin[max_transition=1ns]') == [cell.groups[0]]
+    assert select(root, 'cell/*[max_transition=1ns]') == [cell.groups[0]]
+    assert select(root, 'cell/pin[max_transition=2]') == [cell.groups[1]]
+    for invalid in ['', 'cell[', 'cell//pin', '**[x]']:
+        try:
+            compile_query(invalid)
+            assert False
+        except ValueError:
+            pass
@@ -0,0 +1,256 @@
+##
+## Copyright (c) 2019 Thomas Kramer.
+##
+## This file is part of liberty-parser
+## (see https://codeberg.org/tok/liberty-parser).
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Sharing a parsed library between processes.
+
+`share_library` publishes a library into a `multiprocessing.shared_memory` block (or
+`write_mapped_library` into a file) in one flat layout: the numbers of all tables in one
+float64 array followed by the pickled tree structure, see `liberty.snapshot`. Workers call
+`attach_library` (or `load_mapped_library`) and get a normal `Group` tree whose tables are
+read-only views into the shared numbers. Only the tree structure is built per process; the
+tables, which make up most of a library, exist once.
+
+Example::
+
+    # Parent
+    with share_library(library) as shared:
+        pool.map(work, [shared.name] * 64)
+
+    # Worker
+    def work(name):
+        library = attach_library(name)
+        ...
+
+Without shared memory, `dumps_out_of_band` pickles with protocol 5 and passes the buffers
+of array tables (see `Group.convert_tables`) out-of-band, without copying them into the
+pickle.
+"""
+import io
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, List, Optional, Set, Tuple
+import numpy as np
+from .snapshot import dump_tree, load_tree
+from .types import Group
+
+MAGIC = b'LIBSHM\x00\x01'
+
+# Magic, number of numbers, length of the tree.
+_header = struct.Struct('<8sQQ')
+
+# Offset of the numbers.
+_numbers_offset = 64
+
+# Shared memory blocks created or attached by this process, by name.
+_published: Set[str] = set()
+_attached: Dict[str, shared_memory.SharedMemory] = dict()
+
+
+def _layout(library: Group) -> Tuple[memoryview, np.ndarray, int]:
+    tree, numbers = dump_tree(library)
+    return tree, numbers, _numbers_offset + numbers.nbytes + len(tree)
+
+
+def _write(buffer, tree: memoryview, numbers: np.ndarray):
+    buffer[:_header.size] = _header.pack(MAGIC, len(numbers), len(tree))
+    end = _numbers_offset + numbers.nbytes
+    buffer[_numbers_offset:end] = numbers.tobytes()
+    buffer[end:end + len(tree)] = tree
+
+
+def _read(buffer) -> Group:
+    magic, num_numbers, tree_length = _header.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a shared liberty library.")
+    numbers = np.frombuffer(buffer, dtype='<f8', count=num_numbers, offset=_numbers_offset)
+    numbers.flags.writeable = False
+    start = _numbers_offset + numbers.nbytes
+    tree = io.BytesIO(buffer[start:start + tree_length])
+    return load_tree(tree, numbers)
+
+
+class SharedLibrary:
+    """
+    Library published in a shared memory block. The block lives until `unlink` is called,
+    which the context manager does on exit.
+    """
+
+    def __init__(self, library: Group, name: Optional[str] = None):
+        tree, numbers, size = _layout(library)
+        self._shm = shared_memory.SharedMemory(name, create=True, size=size)
+        _published.add(self._shm.name)
+        _write(self._shm.buf, tree, numbers)
+
+    @property
+    def name(self) -> str:
+        """
+        Name of the shared memory block, passed to `attach_library`.
+        """
+        return self._shm.name
+
+    @property
+    def size(self) -> int:
+        return self._shm.size
+
+    def close(self):
+        self._shm.close()
+
+    def unlink(self):
+        """
+        Remove the shared memory block. Attached processes keep their mapping.
+        """
+        self._shm.unlink()
+        _published.discard(self._shm.name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        self.unlink()
+
+
+def share_library(library: Group, name: Optional[str] = None) -> SharedLibrary:
+    """
+    Publish a library in shared memory.
+    :param library: Library group.
+    :param name: Name of the shared memory block. Chosen randomly if `None`.
+    :return: `SharedLibrary`.
+    """
+    return SharedLibrary(library, name)
+
+
+def _open_shared_memory(name: str) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        pass
+    shm = shared_memory.SharedMemory(name)
+    if name not in _published:
+        # Before Python 3.13, attached blocks are registered with the resource tracker,
+        # which unlinks them when this process exits.
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+def attach_library(name: str) -> Group:
+    """
+    Get a library published with `share_library`.
+    Tables are read-only views into the shared memory block, which stays mapped until
+    `detach_library` is called.
+    """
+    shm = _attached.get(name)
+    if shm is None:
+        shm = _attached[name] = _open_shared_memory(name)
+    return _read(shm.buf)
+
+
+def detach_library(name: str):
+    """
+    Unmap a shared memory block. All libraries attached from it must be deleted before.
+    """
+    shm = _attached.pop(name, None)
+    if shm is not None:
+        shm.close()
+
+
+def write_mapped_library(library: Group, filename: str):
+    """
+    Write a library in the layout of `share_library` into a file, for `load_mapped_library`.
+    """
+    tree, numbers, size = _layout(library)
+    buffer = bytearray(size)
+    _write(memoryview(buffer), tree, numbers)
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_name = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(buffer)
+        os.replace(tmp_name, filename)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+
+def load_mapped_library(filename: str) -> Group:
+    """
+    Load a library written by `write_mapped_library`. The file is memory-mapped, the
+    tables are read-only views into the mapping, shared by all processes mapping the file.
+    """
+    with open(filename, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return _read(buffer)
+
+
+def dumps_out_of_band(library: Group) -> Tuple[bytes, List[pickle.PickleBuffer]]:
+    """
+    Pickle a library with protocol 5. The buffers of array tables are not copied into the
+    pickle but returned separately, e.g. to be sent with `Connection.send_bytes`.
+    """
+    buffers = []
+    data = pickle.dumps(library, protocol=5, buffer_callback=buffers.append)
+    return data, buffers
+
+
+def loads_out_of_band(data: bytes, buffers) -> Group:
+    """
+    Load a library pickled by `dumps_out_of_band`. Array tables are views into `buffers`.
+    """
+    return pickle.loads(data, buffers=buffers)
+
+
+def _cell_area(name: str, cell_name: str):
+    from .types import select_cell
+    library = attach_library(name)
+    return select_cell(library, cell_name)['area']
+
+
+def test_share_library():
+    import multiprocessing
+    from .parser import load_liberty
+    from .types import select_cell
+    lib_file = os.path.join(os.path.dirname(__file__), '../test_data/gscl45nm.lib')
+    library = load_liberty(lib_file, engine='fast', table_dtype=np.float64)
+    expected = str(library)
+    with share_library(library) as shared:
+        attached = attach_library(shared.name)
+        assert str(attached) == expected
+        values = select_cell(attached, 'INVX1').get_group('pin', 'Y').get_groups('timing')[0] \
+            .get_group('cell_rise').get_array('values')
+        assert not values.flags.writeable
+        with multiprocessing.Pool(2) as pool:
+            areas = pool.starmap(_cell_area, [(shared.name, 'INVX1'), (shared.name, 'XOR2X1')])
+        assert areas == [select_cell(library, 'INVX1')['area'],
+                         select_cell(library, 'XOR2X1')['area']]
+        del attached, values
+        detach_library(shared.name)
+
+    with tempfile.TemporaryDirectory() as d:
+        filename = os.path.join(d, 'lib.shm')
+        write_mapped_library(library, filename)
+        assert str(load_mapped_library(filename)) == expected
+
+    data, buffers = dumps_out_of_band(library)
+    assert len(buffers) > 0
+    assert str(loads_out_of_band(data, buffers)) == expected
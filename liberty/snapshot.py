@@ -0,0 +1,450 @@
+##
+## Copyright (c) 2019 Thomas Kramer.
+##
+## This file is part of liberty-parser
+## (see https://codeberg.org/tok/liberty-parser).
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Binary snapshots of parsed libraries.
+
+A snapshot stores a `Group` tree in a compact binary form which loads much faster than
+parsing the liberty source again. Numeric tables (lists of strings like `"0.1, 0.2"`)
+are stored as packed float arrays whenever the original text can be reproduced exactly.
+
+Snapshots can be used as a persistent cache: `load_cached` keeps one snapshot per source
+file either next to the source or in a cache directory. A snapshot is only used if size,
+modification time and content hash of the source as well as the snapshot version match.
+Snapshots are loaded with `pickle`, hence only snapshots from trusted locations must be used.
+"""
+import gc
+import hashlib
+import io
+import os
+import pickle
+import struct
+import tempfile
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from .types import Group, EscapedString
+
+# Increment whenever the parser output or the snapshot format changes.
+SNAPSHOT_VERSION = 4
+
+MAGIC = b'LIBERTY-SNAPSHOT\n'
+
+SNAPSHOT_SUFFIX = '.lsnap'
+
+# Default size limit of a cache directory in bytes.
+DEFAULT_MAX_BYTES = 4 << 30
+
+# Styles for formatting numbers of a table row.
+_style_repr = 0  # '1.0, 0.25'
+_style_int = 1  # '1, 0.25'
+
+
+def _format_row(values: List[float], style: int) -> str:
+    s = ', '.join(map(repr, values))
+    if style == _style_int:
+        # Strip '.0' of integral numbers.
+        s = (s + ',').replace('.0,', ',')[:-1]
+    return s
+
+
+def _pack_table(rows: List[EscapedString]):
+    """
+    Convert the rows of a table into numbers.
+    :return: Tuple `(style, numbers, number of columns)` or `None` if the table is not
+        rectangular or the text can not be reproduced exactly from the numbers.
+    """
+    texts = [r.value for r in rows]
+    try:
+        parsed = [[float(x) for x in t.split(', ')] for t in texts]
+    except ValueError:
+        return None
+    num_cols = len(parsed[0])
+    if any(len(p) != num_cols for p in parsed):
+        return None
+    for style in (_style_int, _style_repr):
+        if all(_format_row(p, style) == t for p, t in zip(parsed, texts)):
+            return style, [x for p in parsed for x in p], num_cols
+    return None
+
+
+class _SnapshotPickler(pickle.Pickler):
+    """
+    Pickler that moves the numbers of all tables into one float buffer.
+    Text tables are replaced by persistent ids `('t', style, offset, rows, columns)` and
+    float arrays by `('a', offset, shape)` pointing into the buffer.
+    """
+
+    def __init__(self, file, protocol):
+        super().__init__(file, protocol)
+        self.numbers: List[float] = []
+
+    def persistent_id(self, obj):
+        if type(obj) is list and obj and isinstance(obj[0], EscapedString) \
+                and all(isinstance(x, EscapedString) for x in obj):
+            packed = _pack_table(obj)
+            if packed is not None:
+                style, numbers, num_cols = packed
+                offset = len(self.numbers)
+                self.numbers.extend(numbers)
+                return 't', style, offset, len(obj), num_cols
+        elif type(obj) is np.ndarray and obj.dtype == np.float64:
+            offset = len(self.numbers)
+            self.numbers.extend(obj.ravel().tolist())
+            return 'a', offset, obj.shape
+        return None
+
+
+class _PackedRow(EscapedString):
+    """
+    Row of a table loaded from a snapshot.
+    The text is formatted from the numbers only when it is used for the first time.
+    """
+    __slots__ = ('_value', '_numbers', '_start', '_length', '_style')
+
+    def __init__(self, numbers: np.ndarray, start: int, length: int, style: int):
+        self._value = None
+        self._numbers = numbers
+        self._start = start
+        self._length = length
+        self._style = style
+
+    @property
+    def value(self) -> str:
+        if self._value is None:
+            start = self._start
+            numbers = self._numbers[start:start + self._length].tolist()
+            self._value = _format_row(numbers, self._style)
+            self._numbers = None
+        return self._value
+
+    @value.setter
+    def value(self, value: str):
+        self._value = value
+        self._numbers = None
+
+    def __reduce__(self):
+        return EscapedString, (self.value,)
+
+
+class _SnapshotUnpickler(pickle.Unpickler):
+
+    def __init__(self, file, numbers: np.ndarray):
+        super().__init__(file)
+        self.numbers = numbers
+
+    def persistent_load(self, pid):
+        numbers = self.numbers
+        if pid[0] == 'a':
+            _, offset, shape = pid
+            # A view into the buffer.
+            return numbers[offset:offset + int(np.prod(shape))].reshape(shape)
+        _, style, offset, num_rows, num_cols = pid
+        return [_PackedRow(numbers, start, num_cols, style)
+                for start in range(offset, offset + num_rows * num_cols, num_cols)]
+
+
+def dump_snapshot(library: Group, f, header: Optional[Dict] = None):
+    """
+    Write a library as snapshot into a binary file object.
+    :param library: Library to be stored.
+    :param f: File object opened for binary writing.
+    :param header: Additional metadata stored in front of the library.
+    """
+    header = dict(header or {})
+    header['version'] = SNAPSHOT_VERSION
+    tree, numbers = dump_tree(library)
+    f.write(MAGIC)
+    pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+    f.write(struct.pack('<Q', len(numbers)))
+    f.write(numbers.tobytes())
+    f.write(tree)
+
+
+def dump_tree(library: Group) -> Tuple[memoryview, np.ndarray]:
+    """
+    Pickle a library with the numbers of all tables moved into one array.
+    :return: Tuple of the pickled tree and the numbers, see `load_tree`.
+    """
+    tree = io.BytesIO()
+    pickler = _SnapshotPickler(tree, protocol=pickle.HIGHEST_PROTOCOL)
+    pickler.dump(library)
+    return tree.getbuffer(), np.array(pickler.numbers, dtype='<f8')
+
+
+def write_snapshot(library: Group, filename: str, header: Optional[Dict] = None):
+    """
+    Write a library into a snapshot file.
+    The file is written atomically: readers either see the old or the complete new file.
+    :param library: Library to be stored.
+    :param filename: Path of the snapshot file.
+    :param header: Additional metadata stored in front of the library.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_name = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            dump_snapshot(library, f, header)
+        os.replace(tmp_name, filename)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+
+def dumps(library: Group) -> bytes:
+    """
+    Serialize a library into snapshot bytes.
+    This is much more compact and faster to load than pickling the `Group` tree.
+    """
+    f = io.BytesIO()
+    dump_snapshot(library, f)
+    return f.getvalue()
+
+
+def loads(data: bytes) -> Group:
+    """
+    Load a library from snapshot bytes created by `dumps`.
+    """
+    return load_snapshot(io.BytesIO(data))
+
+
+def read_snapshot_header(f) -> Optional[Dict]:
+    """
+    Read the header of a snapshot from an open binary file.
+    :return: Header dict or `None` if this is not a snapshot of the current version.
+    """
+    if f.read(len(MAGIC)) != MAGIC:
+        return None
+    try:
+        header = pickle.load(f)
+    except Exception:
+        return None
+    if not isinstance(header, dict) or header.get('version') != SNAPSHOT_VERSION:
+        return None
+    return header
+
+
+def load_snapshot(f) -> Group:
+    """
+    Load a library from a binary file object containing a snapshot.
+    """
+    if read_snapshot_header(f) is None:
+        raise ValueError("Not a liberty snapshot of version {}.".format(SNAPSHOT_VERSION))
+    return _load_body(f)
+
+
+def read_snapshot(filename: str) -> Group:
+    """
+    Load a library from a snapshot file.
+    """
+    with open(filename, 'rb') as f:
+        return load_snapshot(f)
+
+
+def _load_body(f) -> Group:
+    num_numbers, = struct.unpack('<Q', f.read(8))
+    # Writable, such that tables loaded as arrays can be modified in place.
+    numbers = np.frombuffer(bytearray(f.read(8 * num_numbers)), dtype='<f8')
+    return load_tree(f, numbers)
+
+
+def load_tree(f, numbers: np.ndarray) -> Group:
+    """
+    Unpickle a tree written by `_SnapshotPickler`.
+    :param f: Binary file object positioned at the pickled tree.
+    :param numbers: The number buffer of the tree. Tables are loaded as views into it.
+    """
+    # The garbage collector is of no use while building a large object tree
+    # but takes a big share of the run time.
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _SnapshotUnpickler(f, numbers).load()
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def file_hash(filename: str) -> str:
+    """
+    Compute the content hash of a file.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    with open(filename, 'rb') as f:
+        while True:
+            chunk = f.read(1 << 20)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def snapshot_path(filename: str, cache_dir: Optional[str] = None,
+                  variant: Optional[str] = None) -> str:
+    """
+    Get the location of the snapshot of a liberty file.
+    :param filename: Path of the liberty file.
+    :param cache_dir: Cache directory. If `None`, the snapshot is located next to the source.
+    :param variant: Distinguishes snapshots of the same file parsed with different options.
+    """
+    suffix = SNAPSHOT_SUFFIX if variant is None else '.{}{}'.format(variant, SNAPSHOT_SUFFIX)
+    if cache_dir is None:
+        return filename + suffix
+    path_hash = hashlib.blake2b(os.path.abspath(filename).encode(), digest_size=16).hexdigest()
+    name = '{}-{}{}'.format(os.path.basename(filename), path_hash, suffix)
+    return os.path.join(cache_dir, name)
+
+
+def evict(cache_dir: str, max_bytes: int):
+    """
+    Delete the least recently used snapshots until the cache directory holds at most
+    `max_bytes` of snapshots.
+    """
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(SNAPSHOT_SUFFIX) and entry.is_file():
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(e[1] for e in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.unlink(path)
+        except OSError:
+            continue
+        total -= size
+
+
+def load_cached(filename: str,
+                parse: Callable[[str], Group],
+                cache_dir: Optional[str] = None,
+                max_bytes: int = DEFAULT_MAX_BYTES,
+                verify_hash: bool = True,
+                variant: Optional[str] = None) -> Group:
+    """
+    Load a liberty file using a snapshot cache.
+    :param filename: Path of the liberty file.
+    :param parse: Function that parses the liberty file when no valid snapshot exists.
+    :param cache_dir: Directory of the snapshots. If `None`, the snapshot is stored next to
+        the liberty file and no eviction takes place.
+    :param max_bytes: Size limit of the cache directory.
+    :param verify_hash: Compare the content hash of the file with the snapshot. If `False`,
+        size and modification time of the file must match only.
+    :param variant: Name of the parse options, see `snapshot_path`.
+    :return: `Group` object of library.
+    """
+    stat = os.stat(filename)
+    snap_file = snapshot_path(filename, cache_dir, variant)
+    content_hash = None
+
+    try:
+        with open(snap_file, 'rb') as f:
+            header = read_snapshot_header(f)
+            if header is not None \
+                    and header.get('size') == stat.st_size \
+                    and header.get('mtime_ns') == stat.st_mtime_ns:
+                if verify_hash:
+                    content_hash = file_hash(filename)
+                if not verify_hash or header.get('content_hash') == content_hash:
+                    library = _load_body(f)
+                    if cache_dir is not None:
+                        # Mark as recently used.
+                        os.utime(snap_file)
+                    return library
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, struct.error, pickle.UnpicklingError, EOFError):
+        # Broken snapshot. It will be replaced.
+        pass
+
+    library = parse(filename)
+
+    if content_hash is None:
+        content_hash = file_hash(filename)
+    header = {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'content_hash': content_hash,
+    }
+    try:
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+        write_snapshot(library, snap_file, header)
+        if cache_dir is not None:
+            evict(cache_dir, max_bytes)
+    except OSError:
+        # The cache is an optimization only.
+        pass
+    return library
+
+
+def test_snapshot():
+    import os.path
+    from .fast_parser import parse_liberty_fast
+    lib_file = os.path.join(os.path.dirname(__file__), '../test_data/gscl45nm.lib')
+    library = parse_liberty_fast(open(lib_file).read())
+
+    with tempfile.TemporaryDirectory() as d:
+        snap_file = os.path.join(d, 'lib' + SNAPSHOT_SUFFIX)
+        write_snapshot(library, snap_file)
+        assert str(read_snapshot(snap_file)) == str(library)
+        assert str(loads(dumps(library))) == str(library)
+        # Tables are packed.
+        assert os.path.getsize(snap_file) < os.path.getsize(lib_file)
+
+        library.convert_tables()
+        loaded = loads(dumps(library))
+        assert str(loaded) == str(library)
+        cell = loaded.get_group('cell', 'INVX1')
+        table = cell.get_group('pin', 'Y').get_group('timing').get_group('cell_rise')
+        assert isinstance(table['values'], np.ndarray)
+
+
+def test_load_cached():
+    import os.path
+    import shutil
+    from .fast_parser import parse_liberty_fast
+    lib_file = os.path.join(os.path.dirname(__file__), '../test_data/gscl45nm.lib')
+
+    parsed = []
+
+    def parse(filename):
+        parsed.append(filename)
+        return parse_liberty_fast(open(filename).read())
+
+    with tempfile.TemporaryDirectory() as d:
+        src = os.path.join(d, 'lib.lib')
+        shutil.copy(lib_file, src)
+        cache_dir = os.path.join(d, 'cache')
+
+        lib1 = load_cached(src, parse, cache_dir)
+        lib2 = load_cached(src, parse, cache_dir)
+        assert len(parsed) == 1
+        assert str(lib1) == str(lib2)
+
+        # Modified source invalidates the snapshot.
+        with open(src, 'a') as f:
+            f.write('\n')
+        load_cached(src, parse, cache_dir)
+        assert len(parsed) == 2
+        assert len(os.listdir(cache_dir)) == 1
+
+        # Eviction.
+        evict(cache_dir, 0)
+        assert len(os.listdir(cache_dir)) == 0
@@ -0,0 +1,336 @@
+##
+## Copyright (c) 2019 Thomas Kramer.
+##
+## This file is part of liberty-parser
+## (see https://codeberg.org/tok/liberty-parser).
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Write libraries back to their source file with minimal changes.
+
+When a library is loaded with `keep_source=True`, the byte range of every group in the
+source file is recorded. `save_liberty` then copies all unmodified groups verbatim from
+the memory-mapped source and formats only the modified groups. Save time is proportional
+to the size of the modifications plus one cheap check per group, and unmodified parts
+keep their original formatting and comments.
+
+A group counts as modified if its name, arguments, attribute dictionary, sub-group list or
+defines changed. Changes inside attribute values (e.g. appending to the value list of an
+attribute or editing a table array in place) are not detected and must be reported with
+`Group.mark_modified`.
+"""
+import mmap
+import os
+import tempfile
+from typing import List, Optional
+from .lazy import _brace_regex, encoding
+from .types import Group, AttributeDict
+
+_whitespace = b' \t\r\n'
+
+
+class SourceFile:
+    """
+    Memory-mapped liberty file which a library was parsed from.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                self.data = b''
+            else:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def text(self) -> str:
+        return self.data[:].decode(encoding)
+
+
+class _Span:
+    """
+    Location of a group in its source file and the state of the group after parsing.
+    """
+    __slots__ = ('source', 'start', 'end', 'modified', 'group_name', 'args', 'attributes',
+                 'attributes_version', 'groups', 'groups_version', 'defines', 'num_defines')
+
+    def __init__(self, source: SourceFile, start: int, end: int, group: Group):
+        self.source = source
+        self.start = start
+        self.end = end
+        self.modified = False
+        self.group_name = group.group_name
+        self.args = list(group.args)
+        self.attributes = group.attributes
+        self.attributes_version = group.attributes.version
+        self.groups = group._groups
+        self.groups_version = group._groups.version if group._groups is not None else 0
+        self.defines = group._defines
+        self.num_defines = len(group._defines) if group._defines is not None else 0
+
+    def is_clean(self, group: Group) -> bool:
+        """
+        Check if `group` (excluding its sub-groups) is unchanged since parsing.
+        """
+        if self.modified or group.attributes is not self.attributes \
+                or self.attributes.version != self.attributes_version:
+            return False
+        groups = group._groups
+        if self.groups is None:
+            if groups:
+                return False
+        elif groups is not self.groups or groups.version != self.groups_version:
+            return False
+        defines = group._defines
+        if self.defines is None:
+            if defines:
+                return False
+        elif defines is not self.defines or len(defines) != self.num_defines:
+            return False
+        return group.group_name == self.group_name and group.args == self.args
+
+
+def _group_start(data, brace: int) -> Optional[int]:
+    """
+    Find the start of the group header `name (args)` in front of an opening brace.
+    """
+    i = brace
+    while i > 0 and data[i - 1] in _whitespace:
+        i -= 1
+    if i == 0 or data[i - 1] != 0x29:  # ')'
+        return None
+    i = data.rfind(b'(', 0, i - 1)
+    while i > 0 and data[i - 1] in _whitespace:
+        i -= 1
+    end = i
+    while i > 0 and (data[i - 1] == 0x5f or chr(data[i - 1]).isalnum()):
+        i -= 1
+    return i if i < end else None
+
+
+def group_spans(data) -> Optional[List[List[int]]]:
+    """
+    Find the byte ranges of all groups.
+    :param data: Liberty file content as bytes or mmap.
+    :return: List of `[start, end]` in the order of the opening braces, or `None` if a
+        group header could not be located.
+    """
+    spans = []
+    stack = []
+    for m in _brace_regex.finditer(data):
+        pos = m.start(1)
+        if data[pos] == 0x7b:  # '{'
+            start = _group_start(data, pos)
+            if start is None:
+                return None
+            stack.append(len(spans))
+            spans.append([start, None])
+        elif stack:
+            spans[stack.pop()][1] = pos + 1
+        else:
+            return None
+    return spans if not stack else None
+
+
+def attach_source(library: Group, source: SourceFile) -> bool:
+    """
+    Record the source locations of all groups of a library parsed from `source`.
+    Attribute dictionaries are replaced by `AttributeDict`s to detect modifications.
+    :return: `False` if the groups could not be matched with the source. The library is
+        left unchanged then.
+    """
+    spans = group_spans(source.data)
+    if spans is None:
+        return False
+    groups = []
+    stack = [library]
+    while stack:
+        g = stack.pop()
+        groups.append(g)
+        if g._groups:
+            stack.extend(reversed(g._groups))
+    if len(groups) != len(spans):
+        return False
+    data = source.data
+    for g, (start, end) in zip(groups, spans):
+        name_end = data.find(b'(', start)
+        if data[start:name_end].rstrip().decode(encoding) != g.group_name:
+            return False
+    for g, (start, end) in zip(groups, spans):
+        if type(g.attributes) is not AttributeDict:
+            g.attributes = AttributeDict(g.attributes)
+        g._source = _Span(source, start, end, g)
+    return True
+
+
+class _SpliceWriter:
+
+    def __init__(self, f, source: SourceFile, indent: str):
+        self.f = f
+        self.source = source
+        self.view = memoryview(source.data) if len(source.data) else b''
+        self.indent = indent
+
+    def copy(self, start: int, end: int):
+        if end > start:
+            self.f.write(self.view[start:end])
+
+    def text(self, s: str):
+        self.f.write(s.encode(encoding))
+
+    def is_clean(self, g: Group) -> bool:
+        span = g._source
+        return span is not None and span.source is self.source and span.is_clean(g)
+
+    def prefix_of(self, pos: int) -> str:
+        """
+        Indentation of the line containing `pos`, if only whitespace precedes `pos`.
+        """
+        data = self.source.data
+        line_start = data.rfind(b'\n', 0, pos) + 1
+        prefix = data[line_start:pos]
+        if prefix.strip(_whitespace):
+            return ''
+        return prefix.decode(encoding)
+
+    def splice(self, group: Group):
+        """
+        Write an unmodified group from the source. Modified groups inside are formatted.
+        """
+        span = group._source
+        cursor = span.start
+        stack = [iter(group._groups or ())]
+        while stack:
+            child = next(stack[-1], None)
+            if child is None:
+                stack.pop()
+                continue
+            if self.is_clean(child):
+                stack.append(iter(child._groups or ()))
+                continue
+            # The sub-groups of an unmodified group are the parsed ones, hence they have
+            # a location in the source.
+            child_span = child._source
+            self.copy(cursor, child_span.start)
+            self.format(child, self.prefix_of(child_span.start))
+            cursor = child_span.end
+        self.copy(cursor, span.end)
+
+    def format(self, group: Group, prefix: str):
+        """
+        Format a modified group. The first line is not indented.
+        Unmodified sub-groups are copied from the source.
+        """
+        lines = []
+        group._emit_head(lines.append, self.indent, prefix)
+        self.text('\n'.join(lines)[len(prefix):])
+        inner = prefix + self.indent
+        for g in group._groups or ():
+            self.text('\n' + inner)
+            if self.is_clean(g):
+                self.splice(g)
+            else:
+                self.format(g, inner)
+        self.text('\n' + prefix + '}')
+
+
+def has_source(library: Group) -> bool:
+    """
+    Check if a library can be written with `write_spliced`.
+    """
+    return library._source is not None
+
+
+def write_spliced(library: Group, f, indent: str = " " * 2):
+    """
+    Write a library into a binary file object, copying unmodified groups from the source.
+    Text in front of and behind the library group (e.g. a copyright comment) is kept.
+    :param library: Library loaded with `keep_source=True`.
+    :param f: File object opened for binary writing.
+    :param indent: Indentation per nesting level of modified groups.
+    """
+    span = library._source
+    writer = _SpliceWriter(f, span.source, indent)
+    writer.copy(0, span.start)
+    if writer.is_clean(library):
+        writer.splice(library)
+    else:
+        writer.format(library, writer.prefix_of(span.start))
+    writer.copy(span.end, len(span.source.data))
+
+
+def save_spliced(library: Group, filename: str, indent: str = " " * 2):
+    """
+    Write a library into a file, copying unmodified groups from the source.
+    The file is replaced atomically, hence it can be the source file itself.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_name = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb', buffering=1 << 20) as f:
+            write_spliced(library, f, indent)
+        os.replace(tmp_name, filename)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+
+def test_write_spliced():
+    import io
+    import os.path
+    import shutil
+    from .fast_parser import parse_liberty_fast
+    from .types import select_cell, select_pin
+    lib_file = os.path.join(os.path.dirname(__file__), '../test_data/gscl45nm.lib')
+
+    with tempfile.TemporaryDirectory() as d:
+        src = os.path.join(d, 'lib.lib')
+        shutil.copy(lib_file, src)
+        source = SourceFile(src)
+        library = parse_liberty_fast(source.text())
+        assert attach_source(library, source)
+        original = open(src, 'rb').read()
+
+        def spliced() -> bytes:
+            f = io.BytesIO()
+            write_spliced(library, f)
+            return f.getvalue()
+
+        # Unmodified: identical to the source.
+        assert spliced() == original
+
+        # Modify a few groups.
+        cell = select_cell(library, 'INVX1')
+        cell['area'] = 42
+        pin = select_pin(select_cell(library, 'NAND2X1'), 'Y')
+        table = pin.get_groups('timing')[0].get_group('cell_rise')
+        table.set_array('values', table.get_array('values') * 2)
+        library.groups.append(Group('cell', ['NEW'], {'area': [1]}))
+        # In-place modifications must be marked.
+        pin_a = select_pin(select_cell(library, 'AND2X1'), 'A')
+        pin_a.attributes['capacitance'][0] = 123
+        pin_a.mark_modified()
+
+        out = spliced()
+        assert len(out) < 2 * len(original)
+        reparsed = parse_liberty_fast(out.decode())
+        assert select_cell(reparsed, 'INVX1')['area'] == 42
+        assert select_pin(select_cell(reparsed, 'AND2X1'), 'A')['capacitance'] == 123
+        assert str(reparsed) == str(library)
+        # Unmodified cells are copied.
+        xor = select_cell(library, 'XOR2X1')._source
+        assert original[xor.start:xor.end] in out
+
+        save_spliced(library, src)
+        assert open(src, 'rb').read() == out
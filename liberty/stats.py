@@ -0,0 +1,285 @@
+##
+## Copyright (c) 2019 Thomas Kramer.
+##
+## This file is part of liberty-parser
+## (see https://codeberg.org/tok/liberty-parser).
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Opt-in instrumentation of parsing and queries.
+
+Pass a `LibertyStats` object to `parse_liberty`/`load_liberty`, or collect the statistics
+of everything within a `with collect_stats() as stats:` block, which also covers the query
+helpers `select_cell`, `select_pin` and `select_timing_table`. Without an active stats
+object, the only overhead is a single check per call.
+
+While instrumented, phases which are normally interleaved are measured in extra passes
+(e.g. lexing is timed on its own before the actual parse, which lexes again), such that
+each phase can be timed on its own.
+"""
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from typing import Callable, Dict, Iterable, Optional
+
+# Signature of hooks: hook(event, name, value) with the events
+# 'phase' (value: seconds), 'count' (value: increment) and 'query' (value: seconds).
+Hook = Callable[[str, str, float], None]
+
+_local = threading.local()
+
+
+def _peak_rss() -> Optional[int]:
+    """
+    Peak resident set size of the process in bytes, `None` where it is not available
+    (Windows).
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class LibertyStats:
+    """
+    Timings and counts of parsing and query phases.
+    """
+
+    def __init__(self, hooks: Iterable[Hook] = (), trace_memory: bool = False):
+        """
+        :param hooks: Functions called on every finished phase, count and query.
+        :param trace_memory: Measure the peak memory with `tracemalloc` instead of the peak
+            RSS. More precise but slows down parsing considerably.
+        """
+        self.hooks = list(hooks)
+        self.trace_memory = trace_memory
+        # Phase name -> accumulated seconds. Phases are named hierarchically with dots,
+        # e.g. 'lark.transform.group' is part of 'lark.transform'.
+        self.phases: Dict[str, float] = dict()
+        # Groups, attributes, tables, defines, tokens (fast engine).
+        self.counts: Dict[str, int] = dict()
+        # Query name -> [number of calls, accumulated seconds].
+        self.queries: Dict[str, list] = dict()
+        # Number of input characters processed by the parsers.
+        self.characters = 0
+        # Largest increase of memory during a measured section, in bytes. Stays 0 where the
+        # peak RSS is not available and `trace_memory` is off.
+        self.peak_memory = 0
+        self._memory_depth = 0
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Time a phase. Nested and repeated phases accumulate.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+        for hook in self.hooks:
+            hook('phase', name, seconds)
+
+    def count(self, name: str, n: int = 1):
+        self.counts[name] = self.counts.get(name, 0) + n
+        for hook in self.hooks:
+            hook('count', name, n)
+
+    def add_query(self, name: str, seconds: float):
+        q = self.queries.get(name)
+        if q is None:
+            q = self.queries[name] = [0, 0.0]
+        q[0] += 1
+        q[1] += seconds
+        for hook in self.hooks:
+            hook('query', name, seconds)
+
+    @contextmanager
+    def memory(self):
+        """
+        Measure the peak memory increase of a section. Nested sections are part of the
+        outermost one.
+        """
+        if self._memory_depth > 0:
+            self._memory_depth += 1
+            try:
+                yield
+            finally:
+                self._memory_depth -= 1
+            return
+        self._memory_depth = 1
+        try:
+            with self._measure_memory():
+                yield
+        finally:
+            self._memory_depth = 0
+
+    @contextmanager
+    def _measure_memory(self):
+        if self.trace_memory:
+            started = not tracemalloc.is_tracing()
+            if started:
+                tracemalloc.start()
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            try:
+                yield
+            finally:
+                _, peak = tracemalloc.get_traced_memory()
+                if started:
+                    tracemalloc.stop()
+                self.peak_memory = max(self.peak_memory, peak - before)
+        else:
+            before = _peak_rss()
+            try:
+                yield
+            finally:
+                after = _peak_rss()
+                if before is not None and after is not None:
+                    self.peak_memory = max(self.peak_memory, after - before)
+
+    def count_tree(self, library):
+        """
+        Count the groups, attributes, tables and defines of a parsed library.
+        """
+        from .arrays import TABLE_ATTRIBUTES
+        with self.phase('count'):
+            groups = attributes = tables = defines = 0
+            stack = [library]
+            while stack:
+                g = stack.pop()
+                groups += 1
+                for name, values in g.attributes.items():
+                    attributes += len(values)
+                    if name in TABLE_ATTRIBUTES:
+                        tables += len(values)
+                defines += len(g._defines or ())
+                stack.extend(g._groups or ())
+        self.count('groups', groups)
+        self.count('attributes', attributes)
+        self.count('tables', tables)
+        self.count('defines', defines)
+
+    def as_dict(self) -> Dict:
+        return {
+            'phases': dict(self.phases),
+            'counts': dict(self.counts),
+            'queries': {k: {'calls': v[0], 'seconds': v[1]} for k, v in self.queries.items()},
+            'characters': self.characters,
+            'peak_memory': self.peak_memory,
+        }
+
+    def __str__(self):
+        lines = ["characters: {}".format(self.characters),
+                 "peak memory: {:.1f} MB".format(self.peak_memory / 1e6)]
+        for name, t in sorted(self.phases.items()):
+            lines.append("phase {:32} {:10.4f} s".format(name, t))
+        for name, n in sorted(self.counts.items()):
+            lines.append("count {:32} {:10d}".format(name, n))
+        for name, (n, t) in sorted(self.queries.items()):
+            lines.append("query {:32} {:10d} calls {:10.4f} s".format(name, n, t))
+        return "\n".join(lines)
+
+
+def phase(stats: Optional[LibertyStats], name: str):
+    """
+    Time a phase if `stats` is not `None`.
+    """
+    if stats is None:
+        return nullcontext()
+    return stats.phase(name)
+
+
+def current_stats() -> Optional[LibertyStats]:
+    """
+    Get the stats object of the innermost active `collect_stats` block of this thread.
+    """
+    return getattr(_local, 'stats', None)
+
+
+@contextmanager
+def collect_stats(stats: Optional[LibertyStats] = None, **kwargs):
+    """
+    Collect statistics of all parsing and queries within the block.
+    :param stats: Stats object to fill. A new one is created with `kwargs` if `None`.
+    :return: The stats object.
+    """
+    if stats is None:
+        stats = LibertyStats(**kwargs)
+    previous = current_stats()
+    _local.stats = stats
+    try:
+        yield stats
+    finally:
+        _local.stats = previous
+
+
+def instrumented_query(f):
+    """
+    Decorator timing a query function while a `collect_stats` block is active.
+    """
+    name = f.__name__
+
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        stats = getattr(_local, 'stats', None)
+        if stats is None:
+            return f(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return f(*args, **kwargs)
+        finally:
+            stats.add_query(name, time.perf_counter() - start)
+
+    return wrapper
+
+
+def test_collect_stats():
+    import os.path
+    from .parser import load_liberty
+    from .types import select_cell
+    lib_file = os.path.join(os.path.dirname(__file__), '../test_data/gscl45nm.lib')
+    events = []
+    with collect_stats(hooks=[lambda *e: events.append(e)]) as stats:
+        fast = load_liberty(lib_file, engine='fast')
+        lark = load_liberty(lib_file, engine='lark')
+        assert select_cell(fast, 'XOR2X1') is not None
+    assert current_stats() is None
+    assert str(fast) == str(lark)
+    for name in ['read', 'fast.lex', 'fast.parse', 'lark.parse', 'lark.transform.group']:
+        assert stats.phases[name] > 0
+    # Both libraries are counted.
+    assert stats.counts['groups'] % 2 == 0 and stats.counts['tables'] > 0
+    assert stats.counts['tokens'] > stats.counts['groups']
+    assert stats.queries['select_cell'][0] == 1
+    assert ('query', 'select_cell') in {e[:2] for e in events}
+    # The test library is ASCII, one character per byte.
+    assert stats.as_dict()['characters'] == 2 * os.path.getsize(lib_file)
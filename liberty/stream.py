@@ -0,0 +1,175 @@
+##
+## Copyright (c) 2019 Thomas Kramer.
+##
+## This file is part of liberty-parser
+## (see https://codeberg.org/tok/liberty-parser).
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Streaming access to liberty files.
+
+The file is read incrementally and reported as a sequence of events, similar to a SAX
+parser. Only the parts of the library which are actually needed are turned into `Group`
+objects.
+"""
+from typing import Any, Iterable, Iterator, List, Tuple
+from .compression import detect_compression, open_text, read_chunks_background
+from .fast_parser import parse_events, read_chunks, START_GROUP, END_GROUP, ATTRIBUTE, DEFINE
+from .types import Group
+
+Event = Tuple[str, Any, Any]
+
+
+def iter_liberty_events(filename: str, chunk_size: int = 1 << 20) -> Iterator[Event]:
+    """
+    Read a liberty file incrementally and generate parser events.
+    Compressed files are decompressed on the fly, see `liberty.compression`.
+    See `liberty.fast_parser.parse_events` for the format of the events.
+    :param filename: liberty file name string.
+    :param chunk_size: Number of characters read at once.
+    :return: Iterator over events.
+    """
+    compressed = detect_compression(filename) is not None
+    with open_text(filename) as f:
+        if compressed:
+            # Decompress on a background thread while parsing.
+            yield from parse_events(read_chunks_background(f, chunk_size))
+        else:
+            yield from parse_events(read_chunks(f, chunk_size))
+
+
+class GroupBuilder:
+    """
+    Assemble `Group` objects from parser events.
+    """
+
+    def __init__(self):
+        # Stack of partially built groups: [name, args, attributes, groups, defines].
+        self._stack: List[list] = []
+
+    def depth(self) -> int:
+        """
+        Number of currently open groups.
+        """
+        return len(self._stack)
+
+    def start_group(self, group_name: str, args: List):
+        self._stack.append([group_name, args, dict(), [], []])
+
+    def attribute(self, name: str, value):
+        attrs = self._stack[-1][2]
+        values = attrs.get(name)
+        if values is None:
+            attrs[name] = [value]
+        else:
+            values.append(value)
+
+    def define(self, define):
+        self._stack[-1][4].append(define)
+
+    def end_group(self) -> Group:
+        """
+        Close the innermost open group.
+        :return: The finished group. It is also attached to its parent group, if any.
+        """
+        group = Group(*self._stack.pop())
+        if self._stack:
+            self._stack[-1][3].append(group)
+        return group
+
+    def feed(self, event: Event):
+        """
+        Process a single event.
+        :return: The finished group on `END_GROUP` events, otherwise `None`.
+        """
+        kind, name, value = event
+        if kind == ATTRIBUTE:
+            self.attribute(name, value)
+        elif kind == START_GROUP:
+            self.start_group(name, value)
+        elif kind == END_GROUP:
+            return self.end_group()
+        elif kind == DEFINE:
+            self.define(value)
+        return None
+
+
+def build_group(events: Iterable[Event]) -> Group:
+    """
+    Build the `Group` tree from a complete sequence of events.
+    """
+    builder = GroupBuilder()
+    group = None
+    for event in events:
+        group = builder.feed(event) or group
+    return group
+
+
+def iter_cells(filename: str, chunk_size: int = 1 << 20) -> Iterator[Group]:
+    """
+    Read a liberty file incrementally and generate the `cell` groups of the library one
+    by one. Groups outside of cells are not built, hence memory usage is bounded by the
+    size of the largest cell.
+    :param filename: liberty file name string.
+    :param chunk_size: Number of characters read at once.
+    :return: Iterator over cell groups.
+    """
+    depth = 0
+    builder = None
+    for event in iter_liberty_events(filename, chunk_size):
+        kind = event[0]
+        if kind == START_GROUP:
+            depth += 1
+            if depth == 2 and event[1] == 'cell':
+                builder = GroupBuilder()
+        elif kind == END_GROUP:
+            depth -= 1
+            if builder is not None:
+                group = builder.end_group()
+                if depth == 1:
+                    builder = None
+                    yield group
+                continue
+        if builder is not None:
+            builder.feed(event)
+
+
+def test_parse_events():
+    data = r"""
+library(test) {
+  time_unit: 1ns;
+  cell(a) { area: 1.5; pin(x) { direction: input; } }
+  define(myNewAttr, validinthisgroup, float);
+}
+"""
+    events = list(parse_events(data))
+    assert [e[0] for e in events] == [START_GROUP, ATTRIBUTE, START_GROUP, ATTRIBUTE, START_GROUP,
+                                      ATTRIBUTE, END_GROUP, END_GROUP, DEFINE, END_GROUP]
+    assert events[2] == (START_GROUP, 'cell', ['a'])
+    assert events[3] == (ATTRIBUTE, 'area', 1.5)
+
+
+def test_iter_cells():
+    import os.path
+    from .fast_parser import parse_liberty_fast
+    lib_file = os.path.join(os.path.dirname(__file__), '../test_data/gscl45nm.lib')
+    library = parse_liberty_fast(open(lib_file).read())
+
+    assert str(build_group(iter_liberty_events(lib_file, chunk_size=1000))) == str(library)
+
+    cells = list(iter_cells(lib_file, chunk_size=1000))
+    expected = library.get_groups('cell')
+    assert len(cells) == len(expected)
+    assert [str(c) for c in cells] == [str(c) for c in expected]
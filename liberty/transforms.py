@@ -0,0 +1,627 @@
+##
+## Copyright (c) 2019 Thomas Kramer.
+##
+## This file is part of liberty-parser
+## (see https://codeberg.org/tok/liberty-parser).
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Bulk transforms of numeric tables, e.g. derating delays or converting units.
+
+All matching tables of a library are gathered into one concatenated float64 buffer
+(`TableBatch`). Operations are applied to the whole buffer with NumPy and the results
+are scattered back into the groups. Text tables are parsed and formatted once per batch,
+array tables (see `Group.convert_tables`) keep their data type. A table shared between
+groups (see `liberty.interning`) is transformed once and stays shared.
+
+Example::
+
+    derate_tables(library, 1.05)  # All delay, transition and constraint tables.
+    transform_tables(library, lambda x: np.clip(x, 0, None), query='cell[*]/**/cell_rise')
+    convert_units(library, time_unit='1ps', capacitive_load_unit='1ff')
+"""
+import re
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from .arrays import strings_to_table
+from .types import Group, EscapedString, WithUnit, _key, _text
+from .query import compile_query
+
+# Tables holding times: delays, transitions and timing constraints.
+DELAY_TABLES = ('cell_rise', 'cell_fall', 'rise_transition', 'fall_transition',
+                'rise_constraint', 'fall_constraint', 'retaining_rise', 'retaining_fall')
+
+# Tables of `internal_power` groups. Their unit is `capacitive_load_unit` * `voltage_unit`^2.
+POWER_TABLES = ('rise_power', 'fall_power', 'power')
+
+# CCS receiver capacitance tables, in `capacitive_load_unit`.
+RECEIVER_CAPACITANCE_TABLES = ('receiver_capacitance1_rise', 'receiver_capacitance1_fall',
+                               'receiver_capacitance2_rise', 'receiver_capacitance2_fall')
+
+# Template variables by physical quantity.
+TIME_VARIABLES = frozenset(['input_net_transition', 'constrained_pin_transition',
+                            'related_pin_transition', 'input_transition_time', 'time'])
+CAPACITANCE_VARIABLES = frozenset(['total_output_net_capacitance',
+                                   'related_out_total_output_net_capacitance',
+                                   'equal_or_opposite_output_net_capacitance'])
+
+# Simple and complex attributes by physical quantity.
+TIME_ATTRIBUTES = frozenset(['max_transition', 'min_transition', 'default_max_transition',
+                             'min_pulse_width_high', 'min_pulse_width_low', 'min_period'])
+CAPACITANCE_ATTRIBUTES = frozenset(['capacitance', 'rise_capacitance', 'fall_capacitance',
+                                    'max_capacitance', 'min_capacitance',
+                                    'rise_capacitance_range', 'fall_capacitance_range',
+                                    'default_max_capacitance', 'default_input_pin_cap',
+                                    'default_output_pin_cap', 'default_inout_pin_cap'])
+
+# Units in seconds and farads.
+TIME_UNITS = {'s': 1.0, 'ms': 1e-3, 'us': 1e-6, 'ns': 1e-9, 'ps': 1e-12, 'fs': 1e-15}
+CAPACITANCE_UNITS = {'f': 1.0, 'mf': 1e-3, 'uf': 1e-6, 'nf': 1e-9, 'pf': 1e-12, 'ff': 1e-15}
+
+_unit_regex = re.compile(r'\s*([+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)\s*([A-Za-z]+)\s*$')
+
+# Location of a table: group, attribute name and index of the occurrence.
+_Location = Tuple[Group, str, int]
+
+
+def _text_rows(value) -> Optional[List[str]]:
+    """
+    Get the rows of a text table, `None` if `value` is not a text table.
+    """
+    if type(value) is not list or not value:
+        return None
+    rows = [row.value for row in value if type(row) is EscapedString]
+    if len(rows) != len(value) or not all(type(row) is str for row in rows):
+        return None
+    return rows
+
+
+class TableBatch:
+    """
+    Numeric tables gathered into one buffer.
+
+    `data` holds the elements of all tables in row-major order, table `i` occupies
+    `data[offsets[i]:offsets[i + 1]]` and has the shape `shapes[i]`. Modify `data` (in
+    place or with `apply`) and write the tables back with `scatter`.
+    """
+
+    def __init__(self, locations: List[List[_Location]], originals: List, data: np.ndarray,
+                 offsets: np.ndarray, shapes: List[Tuple[int, ...]]):
+        # Locations of each table. More than one if the table object is shared.
+        self._locations = locations
+        # Table values as found in the groups.
+        self._originals = originals
+        self.data = data
+        self.offsets = offsets
+        self.shapes = shapes
+
+    def __len__(self) -> int:
+        return len(self.shapes)
+
+    def __repr__(self):
+        return 'TableBatch({} tables, {} values)'.format(len(self), len(self.data))
+
+    @property
+    def table_ids(self) -> np.ndarray:
+        """
+        Index of the table of each element of `data`, e.g. for per-table factors:
+        `batch.data *= factors[batch.table_ids]`.
+        """
+        return np.repeat(np.arange(len(self)), np.diff(self.offsets))
+
+    @property
+    def groups(self) -> List[Group]:
+        """
+        First group holding each table.
+        """
+        return [locations[0][0] for locations in self._locations]
+
+    def table(self, i: int) -> np.ndarray:
+        """
+        View of table `i` in `data`.
+        """
+        return self.data[self.offsets[i]:self.offsets[i + 1]].reshape(self.shapes[i])
+
+    def apply(self, func: Callable[[np.ndarray], np.ndarray]) -> 'TableBatch':
+        """
+        Replace `data` by `func(data)`. `func` must return an array of the same size.
+        :return: `self`
+        """
+        data = np.asarray(func(self.data), dtype=np.float64)
+        if data.shape != self.data.shape:
+            raise ValueError("Transform changed the number of values from {} to {}."
+                             .format(self.data.shape, data.shape))
+        self.data = data
+        return self
+
+    def scatter(self):
+        """
+        Store the tables into their groups.
+        Array tables keep their floating point type (integer tables become float64) and are
+        replaced by new arrays, read-only if the original was read-only. Text tables are formatted anew.
+        """
+        data = self.data
+        offsets = self.offsets.tolist()
+        originals = self._originals
+        text_tables = [i for i, original in enumerate(originals)
+                       if not isinstance(original, np.ndarray)]
+        rows = _format_rows(data, offsets, [self.shapes[i] for i in text_tables], text_tables)
+        row = 0
+        for i, original in enumerate(originals):
+            if isinstance(original, np.ndarray):
+                # Integer tables are promoted, the results are in general not integral.
+                dtype = original.dtype if original.dtype.kind == 'f' else np.float64
+                value = data[offsets[i]:offsets[i + 1]].reshape(self.shapes[i]).astype(dtype)
+                value.flags.writeable = original.flags.writeable
+            else:
+                num_rows = self.shapes[i][0]
+                value = list(map(EscapedString, rows[row:row + num_rows]))
+                row += num_rows
+            for group, name, k in self._locations[i]:
+                # Assigning a new list marks the group as modified (see `liberty.source`).
+                occurrences = list(group.attributes[name])
+                occurrences[k] = value
+                group.attributes[name] = occurrences
+
+
+def _format_rows(data: np.ndarray, offsets: List[int], shapes: List[Tuple[int, ...]],
+                 tables: List[int]) -> List[str]:
+    """
+    Format the rows of the given tables like `table_to_strings`, all at once.
+    :return: Rows of all tables in order.
+    """
+    if not tables:
+        return []
+    values = np.concatenate([data[offsets[i]:offsets[i + 1]] for i in tables])
+    num_cols = np.repeat([shape[1] for shape in shapes], [shape[0] for shape in shapes])
+    separators = np.full(len(values), ', ', dtype=object)
+    separators[np.cumsum(num_cols) - 1] = '\n'
+    text = "".join(map(str.__add__, map(repr, values.tolist()), separators.tolist()))
+    # Integral numbers without decimal point.
+    text = text.replace('.0, ', ', ').replace('.0\n', '\n')
+    return text.split('\n')[:-1]
+
+
+def _sub_groups(group: Group) -> List[Group]:
+    """
+    Sub-groups without creating empty lists. Uses `groups` such that the cells of a
+    `LazyLibrary` are loaded.
+    """
+    return group.groups if group._groups else []
+
+
+def _select_groups(root: Group, query: Optional[str], group_names: Optional[Iterable[str]]) \
+        -> List[Group]:
+    if query is not None:
+        if group_names is not None:
+            raise ValueError("Either 'query' or 'group_names' can be given, not both.")
+        return compile_query(query).groups(root)
+    names = frozenset(group_names) if group_names is not None else None
+    result = []
+    stack = [root]
+    while stack:
+        group = stack.pop()
+        if names is None or group.group_name in names:
+            result.append(group)
+        stack.extend(reversed(_sub_groups(group)))
+    return result
+
+
+def _gather(locations: Iterable[_Location]) -> TableBatch:
+    """
+    Gather the numeric tables at the given locations. Other values are skipped.
+    """
+    table_locations = []
+    originals = []
+    sizes = []
+    shapes = []
+    # Array tables and text tables with the index of the table.
+    arrays = []
+    texts = []
+    # Tables by object id, shared tables are gathered once.
+    seen: Dict[int, int] = dict()
+    for group, name, k in locations:
+        value = group.attributes[name][k]
+        i = seen.get(id(value))
+        if i is not None:
+            table_locations[i].append((group, name, k))
+            continue
+        if isinstance(value, np.ndarray):
+            if value.ndim > 2 or value.dtype.kind not in 'iuf':
+                continue
+            arrays.append((len(originals), value))
+            shape = value.shape
+            size = value.size
+        else:
+            rows = _text_rows(value)
+            if rows is None:
+                continue
+            num_cols = rows[0].count(',') + 1
+            if any(r.count(',') + 1 != num_cols for r in rows):
+                continue
+            texts.append((len(originals), rows))
+            shape = (len(rows), num_cols)
+            size = len(rows) * num_cols
+        seen[id(value)] = len(originals)
+        table_locations.append([(group, name, k)])
+        originals.append(value)
+        shapes.append(shape)
+        sizes.append(size)
+
+    # Flat values of each table.
+    parts: List[Optional[np.ndarray]] = [None] * len(originals)
+    for i, a in arrays:
+        parts[i] = a.reshape(-1)
+    for i, v in _parse_texts(texts).items():
+        parts[i] = v
+    if any(p is None for p in parts):
+        # Drop the tables which are not numeric.
+        keep = [i for i, p in enumerate(parts) if p is not None]
+        table_locations = [table_locations[i] for i in keep]
+        originals = [originals[i] for i in keep]
+        shapes = [shapes[i] for i in keep]
+        sizes = [sizes[i] for i in keep]
+        parts = [parts[i] for i in keep]
+
+    offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+    data = np.concatenate(parts).astype(np.float64, copy=False) if parts \
+        else np.zeros(0, dtype=np.float64)
+    return TableBatch(table_locations, originals, data, offsets, shapes)
+
+
+def _parse_texts(texts: List[Tuple[int, List[str]]]) -> Dict[int, np.ndarray]:
+    """
+    Parse text tables with a single conversion.
+    :return: Flat values by table index, without the tables which are not numeric.
+    """
+    if not texts:
+        return dict()
+    text = ",".join(",".join(rows) for _, rows in texts)
+    if '\\' in text:
+        text = text.replace("\\\r\n", "").replace("\\\n", "")
+    try:
+        values = np.array(text.split(','), dtype=np.float64)
+    except ValueError:
+        # Some tables are not numeric. Convert them one by one.
+        result = dict()
+        for i, rows in texts:
+            table = strings_to_table(rows)
+            if table is not None:
+                result[i] = table.ravel()
+        return result
+    result = dict()
+    start = 0
+    for i, rows in texts:
+        end = start + len(rows) * (rows[0].count(',') + 1)
+        result[i] = values[start:end]
+        start = end
+    return result
+
+
+def gather_tables(root: Group, query: Optional[str] = None,
+                  group_names: Optional[Iterable[str]] = None,
+                  attributes: Iterable[str] = ('values',)) -> TableBatch:
+    """
+    Gather numeric tables of a group and its sub-groups into one buffer.
+    :param root: Usually the library.
+    :param query: Path query selecting the groups holding the tables, see `liberty.query`.
+    :param group_names: Select all groups with these names at any depth instead, e.g.
+        `DELAY_TABLES`. If neither is given, the tables of all groups are gathered.
+    :param attributes: Table attributes to gather, e.g. `('values', 'index_1')`.
+    :return: `TableBatch`
+    """
+    attributes = tuple(attributes)
+    locations = []
+    for group in _select_groups(root, query, group_names):
+        for name in attributes:
+            values = group.attributes.get(name)
+            if values:
+                locations.extend((group, name, k) for k in range(len(values)))
+    return _gather(locations)
+
+
+def transform_tables(root: Group, func: Callable[[np.ndarray], np.ndarray],
+                     query: Optional[str] = None, group_names: Optional[Iterable[str]] = None,
+                     attributes: Iterable[str] = ('values',)) -> TableBatch:
+    """
+    Apply a vectorized function to the values of many tables at once, e.g.
+    `transform_tables(library, lambda x: np.clip(x, 0, None), group_names=DELAY_TABLES)`.
+    See `gather_tables` for the selection of the tables.
+    :param func: Function of the concatenated table values, returning an array of the same size.
+    :return: The transformed `TableBatch`.
+    """
+    batch = gather_tables(root, query, group_names, attributes)
+    batch.apply(func)
+    batch.scatter()
+    return batch
+
+
+def derate_tables(root: Group, factor: float, query: Optional[str] = None,
+                  group_names: Optional[Iterable[str]] = DELAY_TABLES) -> TableBatch:
+    """
+    Multiply the values of tables by a derate factor. By default all delay, transition and
+    constraint tables. The indices are not changed.
+    """
+    if query is not None:
+        group_names = None
+    return transform_tables(root, lambda x: x * factor, query, group_names)
+
+
+def parse_unit(value, units: Dict[str, float]) -> float:
+    """
+    Get the size of a unit such as `time_unit : "1ns"` or `capacitive_load_unit (1, pf)`.
+    :param value: Attribute value: text like '1ns', `WithUnit` or a `[number, unit]` list.
+    :param units: Size of the unit names, `TIME_UNITS` or `CAPACITANCE_UNITS`.
+    :return: The size in seconds or farads.
+    """
+    if isinstance(value, WithUnit):
+        number, unit = value.value, value.unit
+    elif isinstance(value, list) and len(value) == 2:
+        number, unit = value
+    else:
+        if isinstance(value, EscapedString):
+            value = value.value
+        m = _unit_regex.match(str(value))
+        if m is None:
+            raise ValueError("Invalid unit: {}".format(value))
+        number, unit = m.groups()
+    unit = str(unit)
+    if unit.lower() not in units:
+        raise ValueError("Unknown unit '{}', expected one of {}.".format(unit, sorted(units)))
+    return float(number) * units[unit.lower()]
+
+
+def round_significant(x, digits: int = 15) -> np.ndarray:
+    """
+    Round to a number of significant decimal digits, e.g. to remove the rounding noise of
+    a unit conversion (`0.0618 * 1000 = 61.800000000000004`) before formatting.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        exponent = np.floor(np.log10(np.abs(x)))
+    exponent = np.where(np.isfinite(exponent), exponent, 0)
+    scale = 10.0 ** np.minimum(digits - 1 - exponent, 308)
+    with np.errstate(invalid='ignore'):
+        return np.where(np.isfinite(x), np.round(x * scale) / scale, x)
+
+
+def _round_scalar(x: float, digits: int = 15) -> float:
+    return float('{:.{}g}'.format(x, digits))
+
+
+def _scale_value(value, factor: float, units: Dict[str, float], unit: Tuple[float, str]):
+    """
+    Scale a simple or complex attribute value. Values with a unit of their own are
+    converted into the new unit.
+    """
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return _round_scalar(value * factor)
+    if isinstance(value, WithUnit) and value.unit.lower() in units:
+        number, name = unit
+        size = units[value.unit.lower()] / (number * units[name.lower()])
+        return WithUnit(_round_scalar(value.value * size), name)
+    if isinstance(value, list):
+        return [_scale_value(v, factor, units, unit) for v in value]
+    return value
+
+
+def _unit_value(old, number: float, unit: str):
+    """
+    New value of a unit attribute in the form of the old one.
+    """
+    number = int(number) if number == int(number) else number
+    if isinstance(old, WithUnit):
+        return WithUnit(number, unit)
+    if isinstance(old, list):
+        return [number, unit]
+    return EscapedString('{}{}'.format(number, unit))
+
+
+def convert_units(library: Group, time_unit: Optional[str] = None,
+                  capacitive_load_unit: Optional[str] = None):
+    """
+    Convert the time and capacitance values of a library into new units, e.g.
+    `convert_units(library, time_unit='1ps', capacitive_load_unit='1ff')`.
+
+    Converted are the delay, transition and constraint tables (`DELAY_TABLES`), the
+    internal power tables (`POWER_TABLES`, their unit scales with the capacitance unit),
+    the CCS receiver capacitances (`RECEIVER_CAPACITANCE_TABLES`), table indices by the
+    variables of their templates and the attributes in
+    `TIME_ATTRIBUTES` and `CAPACITANCE_ATTRIBUTES`. Values with a unit of their own
+    (`0.5pf`) are written in the new unit. The unit attributes of the library are updated.
+    Converted values are rounded to 15 significant digits.
+    :param time_unit: New `time_unit`, e.g. '1ps'.
+    :param capacitive_load_unit: New `capacitive_load_unit`, e.g. '1ff'.
+    """
+    # (factor, units, new unit as (number, name)) by quantity.
+    quantities = dict()
+    for quantity, new, attribute, units in [('time', time_unit, 'time_unit', TIME_UNITS),
+                                            ('capacitance', capacitive_load_unit,
+                                             'capacitive_load_unit', CAPACITANCE_UNITS)]:
+        if new is None:
+            continue
+        if attribute not in library:
+            raise ValueError("The library has no '{}'.".format(attribute))
+        old = library[attribute]
+        m = _unit_regex.match(new)
+        if m is None:
+            raise ValueError("Invalid unit: {}".format(new))
+        number, name = float(m.group(1)), m.group(2)
+        factor = _round_scalar(parse_unit(old, units) / parse_unit(new, units))
+        quantities[quantity] = (factor, units, (number, name))
+        library[attribute] = _unit_value(old, number, name)
+    if not quantities:
+        return
+
+    variables = {'time': TIME_VARIABLES, 'capacitance': CAPACITANCE_VARIABLES}
+    attributes = {'time': TIME_ATTRIBUTES, 'capacitance': CAPACITANCE_ATTRIBUTES}
+    value_quantities = dict.fromkeys(DELAY_TABLES, 'time')
+    value_quantities.update(dict.fromkeys(POWER_TABLES, 'capacitance'))
+    value_quantities.update(dict.fromkeys(RECEIVER_CAPACITANCE_TABLES, 'capacitance'))
+
+    def quantity_of(variable) -> Optional[str]:
+        variable = _text(variable)
+        for q, names in variables.items():
+            if variable in names and q in quantities:
+                return q
+        return None
+
+    # Converted axes `(index name, quantity)` by template name. Used for the templates and
+    # for the tables referring to them.
+    axes = dict()
+    for template in library.groups:
+        if template.args and 'variable_1' in template.attributes:
+            axes[_key(template.args[0])] = [
+                ('index_{}'.format(i), quantity_of(template['variable_{}'.format(i)]))
+                for i in range(1, 5) if 'variable_{}'.format(i) in template.attributes
+            ]
+
+    # Table locations by quantity.
+    locations = {q: [] for q in quantities}
+    stack = [library]
+    while stack:
+        group = stack.pop()
+        group_attributes = group.attributes
+        q = value_quantities.get(group.group_name)
+        if q in quantities and 'values' in group_attributes:
+            locations[q].extend((group, 'values', k)
+                                for k in range(len(group_attributes['values'])))
+        args = group.args
+        template_axes = axes.get(_key(args[0])) if args else None
+        if template_axes is not None:
+            for index, q in template_axes:
+                if q is not None and index in group_attributes:
+                    locations[q].extend((group, index, k)
+                                        for k in range(len(group_attributes[index])))
+        for q, (factor, units, unit) in quantities.items():
+            for name in attributes[q].intersection(group_attributes):
+                group_attributes[name] = [_scale_value(v, factor, units, unit)
+                                          for v in group_attributes[name]]
+        stack.extend(_sub_groups(group))
+
+    # Gather all batches before scattering, such that tables shared between quantities
+    # are read unchanged.
+    batches = [(_gather(locations[q]), quantities[q][0]) for q in quantities]
+    for batch, factor in batches:
+        batch.apply(lambda x: round_significant(x * factor))
+        batch.scatter()
+
+
+def test_transforms():
+    import os.path
+    from .parser import parse_liberty
+    from .interning import intern_tables
+    from .query import select
+    from .types import select_cell, select_pin, select_timing_table
+    lib_file = os.path.join(os.path.dirname(__file__), '../test_data/gscl45nm.lib')
+    data = open(lib_file).read()
+
+    for table_dtype in [None, np.float32]:
+        library = parse_liberty(data, engine='fast', table_dtype=table_dtype)
+        intern_tables(library)
+        pin = select_pin(select_cell(library, 'XOR2X1'), 'Y')
+        table = select_timing_table(pin, 'A', 'cell_rise')
+        values = table.get_array('values').astype(np.float64)
+        index_1 = table.get_array('index_1').astype(np.float64)
+        template = library.get_group('lu_table_template', table.args[0])
+        template_index = template.get_array('index_1').astype(np.float64)
+        capacitance = select_pin(select_cell(library, 'XOR2X1'), 'A')['capacitance']
+
+        batch = gather_tables(library, group_names=['cell_rise'])
+        assert len(batch) == len(select(library, 'cell/pin/timing/cell_rise'))
+        assert np.allclose(batch.table(batch.groups.index(table)), values)
+
+        derate_tables(library, 2.0, query='cell[XOR2X1]/pin/timing/cell_rise')
+        assert np.allclose(table.get_array('values'), 2 * values)
+        transform_tables(library, lambda x: np.clip(x, 0, None), group_names=['cell_rise'])
+        assert np.allclose(table.get_array('values'), np.clip(2 * values, 0, None))
+        expected_dtype = np.float64 if table_dtype is None else table_dtype
+        assert table.get_array('values').dtype == expected_dtype
+
+        convert_units(library, time_unit='1ps', capacitive_load_unit='1ff')
+        assert library['time_unit'].value == '1ps'
+        assert library['capacitive_load_unit'] == [1, 'ff']
+        # Template variable_1 of 'delay_template_4x5' is the load.
+        assert np.allclose(table.get_array('index_1'), 1000 * index_1, rtol=1e-6)
+        assert np.allclose(template.get_array('index_1'), 1000 * template_index, rtol=1e-6)
+        assert np.allclose(table.get_array('values'), 1000 * np.clip(2 * values, 0, None),
+                           rtol=1e-6)
+        assert np.isclose(select_pin(select_cell(library, 'XOR2X1'), 'A')['capacitance'],
+                          1000 * capacitance)
+        if table_dtype is not None:
+            # Shared tables stay shared and read-only.
+            assert not table.get_array('values').flags.writeable
+            rise = select_timing_table(pin, 'A', 'rise_transition')
+            assert rise.get_array('index_1') is table.get_array('index_1')
+
+        # Text tables are written back as text, without rounding noise.
+        reloaded = select(parse_liberty(str(library), engine='fast'),
+                          'cell[XOR2X1]/pin[Y]/timing[related_pin=A]/cell_rise')[0]
+        values = table.get_array('values')
+        assert np.array_equal(reloaded.get_array('values').astype(values.dtype), values)
+        if table_dtype is None:
+            numbers = ", ".join(row.value for row in table['values']).split(', ')
+            assert max(len(n) for n in numbers) <= 10
+
+    # Quoted template names and integer tables.
+    library = parse_liberty("""library(quoted) {
+  time_unit : "1ns";
+  lu_table_template("delay_2") { variable_1 : input_net_transition; index_1("1, 2"); }
+  cell("INV") {
+    pin("Y") {
+      timing() {
+        related_pin : "A";
+        cell_rise("delay_2") { index_1("1, 2"); values("1, 3"); }
+      }
+    }
+  }
+}""", engine='fast', table_dtype=np.int64)
+    convert_units(library, time_unit='1ps')
+    table = select(library, 'cell/pin/timing/cell_rise')[0]
+    assert np.array_equal(table.get_array('index_1'), [[1000, 2000]])
+    assert np.array_equal(library.get_group('lu_table_template').get_array('index_1'),
+                          [[1000, 2000]])
+    derate_tables(library, 1.5)
+    assert table.get_array('values').dtype == np.float64
+    assert np.array_equal(table.get_array('values'), [[1500, 4500]])
+
+    # Receiver capacitances are capacitances.
+    library = parse_liberty("""library(ccs) {
+  capacitive_load_unit(1, pf);
+  cell(INV) {
+    pin(A) {
+      receiver_capacitance() {
+        receiver_capacitance1_rise(scalar) { values("0.002"); }
+      }
+    }
+  }
+}""", engine='fast')
+    convert_units(library, capacitive_load_unit='1ff')
+    rise, = select(library, 'cell/pin/receiver_capacitance/receiver_capacitance1_rise')
+    assert np.array_equal(rise.get_array('values'), [[2]])
+
+    # The cells of lazy libraries are loaded.
+    from .lazy import load_liberty_lazy
+    lazy = load_liberty_lazy(lib_file)
+    eager = parse_liberty(data, engine='fast')
+    assert len(derate_tables(lazy, 2.0)) == len(derate_tables(eager, 2.0)) > 0
+    assert str(lazy) == str(eager)
+
+    assert np.isclose(parse_unit(WithUnit(1, 'ns'), TIME_UNITS), 1e-9)
+    assert np.isclose(parse_unit([1, 'pf'], CAPACITANCE_UNITS), 1e-12)
+    assert np.isclose(parse_unit(EscapedString('10ps'), TIME_UNITS), 1e-11)
@@ -19,22 +19,292 @@
 ##
 from typing import Any, List, Dict, Optional, Tuple
 from itertools import chain
-from .boolean_functions import parse_boolean_function
-from .arrays import strings_to_array, array_to_strings
+from .boolean_functions import parse_boolean_function, compile_boolean_function
+from .arrays import strings_to_array, array_to_strings, strings_to_table, table_to_strings, \
+    TABLE_ATTRIBUTES
 import numpy as np
+from .stats import instrumented_query
+
+
+class GroupList(list):
+    """
+    List of sub-groups which counts its modifications.
+    Used to detect when the child index of a `Group` must be rebuilt.
+    """
+    __slots__ = ('version',)
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.version = 0
+
+    def __reduce__(self):
+        return GroupList, (list(self),)
+
+
+class AttributeDict(dict):
+    """
+    Attribute dictionary which counts its modifications.
+    Used to detect modified groups when writing a library back to its source file,
+    see `liberty.source`.
+    """
+    __slots__ = ('version',)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version = 0
+
+    def __reduce__(self):
+        return AttributeDict, (dict(self),)
+
+
+def _counting(name: str, base: type = list):
+    method = getattr(base, name)
+
+    def f(self, *args, **kwargs):
+        self.version += 1
+        return method(self, *args, **kwargs)
+
+    f.__name__ = name
+    f.__doc__ = method.__doc__
+    return f
+
+
+for _name in ['append', 'extend', 'insert', 'pop', 'remove', 'clear', 'sort', 'reverse',
+              '__setitem__', '__delitem__', '__iadd__', '__imul__']:
+    setattr(GroupList, _name, _counting(_name))
+
+for _name in ['__setitem__', '__delitem__', 'pop', 'popitem', 'clear', 'update', 'setdefault',
+              '__ior__']:
+    setattr(AttributeDict, _name, _counting(_name, dict))
+
+
+def _key(value):
+    """
+    Convert an argument or attribute value into a dictionary key.
+    Escaped strings compare equal to plain strings, hence they are keyed by their value.
+    """
+    if isinstance(value, EscapedString):
+        return value.value
+    return value
+
+
+def _text(value) -> Optional[str]:
+    """
+    Text of an argument or attribute value, e.g. for comparing names. Escaped strings give
+    their value without quotes.
+    """
+    if value is None:
+        return None
+    if isinstance(value, EscapedString):
+        return value.value
+    return str(value)
+
+
+def _matches(g, type_name: str, argument) -> bool:
+    return g.group_name == type_name and (argument is None or
+                                          (len(g.args) > 0 and g.args[0] == argument))
+
+
+class _ChildIndex:
+    """
+    Lookup tables for the sub-groups of a group.
+    """
+
+    def __init__(self, groups: GroupList):
+        self.groups = groups
+        self.version = groups.version
+        self.by_name = dict()
+        self.by_name_arg = dict()
+        # (group name, attribute name) -> ({attribute value -> groups}, unkeyed groups)
+        self.by_attribute = dict()
+        # Some arguments can not be used as keys. Lookups by argument must scan then.
+        self.complete = True
+        for g in groups:
+            self.by_name.setdefault(g.group_name, []).append(g)
+            if len(g.args) > 0:
+                try:
+                    self.by_name_arg.setdefault((g.group_name, _key(g.args[0])), []).append(g)
+                except TypeError:
+                    self.complete = False
+
+    def is_valid(self, groups) -> bool:
+        return self.groups is groups and self.version == groups.version
+
+    def lookup(self, type_name: str, argument) -> Optional[List]:
+        """
+        :return: The indexed groups or `None` if the index can not answer the query.
+        """
+        if argument is None:
+            return self.by_name.get(type_name, [])
+        if not self.complete:
+            return None
+        try:
+            return self.by_name_arg.get((type_name, _key(argument)), [])
+        except TypeError:
+            return None
+
+    def lookup_attribute(self, type_name: str, attribute: str, value) -> Optional[List]:
+        key = (type_name, attribute)
+        entry = self.by_attribute.get(key)
+        if entry is None:
+            table = dict()
+            # Groups whose value can not be used as key: the attribute occurs multiple times
+            # or is a complex attribute. They are compared one by one.
+            unkeyed = []
+            for g in self.by_name.get(type_name, []):
+                v = g.get(attribute)
+                try:
+                    table.setdefault(_key(v), []).append(g)
+                except TypeError:
+                    unkeyed.append(g)
+            entry = self.by_attribute[key] = (table, unkeyed)
+        table, unkeyed = entry
+        try:
+            result = table.get(_key(value), [])
+        except TypeError:
+            return None
+        matches = [g for g in unkeyed if g.get(attribute) == value]
+        if matches:
+            # Same order as `by_name`.
+            members = set(map(id, result)) | set(map(id, matches))
+            result = [g for g in self.by_name[type_name] if id(g) in members]
+        return result
+
+
+class _LineWriter:
+    """
+    Join lines by newlines and write them to a file in large blocks.
+    """
+
+    def __init__(self, f, block_lines: int = 1 << 14):
+        self._f = f
+        self._lines = []
+        self._block_lines = block_lines
+        self._first = True
+
+    def emit(self, line: str):
+        lines = self._lines
+        lines.append(line)
+        if len(lines) >= self._block_lines:
+            self.flush()
+
+    def flush(self):
+        if self._lines:
+            if not self._first:
+                self._f.write('\n')
+            self._f.write('\n'.join(self._lines))
+            self._first = False
+            self._lines = []
 
 
 class Group:
+    # Empty `groups` and `defines` are stored as `None` and only created when accessed.
+    __slots__ = ('group_name', 'args', 'attributes', '_groups', '_defines', '_index', '_source',
+                 '__weakref__')
+
     def __init__(self, group_name: str,
                  args: List[str] = None,
                  attributes: Dict[str, Any] = None,
                  groups: List = None,
                  defines: List[Tuple[str, str, str]] = None):
+        """
+        :param group_name: Name of the group, e.g. 'cell'.
+        :param args: Arguments of the group.
+        :param attributes: Attribute name -> list of all occurrences of the attribute.
+        :param groups: Sub-groups. The list is copied into a `GroupList` (which tracks its
+            modifications for the child index), hence later changes of the passed list do
+            not affect the group. Modify `Group.groups` instead.
+        :param defines: `Define` statements.
+        """
         self.group_name = group_name
         self.args = args if args is not None else []
         self.attributes = attributes if attributes is not None else dict()
-        self.groups = groups if groups is not None else []
-        self.defines = defines if defines is not None else []
+        self._groups = None
+        if groups:
+            self.groups = groups
+        self._defines = defines if defines else None
+        # Index of the sub-groups. Built on first lookup.
+        self._index = None
+        # Location in the source file, see `liberty.source`.
+        self._source = None
+
+    @property
+    def groups(self) -> GroupList:
+        groups = self._groups
+        if groups is None:
+            groups = self._groups = GroupList()
+        return groups
+
+    @groups.setter
+    def groups(self, groups: List):
+        if type(groups) is not GroupList:
+            groups = GroupList(groups)
+        self._groups = groups
+
+    @property
+    def defines(self) -> List:
+        defines = self._defines
+        if defines is None:
+            defines = self._defines = []
+        return defines
+
+    @defines.setter
+    def defines(self, defines: List):
+        self._defines = defines
+
+    def __getstate__(self):
+        return (self.group_name, self.args, self.attributes, self._groups, self._defines,
+                getattr(self, '__dict__', None))
+
+    def __setstate__(self, state):
+        self.group_name, self.args, self.attributes, self._groups, self._defines, d = state
+        self._index = None
+        self._source = None
+        if d:
+            self.__dict__.update(d)
+
+    def _child_index(self, rebuild: bool = False) -> _ChildIndex:
+        groups = self.groups
+        index = self._index
+        if rebuild or index is None or not index.is_valid(groups):
+            index = _ChildIndex(groups)
+            self._index = index
+        return index
+
+    def _indexed(self, lookup, check) -> Optional[List]:
+        """
+        Query the child index.
+        Found groups are checked against the query because sub-groups might have been
+        modified in place. The index is rebuilt if any of them is outdated.
+        :param lookup: Function that queries the index.
+        :param check: Predicate that must hold for all found groups.
+        :return: Found groups or `None` if the index can not answer the query.
+        """
+        result = lookup(self._child_index())
+        if result is not None and not all(check(g) for g in result):
+            result = lookup(self._child_index(rebuild=True))
+        return list(result) if result is not None else None
+
+    def invalidate_index(self):
+        """
+        Drop the index of the sub-groups.
+        The index follows all modifications of `groups`. Only when a sub-group is changed in
+        place such that it matches a lookup which it did not match before (e.g. by changing
+        its name, first argument or the `related_pin` of a timing group), the index must be
+        invalidated explicitly.
+        """
+        self._index = None
+
+    def mark_modified(self):
+        """
+        Mark the group as modified such that it is formatted anew when the library is
+        written back to its source file (see `liberty.source`).
+        Needed only after modifying attribute values in place, e.g. appending to the list
+        of an attribute or changing a table array. Assigning attributes, `set_array` and
+        changes of `groups` are detected automatically.
+        """
+        if self._source is not None:
+            self._source.modified = True
 
     def get_groups(self, type_name: str, argument: Optional[str] = None) -> List:
         """ Get all groups of type `type_name`.
@@ -43,12 +313,32 @@ class Group:
         :param argument:
         :return: List[Group]
         """
-        return [g for g in self.groups
-                if g.group_name == type_name
-                and (argument is None or
-                     (len(g.args) > 0 and g.args[0] == argument)
-                     )
-                ]
+        if not self._groups:
+            return []
+        result = self._indexed(lambda index: index.lookup(type_name, argument),
+                               lambda g: _matches(g, type_name, argument))
+        if result is not None:
+            return result
+        return [g for g in self.groups if _matches(g, type_name, argument)]
+
+    def get_groups_by_attribute(self, type_name: str, attribute: str, value) -> List:
+        """ Get all groups of type `type_name` with an attribute of the given value.
+        Example: `pin.get_groups_by_attribute('timing', 'related_pin', 'A')`
+        :param type_name:
+        :param attribute: Name of a simple attribute.
+        :param value:
+        :return: List[Group]
+        """
+        def check(g):
+            return g.group_name == type_name and g.get(attribute) == value
+
+        if not self._groups:
+            return []
+        result = self._indexed(lambda index: index.lookup_attribute(type_name, attribute, value),
+                               check)
+        if result is not None:
+            return result
+        return [g for g in self.groups if check(g)]
 
     def get_group(self, type_name: str, argument: Optional[str] = None):
         """
@@ -69,12 +359,14 @@ class Group:
         :return: List[Group]
         """
         r = []
-        for i in range(len(self.groups)-1,-1,-1):
-            g = self.groups[i]
-            if g.group_name == type_name and (argument is None or
-                     (len(g.args) > 0 and g.args[0] == argument)):
-                self.groups.pop(i)
-                r.insert(0,g)
+        remaining = []
+        for g in self.groups:
+            if _matches(g, type_name, argument):
+                r.append(g)
+            else:
+                remaining.append(g)
+        if r:
+            self.groups[:] = remaining
         return r
 
     def __repr__(self) -> str:
@@ -91,21 +383,28 @@ class Group:
         def format_value(v) -> str:
             return str(v)
 
+        def format_rows(k, formatted):
+            attr_lines.append('{} ( \\'.format(k))
+            for i, l in enumerate(formatted):
+                if i < len(formatted) - 1:
+                    end = ', \\'
+                else:
+                    end = ' \\'
+                attr_lines.append(indent + l + end)
+            attr_lines.append(');')
+
         attr_lines = list()
         for k, v in sorted(attr.items()):
+            # Numeric table
+            if isinstance(v[0], np.ndarray):
+                for vv in v:
+                    format_rows(k, ['"{}"'.format(r) for r in table_to_strings(vv)])
             # Complex attribute
-            if isinstance(v[0],list):
+            elif isinstance(v[0],list):
                 for vv in v:
                     formatted = [format_value(x) for x in vv]
                     if any((isinstance(x, EscapedString) for x in vv)):
-                        attr_lines.append('{} ( \\'.format(k))
-                        for i, l in enumerate(formatted):
-                            if i < len(formatted) - 1:
-                                end = ', \\'
-                            else:
-                                end = ' \\'
-                            attr_lines.append(indent + l + end)
-                        attr_lines.append(');')
+                        format_rows(k, formatted)
                     else:
                         values = "({})".format(", ".join(formatted))
                         attr_lines.append("{} {};".format(k, values))
@@ -121,8 +420,26 @@ class Group:
         Create the liberty file format line by line.
         :return: A list of lines.
         """
+        lines = list()
+        self._emit(lines.append, indent, '')
+        return lines
+
+    def _emit(self, emit, indent: str, prefix: str):
+        """
+        Create the liberty file format line by line and pass each line to `emit`.
+        Lines are indented by `prefix`, which grows by `indent` per nesting level.
+        """
+        self._emit_head(emit, indent, prefix)
+        inner = prefix + indent
+        for g in self._groups or ():
+            g._emit(emit, indent, inner)
+
+        emit(prefix + "}")
 
-        sub_group_lines = [g._format(indent=indent) for g in self.groups]
+    def _emit_head(self, emit, indent: str, prefix: str):
+        """
+        Emit the header line, the attributes and the defines, but not the sub-groups.
+        """
         attr_before_define = {}
         attr_after_define = {}
         for k,v in self.attributes.items():
@@ -135,47 +452,101 @@ class Group:
         attr_after_define_lines = self.format_attr(attr_after_define,indent)
 
         define_lines = list()
-        for d in self.defines:
+        for d in self._defines or ():
             define_lines.append('define ({}, {}, {});'.format(d.attribute_name,d.group_name,d.attribute_type))
 
-        lines = list()
         # by wang 2019/09/18
         #lines.append('{} ({}) {{'.format(self.group_name, ", ".join(self.args)))
-        lines.append('{} ({}) {{'.format(self.group_name, ", ".join(list(map(lambda x:str(x),self.args)))))
-        for l in chain(attr_before_define_lines, define_lines, attr_after_define_lines, *sub_group_lines):
-            lines.append(indent + l)
-
-        lines.append("}")
+        emit(prefix + '{} ({}) {{'.format(self.group_name, ", ".join(list(map(lambda x:str(x),self.args)))))
+        inner = prefix + indent
+        for l in chain(attr_before_define_lines, define_lines, attr_after_define_lines):
+            emit(inner + l)
 
-        return lines
+    def write(self, f, indent: str = " " * 2):
+        """
+        Write the liberty file format into a text file object.
+        The output is the same as `str(self)` but it is written incrementally instead of
+        being built as one string.
+        :param f: File object opened for writing text.
+        :param indent: Indentation per nesting level.
+        """
+        writer = _LineWriter(f)
+        self._emit(writer.emit, indent, '')
+        writer.flush()
 
     def __getitem__(self, item):
-        return self.attributes[item]
+        """
+        Get the value of an attribute.
+        Attributes are stored as lists of all their occurrences. If the attribute
+        occurs exactly once its value is returned, otherwise the list of all values.
+        """
+        values = self.attributes[item]
+        if len(values) == 1:
+            return values[0]
+        return values
 
     def __setitem__(self, key, value):
-        self.attributes[key] = value
+        """
+        Set an attribute to a single value, replacing all its occurrences.
+        Assign a list to `attributes[key]` to store several occurrences.
+        """
+        self.attributes[key] = [value]
 
     def __contains__(self, item):
         return item in self.attributes
 
     def get(self, key, default=None):
-        return self.attributes.get(key, default)
+        """
+        Like `__getitem__`, but `default` if the attribute does not exist.
+        """
+        if key in self.attributes:
+            return self[key]
+        return default
 
     def get_array(self, key) -> np.ndarray:
         """
         Get a 1D or 2D array as a numpy.ndarray object.
+        Tables which are stored as arrays already (see `convert_tables`) are returned
+        without a copy. Interned arrays (see `liberty.interning`) are read-only.
         :param key: Name of the attribute.
         :return: ndarray
         """
         str_array = self[key]
+        if isinstance(str_array, np.ndarray):
+            return str_array
         str_array = [s.value for s in str_array]
         return strings_to_array(str_array)
 
     def set_array(self, key, value: np.ndarray):
+        """
+        Set a 1D or 2D array.
+        If the attribute holds an array already, the new value is stored as array as well.
+        Otherwise it is converted into strings.
+        """
+        old = self.attributes.get(key)
+        if old is not None and len(old) == 1 and isinstance(old[0], np.ndarray):
+            self[key] = np.atleast_2d(np.asarray(value, dtype=old[0].dtype))
+            return
         str_array = array_to_strings(value)
         str_array = [EscapedString(s) for s in str_array]
         self[key] = str_array
 
+    def convert_tables(self, dtype=np.float64):
+        """
+        Convert the numeric tables (`values`, `index_1`, ...) of this group and all its
+        sub-groups into 2D arrays. Tables which are not numeric are left unchanged.
+        The arrays are formatted as text again only when the library is written.
+        :param dtype: Data type of the arrays.
+        """
+        stack = [self]
+        while stack:
+            group = stack.pop()
+            attributes = group.attributes
+            for name in TABLE_ATTRIBUTES.intersection(attributes):
+                attributes[name] = [to_table(v, dtype) for v in attributes[name]]
+            if group._groups:
+                stack.extend(group._groups)
+
     def get_boolean_function(self, key):
         """
         Get parsed boolean expression.
@@ -184,9 +555,24 @@ class Group:
         :return:
         """
         f_str = self[key]
+        if isinstance(f_str, EscapedString):
+            f_str = f_str.value
         f = parse_boolean_function(f_str)
         return f
 
+    def get_compiled_function(self, key):
+        """
+        Get a boolean expression compiled into a truth table.
+        Faster than `get_boolean_function` for evaluation and equivalence checks.
+        See `liberty.boolean_functions.compile_boolean_function`.
+        :param key:
+        :return: `CompiledFunction`
+        """
+        f_str = self[key]
+        if isinstance(f_str, EscapedString):
+            f_str = f_str.value
+        return compile_boolean_function(f_str)
+
 
 class CellGroup(Group):
 
@@ -198,6 +584,8 @@ class CellGroup(Group):
 
 
 class Define:
+    __slots__ = ('attribute_name', 'group_name', 'attribute_type')
+
     def __init__(self, attribute_name, group_name, attribute_type):
         """
 
@@ -221,6 +609,7 @@ class WithUnit:
     """
     Store a value with a unit attached.
     """
+    __slots__ = ('value', 'unit')
 
     def __init__(self, value, unit: str):
         self.value = value
@@ -234,6 +623,7 @@ class WithUnit:
 
 
 class EscapedString:
+    __slots__ = ('value',)
 
     def __init__(self, value):
         self.value = value
@@ -251,6 +641,27 @@ class EscapedString:
             return self.value == other
 
 
+def to_table(value, dtype=np.float64):
+    """
+    Convert the value of a numeric table attribute into a 2D array.
+    :param value: List of `EscapedString` rows as created by the parser.
+    :param dtype: Data type of the array.
+    :return: The array or `value` itself if it is not a numeric table.
+    """
+    if type(value) is not list or not value:
+        if isinstance(value, np.ndarray) and value.dtype != dtype:
+            return value.astype(dtype)
+        return value
+    rows = []
+    for row in value:
+        if not isinstance(row, EscapedString):
+            return value
+        rows.append(row.value)
+    array = strings_to_table(rows, dtype)
+    return value if array is None else array
+
+
+@instrumented_query
 def select_cell(library: Group, cell_name: str) -> Optional[Group]:
     """
     Select a cell by name from a library group.
@@ -258,14 +669,18 @@ def select_cell(library: Group, cell_name: str) -> Optional[Group]:
     :param cell_name:
     :return:
     """
-    available_cell_names = {g.args[0] for g in library.get_groups('cell')}
+    cells = library.get_groups('cell', cell_name)
 
-    if cell_name in available_cell_names:
-        return library.get_group('cell', cell_name)
+    if cells:
+        assert len(cells) == 1, "There must be exactly one instance of cell '{}'. " \
+                                "Found {}.".format(cell_name, len(cells))
+        return cells[0]
     else:
+        available_cell_names = {g.args[0] for g in library.get_groups('cell')}
         raise Exception("Cell name must be one of: {}".format(list(sorted(available_cell_names))))
 
 
+@instrumented_query
 def select_pin(cell: Group, pin_name: str) -> Optional[Group]:
     """
     Select a pin by name from a cell group.
@@ -273,14 +688,18 @@ def select_pin(cell: Group, pin_name: str) -> Optional[Group]:
     :param pin_name:
     :return:
     """
-    available_pin_names = {g.args[0] for g in cell.get_groups('pin')}
+    pins = cell.get_groups('pin', pin_name)
 
-    if pin_name in available_pin_names:
-        return cell.get_group('pin', pin_name)
+    if pins:
+        assert len(pins) == 1, "There must be exactly one instance of pin '{}'. " \
+                               "Found {}.".format(pin_name, len(pins))
+        return pins[0]
     else:
+        available_pin_names = {g.args[0] for g in cell.get_groups('pin')}
         raise Exception("Pin name must be one of: {}".format(list(sorted(available_pin_names))))
 
 
+@instrumented_query
 def select_timing_table(pin: Group,
                         related_pin: str,
                         table_name: str,
@@ -293,17 +712,13 @@ def select_timing_table(pin: Group,
     :param timing_type: Select by 'timing_type' attribute.
     :return:
     """
-    timing_groups_by_related_pin = dict()
-    for g in pin.get_groups('timing'):
-        if 'related_pin' in g:
-            timing_groups_by_related_pin.setdefault(g['related_pin'].value, []).append(g)
-
     # Select by 'related_pin'
-    if related_pin not in timing_groups_by_related_pin:
+    timing_groups = pin.get_groups_by_attribute('timing', 'related_pin', related_pin)
+    if not timing_groups:
+        related_pins = {g['related_pin'].value for g in pin.get_groups('timing')
+                        if 'related_pin' in g}
         raise Exception(("Related pin name must be one of: {}".
-                         format(list(sorted(timing_groups_by_related_pin.keys())))))
-
-    timing_groups = timing_groups_by_related_pin[related_pin]
+                         format(list(sorted(related_pins)))))
 
     # Select by 'timing_type'
     if timing_type is None and len(timing_groups) == 1:
@@ -315,9 +730,100 @@ def select_timing_table(pin: Group,
                              format(list(sorted(timing_groups_by_timing_type.keys())))))
         timing_group = timing_groups_by_timing_type[timing_type]
 
-    available_table_names = {g.group_name for g in timing_group.groups}
+    tables = timing_group.get_groups(table_name)
 
-    if table_name in available_table_names:
-        return timing_group.get_group(table_name)
+    if tables:
+        assert len(tables) == 1, "There must be exactly one instance of group '{}'. " \
+                                 "Found {}.".format(table_name, len(tables))
+        return tables[0]
     else:
+        available_table_names = {g.group_name for g in timing_group.groups}
         raise Exception(("Table name must be one of: {}".format(list(sorted(available_table_names)))))
+
+
+def test_child_index():
+    pins = [Group('pin', [name]) for name in ['A', 'B', 'Y']]
+    timings = [Group('timing', [], {'related_pin': [EscapedString(p)]}) for p in ['A', 'B']]
+    cell = Group('cell', ['X'], groups=pins + timings)
+
+    assert cell.get_group('pin', 'B') is pins[1]
+    assert cell.get_groups('pin') == pins
+    assert cell.get_groups_by_attribute('timing', 'related_pin', 'B') == [timings[1]]
+    # Repeated and complex attributes are compared like in a linear scan.
+    loads = [Group('load', [], {'cap': [[1, 'pf']]}), Group('load', [], {'cap': [1, 2]}),
+             Group('load', [], {'cap': [1]})]
+    group = Group('x', [], groups=loads)
+    assert group.get_groups_by_attribute('load', 'cap', [1, 'pf']) == [loads[0]]
+    assert group.get_groups_by_attribute('load', 'cap', [1, 2]) == [loads[1]]
+    assert group.get_groups_by_attribute('load', 'cap', 1) == [loads[2]]
+
+    # The index follows modifications of the sub-groups.
+    assert cell.pop_groups('pin', 'A') == [pins[0]]
+    assert cell.get_groups('pin', 'A') == []
+    c = Group('pin', ['C'])
+    cell.groups.append(c)
+    assert cell.get_group('pin', 'C') is c
+    cell.groups[0] = Group('pin', ['D'])
+    assert cell.get_groups('pin', 'B') == []
+    cell.groups = [c]
+    assert cell.get_groups('pin') == [c]
+    assert cell.get_groups_by_attribute('timing', 'related_pin', 'B') == []
+
+    # Sub-groups changed in place.
+    c.args[0] = 'E'
+    assert cell.get_groups('pin', 'C') == []
+    cell.invalidate_index()
+    assert cell.get_group('pin', 'E') is c
+
+
+def test_attribute_access():
+    group = Group('pin', ['A'], {'direction': ['input'], 'cap_load': [[1, 'pf'], [2, 'pf']]})
+    # Single occurrences are unwrapped, repeated attributes give the list of occurrences.
+    assert group['direction'] == 'input'
+    assert group['cap_load'] == [[1, 'pf'], [2, 'pf']]
+    assert group.get('direction') == 'input' and group.get('missing', 0) == 0
+    assert 'cap_load' in group and 'missing' not in group
+
+    group['direction'] = 'output'
+    assert group.attributes['direction'] == ['output']
+    group['cap_load'] = [3, 'pf']
+    assert group.attributes['cap_load'] == [[3, 'pf']]
+    assert group['cap_load'] == [3, 'pf']
+    group.attributes['when'] = ['A', 'B']
+    assert group['when'] == ['A', 'B']
+
+    # Sub-groups are copied on construction.
+    pins = [Group('pin', ['A'])]
+    cell = Group('cell', ['X'], groups=pins)
+    pins.append(Group('pin', ['B']))
+    assert len(cell.groups) == 1
+
+
+def test_table_arrays():
+    import os.path
+    from .fast_parser import parse_liberty_fast
+    lib_file = os.path.join(os.path.dirname(__file__), '../test_data/gscl45nm.lib')
+    data = open(lib_file).read()
+    text_lib = parse_liberty_fast(data)
+    library = parse_liberty_fast(data, table_dtype=np.float64)
+
+    def table(lib):
+        pin = select_pin(select_cell(lib, 'INVX1'), 'Y')
+        return select_timing_table(pin, 'A', 'cell_rise')
+
+    array = table(library).get_array('values')
+    assert isinstance(array, np.ndarray)
+    assert array is table(library)['values']
+    assert (array == table(text_lib).get_array('values')).all()
+    assert table(library).get_array('index_1').shape == (1, 6)
+
+    # Same tables after writing and reading back.
+    reparsed = parse_liberty_fast(str(library), table_dtype=np.float64)
+    assert (table(reparsed).get_array('values') == array).all()
+
+    text_lib.convert_tables()
+    assert str(text_lib) == str(library)
+
+    table(library).set_array('values', array * 2)
+    assert isinstance(table(library)['values'], np.ndarray)
+    assert (table(library).get_array('values') == array * 2).all()